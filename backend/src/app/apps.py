@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class AppConfig(AppConfig):
@@ -7,3 +8,6 @@ class AppConfig(AppConfig):
 
     def ready(self) -> None:
         import app.signals
+        from app.messagesearch import createSearchIndex
+
+        post_migrate.connect(createSearchIndex, sender=self)
@@ -0,0 +1,177 @@
+"""
+@file benchmarks.py
+@brief Shared helpers for the benchmark management commands.
+@details This file contains the utilities used by the `bench_*` management commands:
+         a throwaway benchmark database, latency percentiles, and fast seeding of
+         users, chats and messages. Benchmarks never touch the configured database.
+"""
+
+import math
+import time
+from contextlib import contextmanager
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.utils import timezone
+from datetime import timedelta
+from .models import Chat, ChatMessage, IntrestRequest, ReadPosition
+from .search import indexUsers
+from .inbox import recordLastMessages, recordUnread
+
+User = get_user_model()
+
+
+@contextmanager
+def benchmark_database():
+    """
+    @brief Runs the enclosed block against a freshly created test database.
+    @details Uses the same machinery as `manage.py test`, so for SQLite the database
+             lives in memory and is dropped when the block exits.
+    """
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def percentiles(samples, points=(50, 95, 99)):
+    """
+    @brief Summarizes latency samples.
+    @param samples Durations in seconds.
+    @param points The percentiles to report.
+    @return dict `p50`/`p95`/`p99` (and `mean`, `max`) in milliseconds.
+    """
+    if not samples:
+        return {f"p{point}": None for point in points}
+    ordered = sorted(samples)
+    summary = {}
+    for point in points:
+        index = min(len(ordered) - 1, max(0, math.ceil(point / 100 * len(ordered)) - 1))
+        summary[f"p{point}"] = round(ordered[index] * 1000, 3)
+    summary["mean"] = round(sum(ordered) / len(ordered) * 1000, 3)
+    summary["max"] = round(ordered[-1] * 1000, 3)
+    return summary
+
+
+class Timer:
+    """
+    @brief Context manager measuring the wall-clock time of a block.
+    """
+
+    def __enter__(self):
+        """
+        @brief Starts the timer.
+        """
+        self.start = time.perf_counter()
+        self.elapsed = None
+        return self
+
+    def __exit__(self, *exc):
+        """
+        @brief Stops the timer.
+        """
+        self.elapsed = time.perf_counter() - self.start
+        return False
+
+
+def seed_users(count, prefix="bench"):
+    """
+    @brief Bulk-creates users with unusable passwords, and their search terms.
+    @param count The number of users to create.
+    @param prefix The username prefix; usernames are `<prefix><n>`.
+    @return list The created users, in creation order.
+    """
+    User.objects.bulk_create(
+        [
+            User(
+                username=f"{prefix}{index}",
+                email=f"{prefix}{index}@example.com",
+                first_name=f"First{index}",
+                last_name=f"Last{index}",
+                password="!",
+            )
+            for index in range(count)
+        ],
+        batch_size=1000,
+    )
+    users = list(User.objects.filter(username__startswith=prefix).order_by("pk"))
+    indexUsers(users)
+    return users
+
+
+def seed_chats(users, count):
+    """
+    @brief Creates chats between neighbouring users, as accepted requests would.
+    @details Also creates both participants' read positions, as the chat save signal does.
+    @param users The users to pair up; chat n is between users n and n + 1.
+    @param count The number of chats to create.
+    @return list The created chats, in creation order.
+    """
+    chats = [
+        Chat(initiator=users[index % len(users)], acceptor=users[(index + 1) % len(users)])
+        for index in range(count)
+    ]
+    Chat.objects.bulk_create(chats, batch_size=1000)
+    chats = list(Chat.objects.order_by("pk"))
+    ReadPosition.objects.bulk_create([
+        ReadPosition(user_id=user_id, chat=chat)
+        for chat in chats for user_id in (chat.initiator_id, chat.acceptor_id)
+    ], batch_size=1000, ignore_conflicts=True)
+    return chats
+
+
+def seed_messages(chats, per_chat, text=None):
+    """
+    @brief Creates messages in every chat, alternating between both participants.
+    @details Also records each chat's last message, as the message write paths do, and
+             counts it as unread for the participant who did not send it.
+    @param chats The chats to fill.
+    @param per_chat The number of messages per chat.
+    @param text Optional callable `(chat, index) -> str` producing the message texts.
+    @return int The number of messages created.
+    """
+    start = timezone.now() - timedelta(seconds=per_chat)
+    batch = []
+    latest = []
+    created = 0
+    for chat in chats:
+        for index in range(per_chat):
+            batch.append(ChatMessage(
+                chat=chat,
+                sender_id=chat.initiator_id if index % 2 == 0 else chat.acceptor_id,
+                text=text(chat, index) if text else f"message {index} in chat {chat.pk}",
+                created_at=start + timedelta(seconds=index),
+            ))
+            if len(batch) >= 5000:
+                ChatMessage.objects.bulk_create(batch)
+                latest.append(batch[-1])
+                created += len(batch)
+                batch = []
+        if batch:
+            latest.append(batch[-1])
+    ChatMessage.objects.bulk_create(batch)
+    recordLastMessages(latest)
+    recordUnread(latest)
+    return created + len(batch)
+
+
+def seed_requests(users, per_user, status="pending"):
+    """
+    @brief Creates interest requests from every user to the following users.
+    @param users The users sending and receiving requests.
+    @param per_user The number of requests each user sends.
+    @param status The status of the created requests.
+    @return int The number of requests created.
+    """
+    requests = [
+        IntrestRequest(
+            request_from=user,
+            request_to=users[(index + offset) % len(users)],
+            status=status,
+        )
+        for index, user in enumerate(users)
+        for offset in range(1, per_user + 1)
+    ]
+    IntrestRequest.objects.bulk_create(requests, batch_size=1000)
+    return len(requests)
@@ -0,0 +1,256 @@
+"""
+@file chatcache.py
+@brief Cache of chat metadata keyed by the chat's short_id.
+@details This file contains the ChatMetaCache, a size-bounded in-process LRU cache,
+         optionally backed by Redis, that maps a chat's short_id to its primary key and
+         participant ids. The socket handlers and MessageView use it instead of querying
+         the Chat table, and the Chat post_save/post_delete signals invalidate it.
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from django.conf import settings
+from .models import Chat
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+ChatMeta = namedtuple("ChatMeta", ["pk", "short_id", "initiator_id", "acceptor_id"])
+"""
+@brief The cached metadata of a chat.
+@details Holds the chat's primary key, its short_id and the ids of both participants.
+"""
+
+
+class ChatMetaCache:
+    """
+    @brief Size-bounded LRU cache of ChatMeta entries with an optional Redis tier.
+    @details Lookups check the local LRU first, then Redis (when configured), then the
+             database. Local entries expire after `ttl` seconds so deletions made by other
+             processes are picked up even without a shared Redis tier.
+    """
+
+    def __init__(self, max_size=10000, ttl=300, redis_url=None, prefix="chatmeta:"):
+        """
+        @brief Initializes the cache.
+        @param max_size The largest number of chats kept in the local LRU.
+        @param ttl The lifetime in seconds of local and Redis entries.
+        @param redis_url The URL of the shared Redis tier, or None to use only the local LRU.
+        @param prefix The prefix of the Redis keys.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.prefix = prefix
+        self.redis = None
+        self.aredis = None
+        if redis_url:
+            import redis
+            import redis.asyncio
+            self.redis = redis.Redis.from_url(redis_url)
+            self.aredis = redis.asyncio.Redis.from_url(redis_url)
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        """
+        @brief Builds the cache from the CHAT_META_CACHE setting.
+        @return ChatMetaCache The configured cache.
+        """
+        options = getattr(settings, "CHAT_META_CACHE", {})
+        return cls(
+            max_size=options.get("MAX_SIZE", 10000),
+            ttl=options.get("TTL", 300),
+            redis_url=options.get("REDIS_URL"),
+        )
+
+    def _get_local(self, short_id):
+        """
+        @brief Looks a chat up in the local LRU and marks it as recently used.
+        @param short_id The chat's short_id.
+        @return ChatMeta The cached entry, or None if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(short_id)
+            if entry is None:
+                return None
+            meta, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[short_id]
+                return None
+            self._entries.move_to_end(short_id)
+            self.hits += 1
+            return meta
+
+    def _set_local(self, meta):
+        """
+        @brief Stores an entry in the local LRU, evicting the least recently used ones.
+        @param meta The ChatMeta to store.
+        """
+        with self._lock:
+            self._entries[meta.short_id] = (meta, time.monotonic() + self.ttl)
+            self._entries.move_to_end(meta.short_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _from_redis(self, raw):
+        """
+        @brief Turns a value read from the Redis tier into a ChatMeta and fills the local LRU.
+        @param raw The raw Redis value.
+        @return ChatMeta The chat's metadata.
+        """
+        meta = ChatMeta(*json.loads(raw))
+        self._set_local(meta)
+        with self._lock:
+            self.redis_hits += 1
+        return meta
+
+    def _from_row(self, row):
+        """
+        @brief Turns a database row into a ChatMeta and fills the local LRU.
+        @param row The (pk, short_id, initiator_id, acceptor_id) row, or None.
+        @return ChatMeta The chat's metadata, or None if the chat does not exist.
+        """
+        if row is None:
+            return None
+        meta = ChatMeta(*row)
+        self._set_local(meta)
+        return meta
+
+    def _query(self, short_id):
+        """
+        @brief Builds the database query for a chat's metadata and counts the miss.
+        @param short_id The chat's short_id.
+        @return QuerySet The query returning the chat's metadata row.
+        """
+        with self._lock:
+            self.misses += 1
+        return (
+            Chat.objects.filter(short_id=short_id)
+            .values_list("pk", "short_id", "initiator_id", "acceptor_id")
+        )
+
+    def _load(self, short_id):
+        """
+        @brief Loads a chat from Redis or the database and fills the local LRU.
+        @param short_id The chat's short_id.
+        @return ChatMeta The chat's metadata, or None if the chat does not exist.
+        """
+        if self.redis is not None:
+            try:
+                raw = self.redis.get(self.prefix + short_id)
+            except Exception:
+                logger.exception("chat cache redis read failed")
+                raw = None
+            if raw is not None:
+                return self._from_redis(raw)
+
+        meta = self._from_row(self._query(short_id).first())
+        if meta is not None and self.redis is not None:
+            try:
+                self.redis.set(self.prefix + short_id, json.dumps(list(meta)), ex=self.ttl)
+            except Exception:
+                logger.exception("chat cache redis write failed")
+        return meta
+
+    async def _aload(self, short_id):
+        """
+        @brief Async variant of _load() using the async Redis client and the async ORM.
+        @param short_id The chat's short_id.
+        @return ChatMeta The chat's metadata, or None if the chat does not exist.
+        """
+        if self.aredis is not None:
+            try:
+                raw = await self.aredis.get(self.prefix + short_id)
+            except Exception:
+                logger.exception("chat cache redis read failed")
+                raw = None
+            if raw is not None:
+                return self._from_redis(raw)
+
+        meta = self._from_row(await self._query(short_id).afirst())
+        if meta is not None and self.aredis is not None:
+            try:
+                await self.aredis.set(self.prefix + short_id, json.dumps(list(meta)), ex=self.ttl)
+            except Exception:
+                logger.exception("chat cache redis write failed")
+        return meta
+
+    def get(self, short_id):
+        """
+        @brief Returns the metadata of a chat.
+        @param short_id The chat's short_id.
+        @return ChatMeta The chat's metadata, or None if the chat does not exist.
+        """
+        short_id = str(short_id)
+        meta = self._get_local(short_id)
+        if meta is not None:
+            return meta
+        return self._load(short_id)
+
+    async def aget(self, short_id):
+        """
+        @brief Async variant of get().
+        @details Local hits are answered without any I/O; misses use the async Redis
+                 client and the native async ORM.
+        @param short_id The chat's short_id.
+        @return ChatMeta The chat's metadata, or None if the chat does not exist.
+        """
+        short_id = str(short_id)
+        meta = self._get_local(short_id)
+        if meta is not None:
+            return meta
+        return await self._aload(short_id)
+
+    def invalidate(self, short_id):
+        """
+        @brief Removes a chat from the local LRU and the Redis tier.
+        @param short_id The chat's short_id.
+        """
+        short_id = str(short_id)
+        with self._lock:
+            self._entries.pop(short_id, None)
+        if self.redis is not None:
+            try:
+                self.redis.delete(self.prefix + short_id)
+            except Exception:
+                logger.exception("chat cache redis delete failed")
+
+    def clear(self):
+        """
+        @brief Empties the local LRU.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        @brief Returns the cache's counters.
+        @return dict The hit, miss and eviction counters and the current size.
+        """
+        with self._lock:
+            lookups = self.hits + self.redis_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "redis_hits": self.redis_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": (self.hits + self.redis_hits) / lookups if lookups else None,
+            }
+
+
+"""
+@brief The process-wide chat metadata cache.
+"""
+chat_cache = ChatMetaCache.from_settings()
+metrics.register("chat_cache", chat_cache.stats)
@@ -0,0 +1,117 @@
+"""
+@file fastserializers.py
+@brief Read-only fast path for the list serializers.
+@details This file contains functions that build the response dicts of MessageSerializer,
+         ChatSerializer and IntrestRequestSerializer straight from `.values()` rows, with a
+         fixed field layout, instead of instantiating serializers and walking their fields
+         for every row. Each `*_VALUES` tuple lists the columns to select and each
+         `*FromValues` function turns one such row into the serializer's output shape.
+         The tests check both paths against each other; keep them in step when a
+         serializer's fields change.
+"""
+
+from django.utils import timezone
+
+PROFILE_FIELDS = ("username", "email", "first_name", "last_name")
+""" @brief The readable fields of userSerializer, in output order. """
+
+
+def profileValues(relation):
+    """
+    @brief Lists the `.values()` columns of a related user's profile.
+    @param relation The name of the foreign key to the user, e.g. "sender".
+    @return tuple The column names.
+    """
+    return tuple(f"{relation}__{field}" for field in PROFILE_FIELDS)
+
+
+def profileFromValues(row, relation):
+    """
+    @brief Builds a related user's profile as userSerializer would.
+    @param row The `.values()` row.
+    @param relation The name of the foreign key to the user.
+    @return dict The serialized profile.
+    """
+    return {field: row[f"{relation}__{field}"] for field in PROFILE_FIELDS}
+
+
+def formatDatetime(value, tz):
+    """
+    @brief Formats a datetime as DRF's DateTimeField does with the default ISO 8601 format.
+    @param value The aware datetime, or None.
+    @param tz The timezone to render in.
+    @return str The ISO 8601 string, with `Z` for UTC, or None.
+    """
+    if value is None:
+        return None
+    text = value.astimezone(tz).isoformat()
+    if text.endswith("+00:00"):
+        text = text[:-6] + "Z"
+    return text
+
+
+MESSAGE_VALUES = ("id", "text", "created_at") + profileValues("sender")
+""" @brief The columns selected for messageFromValues(). """
+
+
+def messageFromValues(row, tz):
+    """
+    @brief Builds the MessageSerializer output of a message.
+    @param row The `.values(*MESSAGE_VALUES)` row.
+    @param tz The timezone to render datetimes in.
+    @return dict The serialized message.
+    """
+    return {
+        "id": row["id"],
+        "sender": profileFromValues(row, "sender"),
+        "text": row["text"],
+        "created_at": formatDatetime(row["created_at"], tz),
+    }
+
+
+CHAT_VALUES = ("short_id",) + profileValues("initiator") + profileValues("acceptor")
+""" @brief The columns selected for chatFromValues(). """
+
+
+def chatFromValues(row, tz=None):
+    """
+    @brief Builds the ChatSerializer output of a chat.
+    @param row The `.values(*CHAT_VALUES)` row.
+    @param tz Unused; accepted so every `*FromValues` function has the same signature.
+    @return dict The serialized chat.
+    """
+    return {
+        "short_id": str(row["short_id"]),
+        "initiator": profileFromValues(row, "initiator"),
+        "acceptor": profileFromValues(row, "acceptor"),
+    }
+
+
+INTREST_REQUEST_VALUES = ("id", "status") + profileValues("request_from") + profileValues("request_to")
+""" @brief The columns selected for intrestRequestFromValues(). """
+
+
+def intrestRequestFromValues(row, tz=None):
+    """
+    @brief Builds the IntrestRequestSerializer output of an interest request.
+    @param row The `.values(*INTREST_REQUEST_VALUES)` row.
+    @param tz Unused; accepted so every `*FromValues` function has the same signature.
+    @return dict The serialized interest request.
+    """
+    return {
+        "id": row["id"],
+        "request_from": profileFromValues(row, "request_from"),
+        "request_to": profileFromValues(row, "request_to"),
+        "status": row["status"],
+    }
+
+
+def serializeValues(rows, builder):
+    """
+    @brief Serializes `.values()` rows with one of the `*FromValues` functions.
+    @param rows The rows, e.g. a page of a `.values()` queryset.
+    @param builder The function building one row's output.
+    @return list The serialized rows.
+    """
+    tz = timezone.get_current_timezone()
+    return [builder(row, tz) for row in rows]
@@ -0,0 +1,227 @@
+"""
+@file inbox.py
+@brief Inbox queries and upkeep of the denormalized last-message columns on Chat.
+@details This file contains the helpers that keep `Chat.last_message`,
+         `Chat.last_activity_at` and the unread counts of the read positions up to date
+         from the message write paths, and the queryset behind the inbox mode of
+         ChatsView, which lists a user's chats with their last message and unread count
+         in a single query.
+"""
+
+from datetime import datetime, timezone as dt_timezone
+from django.db.models import Count, F, FilteredRelation, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from .models import Chat, ChatMessage, IntrestRequest, ReadPosition
+
+BEFORE_MESSAGES = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+""" @brief A time before every message, for users who have not sent any. """
+
+
+def latestPerChat(messages):
+    """
+    @brief Picks the newest message of each chat from a batch of messages.
+    @param messages The saved messages, in any order.
+    @return dict A mapping from chat id to its newest message in the batch.
+    """
+    latest = {}
+    for message in messages:
+        current = latest.get(message.chat_id)
+        if current is None or (message.created_at, message.id) > (current.created_at, current.id):
+            latest[message.chat_id] = message
+    return latest
+
+
+def lastMessageUpdate(message):
+    """
+    @brief Builds the update of a chat's last-message columns for a new message.
+    @details The update only applies if the message is not older than the chat's current
+             last activity, so batches written out of order never move it backwards.
+    @param message The saved message.
+    @return tuple The filtered Chat queryset and the update keyword arguments.
+    """
+    queryset = Chat.objects.filter(pk=message.chat_id, last_activity_at__lte=message.created_at)
+    return queryset, {"last_message_id": message.id, "last_activity_at": message.created_at}
+
+
+def recordLastMessages(messages):
+    """
+    @brief Updates `last_message`/`last_activity_at` of the chats the messages belong to.
+    @details Costs one UPDATE per distinct chat in the batch.
+    @param messages The saved messages.
+    """
+    for message in latestPerChat(messages).values():
+        queryset, values = lastMessageUpdate(message)
+        queryset.update(**values)
+
+
+async def arecordLastMessages(messages):
+    """
+    @brief Async variant of recordLastMessages(), used by the write-behind flusher.
+    @param messages The saved messages.
+    """
+    for message in latestPerChat(messages).values():
+        queryset, values = lastMessageUpdate(message)
+        await queryset.aupdate(**values)
+
+
+def unreadUpdates(messages):
+    """
+    @brief Builds the updates of the read positions for a batch of new messages.
+    @details Per chat, participants who sent none of the messages get the batch's message
+             count added; a sender's count is set to the messages of others after their
+             own newest message in the batch, and their read position moves to it.
+    @param messages The saved messages.
+    @return list The `(queryset, values)` updates, one per chat and one per sender.
+    """
+    chats = {}
+    for message in messages:
+        chats.setdefault(message.chat_id, []).append(message)
+
+    updates = []
+    for chat_id, batch in chats.items():
+        batch.sort(key=lambda message: (message.created_at, message.id))
+        own = {}
+        for index, message in enumerate(batch):
+            own[message.sender_id] = index
+        positions = ReadPosition.objects.filter(chat_id=chat_id)
+        updates.append((
+            positions.exclude(user_id__in=own),
+            {"unread_count": F("unread_count") + len(batch)},
+        ))
+        for sender_id, index in own.items():
+            updates.append((
+                positions.filter(user_id=sender_id),
+                {
+                    "last_read_message_id": batch[index].id,
+                    "unread_count": sum(1 for message in batch[index + 1:] if message.sender_id != sender_id),
+                },
+            ))
+    return updates
+
+
+def recordUnread(messages):
+    """
+    @brief Updates the unread counts and read positions of the chats the messages belong to.
+    @details Costs one UPDATE per distinct chat and sender in the batch.
+    @param messages The saved messages.
+    """
+    for queryset, values in unreadUpdates(messages):
+        queryset.update(**values)
+
+
+async def arecordUnread(messages):
+    """
+    @brief Async variant of recordUnread(), used by the write-behind flusher.
+    @param messages The saved messages.
+    """
+    for queryset, values in unreadUpdates(messages):
+        await queryset.aupdate(**values)
+
+
+def createReadPositions(chats):
+    """
+    @brief Creates the read positions of both participants of new chats, in one query.
+    @param chats The saved chats.
+    """
+    ReadPosition.objects.bulk_create([
+        ReadPosition(user_id=user_id, chat=chat)
+        for chat in chats for user_id in (chat.initiator_id, chat.acceptor_id)
+    ], ignore_conflicts=True)
+
+
+def backfillLastMessages(chat_ids):
+    """
+    @brief Fills in `last_message`/`last_activity_at` of chats older than the columns.
+    @details Chats that have no last message get their newest message by
+             (created_at, id) and its time. Chats keep no creation time, so those without
+             messages take the time of the newest accepted interest request between their
+             participants, and keep their current time if there is none. Chats that
+             already have a last message are left alone, so running it twice is harmless.
+             Costs one query.
+    @param chat_ids The primary keys of the chats.
+    @return int The number of chats updated.
+    """
+    newest = ChatMessage.objects.filter(chat_id=OuterRef("pk")).order_by("-created_at", "-id")
+    accepted = (
+        IntrestRequest.objects.filter(status="accept")
+        .filter(
+            Q(request_from=OuterRef("initiator"), request_to=OuterRef("acceptor"))
+            | Q(request_from=OuterRef("acceptor"), request_to=OuterRef("initiator"))
+        )
+        .order_by("-dt")
+    )
+    return Chat.objects.filter(pk__in=chat_ids, last_message__isnull=True).update(
+        last_message_id=Subquery(newest.values("id")[:1]),
+        last_activity_at=Coalesce(
+            Subquery(newest.values("created_at")[:1]), Subquery(accepted.values("dt")[:1]), F("last_activity_at")
+        ),
+    )
+
+
+def backfillReadPositions(chat_ids):
+    """
+    @brief Creates the missing read positions of chats and counts their unread messages.
+    @details For chats older than read tracking. Positions that were never moved, i.e.
+             created and those of users who have neither sent nor read anything, start at
+             the user's own newest message in the chat and count the messages of the other
+             participant after it, as the inbox did before read positions were kept. Other
+             positions are left alone, so running it twice is harmless. Costs three queries.
+    @param chat_ids The primary keys of the chats.
+    @return int The number of positions counted.
+    """
+    ReadPosition.objects.bulk_create([
+        ReadPosition(user_id=user_id, chat_id=chat_pk)
+        for chat_pk, initiator_id, acceptor_id in Chat.objects.filter(pk__in=chat_ids)
+        .values_list("pk", "initiator_id", "acceptor_id")
+        for user_id in (initiator_id, acceptor_id)
+    ], ignore_conflicts=True)
+
+    def own(outer):
+        return (
+            ChatMessage.objects.filter(chat_id=outer("chat_id"), sender_id=outer("user_id"))
+            .order_by("-created_at", "-id")
+        )
+
+    nested = lambda name: OuterRef(OuterRef(name))
+    own_id = Coalesce(Subquery(own(nested).values("id")[:1]), 0)
+    own_at = Coalesce(Subquery(own(nested).values("created_at")[:1]), Value(BEFORE_MESSAGES))
+    unread = (
+        ChatMessage.objects.filter(chat_id=OuterRef("chat_id")).exclude(sender_id=OuterRef("user_id"))
+        .filter(Q(created_at__gt=own_at) | Q(created_at=own_at, pk__gt=own_id))
+        .order_by().values("chat").annotate(count=Count("pk")).values("count")
+    )
+    return ReadPosition.objects.filter(chat_id__in=chat_ids, last_read_message_id__isnull=True).update(
+        last_read_message_id=Subquery(own(OuterRef).values("id")[:1]),
+        unread_count=Coalesce(Subquery(unread, output_field=IntegerField()), 0),
+    )
+
+
+def unreadCounts(user):
+    """
+    @brief Reads the unread counts of all of a user's chats.
+    @details One query; chats without a read position count as read.
+    @param user The user whose counts are read.
+    @return dict A mapping from each chat's short_id to its unread count.
+    """
+    return dict(
+        Chat.objects.filter(Q(initiator=user) | Q(acceptor=user))
+        .annotate(position=FilteredRelation("read_positions", condition=Q(read_positions__user=user)))
+        .values_list("short_id", Coalesce(F("position__unread_count"), 0))
+    )
+
+
+def inboxQueryset(user):
+    """
+    @brief Builds the inbox of a user: their chats with previews and unread counts.
+    @details The participants, the last message with its sender and the user's read
+             position are joined in, so a page of the inbox is one query however many
+             chats the user has. Chats without a read position count as read.
+    @param user The user whose inbox is listed.
+    @return QuerySet The user's chats, annotated with `unread_count`.
+    """
+    return (
+        Chat.objects.filter(Q(initiator=user) | Q(acceptor=user))
+        .select_related("initiator", "acceptor", "last_message__sender")
+        .annotate(position=FilteredRelation("read_positions", condition=Q(read_positions__user=user)))
+        .annotate(unread_count=Coalesce(F("position__unread_count"), 0))
+    )
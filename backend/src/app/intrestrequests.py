@@ -0,0 +1,143 @@
+"""
+@file intrestrequests.py
+@brief Bulk sending and answering of interest requests.
+@details This file contains the helpers behind IntrestRequestBulkView. Sending to many
+         usernames and answering many requests each run a fixed number of queries,
+         whatever the number of items: rows are written with `bulk_create` and
+         `bulk_update`, and the side effects of accepted requests that the single-row
+         `addFriend` signal applies one request at a time (a chat between both users
+         and the friendship) are applied in one batched pass. Every item gets its own
+         result.
+"""
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from .models import Chat, IntrestRequest
+from .inbox import createReadPositions
+
+User = get_user_model()
+
+STATUSES = {value for value, _ in IntrestRequest.STATUS_CHOICES} - {"pending"}
+""" @brief The statuses a request can be answered with. """
+
+
+def unique(items):
+    """
+    @brief Drops repeated items, keeping the first occurrence of each.
+    @param items The items.
+    @return list The distinct items, in order.
+    """
+    return list(dict.fromkeys(items))
+
+
+def sendRequests(user, usernames):
+    """
+    @brief Sends interest requests from a user to many users.
+    @details Users that are unknown, the sender themself, already friends with the sender
+             or already sent a request by them are skipped. Costs three reads and one
+             INSERT, which SQLite splits into batches of a few hundred rows; the batches
+             are written in one transaction, so either every request is sent or none is.
+    @param user The sending user.
+    @param usernames The usernames to send to.
+    @return list One `{"username", "result", "request_id"}` dict per distinct username,
+                 where result is "sent", "not_found", "invalid", "already_sent" or
+                 "already_friends".
+    """
+    usernames = unique(usernames)
+    targets = dict(User.objects.filter(username__in=usernames).values_list("username", "pk"))
+    sent = set(
+        IntrestRequest.objects.filter(request_from=user, request_to__in=targets.values())
+        .values_list("request_to_id", flat=True)
+    )
+    friends = set(
+        User.friends.through.objects.filter(from_customuser=user, to_customuser__in=targets.values())
+        .values_list("to_customuser_id", flat=True)
+    )
+
+    results = []
+    created = []
+    for username in usernames:
+        target = targets.get(username)
+        if target is None:
+            result = "not_found"
+        elif target == user.pk:
+            result = "invalid"
+        elif target in sent:
+            result = "already_sent"
+        elif target in friends:
+            result = "already_friends"
+        else:
+            result = "sent"
+            created.append(IntrestRequest(request_from=user, request_to_id=target))
+        results.append({"username": username, "result": result, "request_id": None})
+
+    with transaction.atomic():
+        IntrestRequest.objects.bulk_create(created)
+    requests = iter(created)
+    for item in results:
+        if item["result"] == "sent":
+            item["request_id"] = next(requests).pk
+    return results
+
+
+def acceptRequests(requests):
+    """
+    @brief Applies the side effects of accepted requests in one pass.
+    @details Creates a chat between the sender and the receiver of every request, with
+             its read positions, and makes both users friends, as `addFriend` does for a
+             single request. Costs three INSERTs.
+    @param requests The accepted IntrestRequest instances.
+    @return list The created chats.
+    """
+    if not requests:
+        return []
+    chats = Chat.objects.bulk_create([
+        Chat(initiator_id=request.request_from_id, acceptor_id=request.request_to_id) for request in requests
+    ])
+    createReadPositions(chats)
+
+    Friendship = User.friends.through
+    pairs = {(request.request_from_id, request.request_to_id) for request in requests}
+    pairs |= {(to_id, from_id) for from_id, to_id in pairs}
+    Friendship.objects.bulk_create([
+        Friendship(from_customuser_id=from_id, to_customuser_id=to_id) for from_id, to_id in sorted(pairs)
+    ], ignore_conflicts=True)
+    return chats
+
+
+def answerRequests(user, answers):
+    """
+    @brief Accepts or rejects many of the pending requests sent to a user, atomically.
+    @details Requests that do not exist or were not sent to the user are "not_found";
+             requests that were already answered are "not_pending". Costs one query to
+             read the requests, one `bulk_update` and the side effects of the accepted
+             ones, all in one transaction.
+    @param user The receiving user.
+    @param answers The `(request_id, status)` pairs, status being "accept" or "reject".
+    @return list One `{"request_id", "result"}` dict per distinct request id, where
+                 result is the new status, "not_found" or "not_pending".
+    """
+    first = {}
+    for request_id, answer in answers:
+        first.setdefault(request_id, answer)
+    with transaction.atomic():
+        requests = {
+            request.pk: request
+            for request in IntrestRequest.objects.select_for_update().filter(request_to=user, pk__in=first)
+        }
+        results = []
+        updated = []
+        for request_id, answer in first.items():
+            request = requests.get(request_id)
+            if request is None:
+                result = "not_found"
+            elif request.status != "pending":
+                result = "not_pending"
+            else:
+                request.status = result = answer
+                updated.append(request)
+            results.append({"request_id": request_id, "result": result})
+
+        IntrestRequest.objects.bulk_update(updated, ["status"])
+        acceptRequests([request for request in updated if request.status == "accept"])
+    return results
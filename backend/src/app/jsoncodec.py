@@ -0,0 +1,67 @@
+"""
+@file jsoncodec.py
+@brief Fast JSON encoding and decoding for REST and Socket.IO payloads.
+@details This file contains the JSON codec used by FastJSONRenderer, FastJSONParser and
+         the Socket.IO server. It uses orjson when it is installed and falls back to the
+         standard library otherwise. Both paths encode UUIDs and datetimes natively and
+         hand every other type to DRF's JSONEncoder, so lazy translations, decimals and
+         querysets are encoded as the stock renderer does. orjson keeps the microseconds
+         of raw datetimes, where the stdlib path truncates them to milliseconds.
+"""
+
+import json
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+_encoder = JSONEncoder()
+
+OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS if orjson else 0
+""" @brief The orjson options: `Z` for UTC datetimes and non-string dict keys allowed. """
+
+
+def backend():
+    """
+    @brief Names the JSON implementation in use.
+    @return str "orjson" or "json".
+    """
+    return "orjson" if orjson else "json"
+
+
+def dumpb(obj):
+    """
+    @brief Encodes an object into compact UTF-8 JSON.
+    @param obj The object to encode.
+    @return bytes The encoded JSON.
+    """
+    if orjson:
+        return orjson.dumps(obj, default=_encoder.default, option=OPTIONS)
+    return json.dumps(obj, cls=JSONEncoder, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def dumps(obj, **kwargs):
+    """
+    @brief Encodes an object into a compact JSON string.
+    @details Takes and ignores the keyword arguments of `json.dumps`, so the module can be
+             passed as the `json` module of `socketio.AsyncServer`.
+    @param obj The object to encode.
+    @param kwargs Ignored `json.dumps` options, such as `separators`.
+    @return str The encoded JSON.
+    """
+    return dumpb(obj).decode()
+
+
+def loads(data, **kwargs):
+    """
+    @brief Decodes a JSON document.
+    @param data The JSON document, as str or bytes.
+    @param kwargs Ignored `json.loads` options.
+    @return The decoded object.
+    @throws ValueError if the document is not valid JSON.
+    """
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
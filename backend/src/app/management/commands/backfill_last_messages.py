@@ -0,0 +1,40 @@
+"""
+@file backfill_last_messages.py
+@brief Fills in the last-message columns of chats older than them.
+@details `Chat.last_message` and `Chat.last_activity_at` are kept up to date by the
+         message write paths; run this command once after deploying them, so chats
+         created before show their last message and sort by their real activity in the
+         inbox instead of by the time of the migration.
+
+         Usage: `python manage.py backfill_last_messages [--batch-size N]`
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from app.inbox import backfillLastMessages
+from app.models import Chat
+
+
+class Command(BaseCommand):
+    """
+    @brief Management command backfilling `last_message`/`last_activity_at` of every chat.
+    """
+    help = "Set the last message and last activity time of chats that have none."
+
+    def add_arguments(self, parser):
+        """
+        @brief Adds the command's options.
+        @param parser The argument parser.
+        """
+        parser.add_argument("--batch-size", type=int, default=1000, help="Chats per transaction.")
+
+    def handle(self, *args, **options):
+        """
+        @brief Backfills the chats in batches of primary keys.
+        """
+        chat_ids = list(Chat.objects.filter(last_message__isnull=True).order_by("pk").values_list("pk", flat=True))
+        updated = 0
+        for start in range(0, len(chat_ids), options["batch_size"]):
+            with transaction.atomic():
+                updated += backfillLastMessages(chat_ids[start:start + options["batch_size"]])
+        self.stdout.write(f"Updated {updated} of {len(chat_ids)} chats without a last message.")
@@ -0,0 +1,39 @@
+"""
+@file backfill_read_positions.py
+@brief Creates the read positions of chats older than read tracking.
+@details Read positions are created with new chats and kept up to date by the message
+         write paths; run this command once after deploying them, so chats created
+         before report their unread messages instead of none.
+
+         Usage: `python manage.py backfill_read_positions [--batch-size N]`
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from app.inbox import backfillReadPositions
+from app.models import Chat
+
+
+class Command(BaseCommand):
+    """
+    @brief Management command backfilling the ReadPosition rows of every chat.
+    """
+    help = "Create missing read positions and count their unread messages."
+
+    def add_arguments(self, parser):
+        """
+        @brief Adds the command's options.
+        @param parser The argument parser.
+        """
+        parser.add_argument("--batch-size", type=int, default=1000, help="Chats per transaction.")
+
+    def handle(self, *args, **options):
+        """
+        @brief Backfills the chats in batches of primary keys.
+        """
+        chat_ids = list(Chat.objects.order_by("pk").values_list("pk", flat=True))
+        counted = 0
+        for start in range(0, len(chat_ids), options["batch_size"]):
+            with transaction.atomic():
+                counted += backfillReadPositions(chat_ids[start:start + options["batch_size"]])
+        self.stdout.write(f"Counted {counted} read positions of {len(chat_ids)} chats.")
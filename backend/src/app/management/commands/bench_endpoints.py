@@ -0,0 +1,221 @@
+"""
+@file bench_endpoints.py
+@brief Latency and query count benchmark of every HTTP endpoint.
+@details Seeds a throwaway database with configurable volumes of users, interest
+         requests, chats and messages, then calls every route of `app/urls.py` and
+         `authentication/urls.py` through the test client, authenticated with a real
+         access token. Each endpoint reports its p50/p95/p99 latency and the number of
+         queries it ran. The report can be written as JSON and compared with a baseline
+         report: an endpoint regresses when it runs more queries than in the baseline or
+         its p95 grows beyond the tolerance. Latencies are only comparable between runs
+         on the same machine; query counts are comparable everywhere.
+
+         Usage: `python manage.py bench_endpoints [--users 1000] [--repeat 50] [--json out.json]
+         [--baseline ../benchmarks/endpoints.json] [--tolerance 0.25] [--check]`
+"""
+
+import json
+import platform
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from app.benchmarks import Timer, benchmark_database, percentiles, seed_chats, seed_messages, seed_requests, seed_users
+from app.models import IntrestRequest
+from authentication.tokens import VersionedRefreshToken
+
+
+ENDPOINTS = (
+    ("index", "GET", ""),
+    ("request_list", "GET", "request"),
+    ("request_create", "POST", "request"),
+    ("request_update", "PATCH", "request"),
+    ("request_bulk_create", "POST", "request/bulk"),
+    ("request_bulk_update", "PATCH", "request/bulk"),
+    ("list_users", "GET", "list_users"),
+    ("list_users_search", "GET", "list_users"),
+    ("check_request_sent", "POST", "check_request_sent"),
+    ("chats", "GET", "chats"),
+    ("chats_inbox", "GET", "chats"),
+    ("chats_create", "POST", "chats"),
+    ("messages", "GET", "messages"),
+    ("messages_older", "GET", "messages"),
+    ("message_search", "GET", "messages/search"),
+    ("presence", "GET", "presence"),
+    ("unread", "GET", "unread"),
+    ("metrics", "GET", "metrics"),
+    ("signup", "POST", "signup"),
+    ("login", "POST", "login"),
+    ("username_availability", "POST", "username_availability"),
+    ("get_user", "GET", "get_user"),
+)
+""" @brief The benchmarked calls as (name, method, route); every route is called at least once. """
+
+BULK_SIZE = 10
+""" @brief The number of items in each bulk request call. """
+
+AUTH_ROUTES = {"signup", "login", "username_availability", "get_user"}
+""" @brief The routes served under `/auth/`. """
+
+
+def compareReports(baseline, report, tolerance):
+    """
+    @brief Lists the endpoints that got slower or run more queries than in a baseline.
+    @param baseline The baseline report.
+    @param report The report of this run.
+    @param tolerance The allowed relative growth of the p95 latency, e.g. 0.25.
+    @return list One line per regression.
+    """
+    regressions = []
+    for name, result in report["endpoints"].items():
+        before = baseline["endpoints"].get(name)
+        if before is None:
+            continue
+        if result["queries"] > before["queries"]:
+            regressions.append(f"{name}: {before['queries']} -> {result['queries']} queries")
+        if before["p95"] and result["p95"] > before["p95"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {before['p95']}ms -> {result['p95']}ms")
+    return regressions
+
+
+class Command(BaseCommand):
+    """
+    @brief Management command running the endpoint benchmark.
+    """
+    help = "Measure the latency and query count of every HTTP endpoint."
+
+    def add_arguments(self, parser):
+        """
+        @brief Declares the command line options.
+        """
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--requests", type=int, default=5, help="Interest requests sent per user.")
+        parser.add_argument("--chats", type=int, default=1000)
+        parser.add_argument("--messages", type=int, default=50, help="Messages per chat.")
+        parser.add_argument("--repeat", type=int, default=50)
+        parser.add_argument("--json", help="Write the report to this file.")
+        parser.add_argument("--baseline", help="Compare the report with this baseline report.")
+        parser.add_argument("--tolerance", type=float, default=0.25)
+        parser.add_argument("--check", action="store_true", help="Fail if an endpoint regressed.")
+
+    def handle(self, *args, **options):
+        """
+        @brief Seeds the data, calls every endpoint and reports the results.
+        """
+        repeat = options["repeat"]
+        volumes = {name: options[name] for name in ("users", "requests", "chats", "messages")}
+        endpoints = {}
+        with benchmark_database():
+            users = seed_users(max(2, options["users"]))
+            seed_requests(users, min(options["requests"], len(users) - 1))
+            chats = seed_chats(users, max(1, options["chats"]))
+            seed_messages(chats, max(1, options["messages"]))
+
+            user = users[0]
+            user.is_staff = True
+            user.set_password("bench-password")
+            user.save()
+            chat = chats[0]
+
+            # Fresh pending requests to the benchmarking user, one per PATCH call.
+            senders = users[1:]
+            pending = IntrestRequest.objects.bulk_create([
+                IntrestRequest(request_from=senders[index % len(senders)], request_to=user)
+                for index in range(repeat + 1)
+            ])
+            # And BULK_SIZE of them per bulk PATCH call.
+            bulk_pending = IntrestRequest.objects.bulk_create([
+                IntrestRequest(request_from=senders[index % len(senders)], request_to=user)
+                for index in range((repeat + 1) * BULK_SIZE)
+            ])
+
+            client = APIClient()
+            token = str(VersionedRefreshToken.for_user(user).access_token)
+            client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+            first = client.get("/messages", {"chat_id": chat.short_id}).data
+
+            calls = {
+                "index": lambda index: {},
+                "request_list": lambda index: {},
+                "request_create": lambda index: {"request_to": users[-1 - index % (len(users) - 1)].username},
+                "request_update": lambda index: {"request_id": pending[index].pk, "status": "accept"},
+                "request_bulk_create": lambda index: {"request_to": [
+                    users[1 + (index * BULK_SIZE + offset) % (len(users) - 1)].username for offset in range(BULK_SIZE)
+                ]},
+                "request_bulk_update": lambda index: {"requests": [
+                    {"request_id": request.pk, "status": "accept" if offset % 2 else "reject"}
+                    for offset, request in enumerate(bulk_pending[index * BULK_SIZE:(index + 1) * BULK_SIZE])
+                ]},
+                "list_users": lambda index: {},
+                "list_users_search": lambda index: {"s": "First1"},
+                "check_request_sent": lambda index: {"username": users[1].username},
+                "chats": lambda index: {},
+                "chats_inbox": lambda index: {"inbox": 1},
+                "chats_create": lambda index: {"acceptor": users[1 + index % (len(users) - 1)].username},
+                "messages": lambda index: {"chat_id": chat.short_id},
+                "messages_older": lambda index: {"chat_id": chat.short_id, "before": first.get("before") or ""},
+                "message_search": lambda index: {"q": "message"},
+                "presence": lambda index: {"users": ",".join(other.username for other in users[1:31])},
+                "unread": lambda index: {},
+                "metrics": lambda index: {},
+                "signup": lambda index: {
+                    "username": f"signup{index}", "email": f"signup{index}@example.com",
+                    "password": "bench-password", "first_name": "Sign", "last_name": "Up",
+                },
+                "login": lambda index: {"username": user.username, "password": "bench-password"},
+                "username_availability": lambda index: {"username": f"bench{index}"},
+                "get_user": lambda index: {},
+            }
+
+            for name, method, route in ENDPOINTS:
+                path = ("/auth/" if route in AUTH_ROUTES else "/") + route
+                send = getattr(client, method.lower())
+                samples = []
+                queries = 0
+                status_code = None
+                # The extra first call warms up caches and is not timed.
+                for index in range(repeat + 1):
+                    data = calls[name](index)
+                    with CaptureQueriesContext(connection) as captured:
+                        with Timer() as timer:
+                            response = send(path, data, format="json") if method != "GET" else send(path, data)
+                    status_code = response.status_code
+                    if index:
+                        samples.append(timer.elapsed)
+                        queries = max(queries, len(captured.captured_queries))
+                endpoints[name] = {
+                    "method": method, "path": path, "status": status_code, "queries": queries,
+                    **percentiles(samples),
+                }
+                result = endpoints[name]
+                self.stdout.write(
+                    f"{name:>22} {method:>5} {path:<26} {status_code} queries={queries:<3} "
+                    f"p50={result['p50']}ms p95={result['p95']}ms p99={result['p99']}ms"
+                )
+
+        report = {
+            "environment": {
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "database": connection.vendor,
+            },
+            "volumes": volumes,
+            "repeat": repeat,
+            "endpoints": endpoints,
+        }
+        if options["json"]:
+            with open(options["json"], "w", encoding="utf-8") as out:
+                json.dump(report, out, indent=2, sort_keys=True)
+                out.write("\n")
+
+        if options["baseline"]:
+            with open(options["baseline"], encoding="utf-8") as source:
+                baseline = json.load(source)
+            regressions = compareReports(baseline, report, options["tolerance"])
+            for line in regressions:
+                self.stdout.write(f"regression: {line}")
+            if not regressions:
+                self.stdout.write("no regressions against the baseline")
+            if regressions and options["check"]:
+                raise CommandError(f"{len(regressions)} endpoint regressions")
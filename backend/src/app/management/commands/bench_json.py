@@ -0,0 +1,98 @@
+"""
+@file bench_json.py
+@brief Benchmark of JSON encoding for REST responses and Socket.IO events.
+@details Builds a typical MessageView page and a `message:recieve` event from a throwaway
+         database, then times encoding them with DRF's stock JSONRenderer and the stdlib
+         `json` module against FastJSONRenderer and the fast codec, and reports encode
+         latency percentiles and payload bytes.
+
+         Usage: `python manage.py bench_json [--page 50] [--repeat 2000] [--json out.json]`
+"""
+
+import json
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from socketio import packet
+from app import jsoncodec
+from app.benchmarks import Timer, benchmark_database, percentiles, seed_chats, seed_messages, seed_users
+from app.fastserializers import MESSAGE_VALUES, messageFromValues, serializeValues
+from app.models import ChatMessage
+from app.pagination import KeysetPaginator
+from app.renderers import FastJSONRenderer
+from app.serializers import MessageSerializer
+
+
+def eventEncoder(codec):
+    """
+    @brief Builds a function encoding a Socket.IO event packet with a given json module.
+    @param codec The json module used to encode the packet.
+    @return function Encodes `[event, data]` into the packet string.
+    """
+    def encode(data):
+        event = packet.Packet(packet.EVENT, data=["message:recieve", data])
+        event.json = codec
+        return event.encode()
+    return encode
+
+
+class Command(BaseCommand):
+    """
+    @brief Management command running the JSON encoding benchmark.
+    """
+    help = "Measure encode time and size of MessageView pages and message:recieve events."
+
+    def add_arguments(self, parser):
+        """
+        @brief Declares the command line options.
+        """
+        parser.add_argument("--page", type=int, default=50)
+        parser.add_argument("--repeat", type=int, default=2000)
+        parser.add_argument("--json", help="Write the results to this file.")
+
+    def handle(self, *args, **options):
+        """
+        @brief Builds the payloads and times every encoder on them.
+        """
+        with benchmark_database():
+            users = seed_users(2)
+            chats = seed_chats(users, 1)
+            seed_messages(chats, options["page"] * 2)
+            paginator = KeysetPaginator(("created_at", "id"), from_end=True)
+            rows = list(ChatMessage.objects.values(*MESSAGE_VALUES).order_by("-created_at", "-id")[:options["page"]])
+            page = {
+                "payload": serializeValues(rows, messageFromValues),
+                "before": paginator.encode_cursor(rows[-1]),
+                "after": None,
+                "has_more": True,
+            }
+            event = MessageSerializer(ChatMessage.objects.select_related("sender").first()).data
+
+        payloads = {
+            "message_page": (page, {
+                "stock": JSONRenderer().render,
+                "fast": FastJSONRenderer().render,
+            }),
+            "message_event": (event, {
+                "stock": eventEncoder(json),
+                "fast": eventEncoder(jsoncodec),
+            }),
+        }
+        self.stdout.write(f"Fast codec backend: {jsoncodec.backend()}")
+        results = []
+        for name, (data, encoders) in payloads.items():
+            for encoder_name, encode in encoders.items():
+                samples = []
+                for _ in range(options["repeat"]):
+                    with Timer() as timer:
+                        encoded = encode(data)
+                    samples.append(timer.elapsed)
+                size = len(encoded if isinstance(encoded, bytes) else encoded.encode())
+                result = {"payload": name, "encoder": encoder_name, "bytes": size, **percentiles(samples)}
+                results.append(result)
+                self.stdout.write(
+                    f"{name:>13} {encoder_name:>5} bytes={size:<6} p50={result['p50']}ms p99={result['p99']}ms"
+                )
+
+        if options["json"]:
+            with open(options["json"], "w", encoding="utf-8") as out:
+                json.dump(results, out, indent=2)
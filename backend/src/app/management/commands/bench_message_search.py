@@ -0,0 +1,80 @@
+"""
+@file bench_message_search.py
+@brief Benchmark of the full-text message search behind MessageSearchView.
+@details Seeds a throwaway database with chats full of messages drawn from a fixed
+         vocabulary, then times first pages of searches by one user, from common words
+         to rare ones and prefixes, and reports latency percentiles.
+
+         Usage: `python manage.py bench_message_search [--messages 5000000] [--repeat 50] [--json out.json]`
+"""
+
+import json
+import random
+from django.core.management.base import BaseCommand
+from app.benchmarks import Timer, benchmark_database, percentiles, seed_chats, seed_messages, seed_users
+from app.messagesearch import searchMessages
+
+VOCABULARY = [
+    "hello", "meeting", "tomorrow", "station", "dinner", "project", "deadline", "coffee",
+    "weekend", "train", "invoice", "birthday", "movie", "office", "holiday", "review",
+]
+""" @brief Common words the seeded messages are made of. """
+
+QUERIES = ["hello", "meeting tomorrow", "sta", "zebra", "coffee zebra", "zyx"]
+""" @brief Search strings: common words, several words, a prefix and rare words. """
+
+
+class Command(BaseCommand):
+    """
+    @brief Management command running the message search benchmark.
+    """
+    help = "Measure the latency of full-text searches over a user's chat messages."
+
+    def add_arguments(self, parser):
+        """
+        @brief Declares the command line options.
+        """
+        parser.add_argument("--messages", type=int, default=200000)
+        parser.add_argument("--chats", type=int, default=5000)
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--repeat", type=int, default=50)
+        parser.add_argument("--limit", type=int, default=20)
+        parser.add_argument("--json", help="Write the results to this file.")
+
+    def handle(self, *args, **options):
+        """
+        @brief Seeds the messages and times a first page of results for every query.
+        """
+        rng = random.Random(42)
+
+        def text(chat, index):
+            words = rng.choices(VOCABULARY, k=rng.randint(3, 10))
+            if rng.random() < 0.001:
+                words.append("zebra")
+            return " ".join(words)
+
+        results = []
+        with benchmark_database():
+            with Timer() as seeding:
+                users = seed_users(options["users"])
+                chats = seed_chats(users, options["chats"])
+                created = seed_messages(chats, max(1, options["messages"] // len(chats)), text=text)
+            self.stdout.write(f"Seeded {created} messages in {len(chats)} chats in {seeding.elapsed:.1f}s")
+
+            user = users[0]
+            for query in QUERIES:
+                samples = []
+                for _ in range(options["repeat"]):
+                    with Timer() as timer:
+                        rows = list(searchMessages(user, query).order_by("-match_id")[:options["limit"]])
+                    samples.append(timer.elapsed)
+                result = {"query": query, "rows": len(rows), **percentiles(samples)}
+                results.append(result)
+                self.stdout.write(
+                    f"{query!r:>18} rows={len(rows):<3} p50={result['p50']}ms "
+                    f"p95={result['p95']}ms p99={result['p99']}ms"
+                )
+
+        if options["json"]:
+            with open(options["json"], "w", encoding="utf-8") as out:
+                json.dump(results, out, indent=2)
@@ -0,0 +1,96 @@
+"""
+@file bench_serializers.py
+@brief Benchmark of the serialization cost of the list endpoints.
+@details Seeds a throwaway database, loads pages of messages, chats and interest requests
+         the way MessageView, ChatsView and IntrestRequestView do, and times serializing
+         them with the profile cache disabled, cold and warm, and with the `.values()` fast
+         path of fastserializers.py. Reports the time per 10,000 rows and the rows per
+         second; loading the rows is not timed.
+
+         Usage: `python manage.py bench_serializers [--rows 10000] [--repeat 5] [--json out.json]`
+"""
+
+import json
+from django.core.management.base import BaseCommand
+from app.benchmarks import Timer, benchmark_database, percentiles, seed_chats, seed_messages, seed_requests, seed_users
+from app.fastserializers import (
+    CHAT_VALUES, INTREST_REQUEST_VALUES, MESSAGE_VALUES,
+    chatFromValues, intrestRequestFromValues, messageFromValues, serializeValues,
+)
+from app.models import Chat, ChatMessage, IntrestRequest
+from app.profilecache import profile_cache
+from app.serializers import ChatSerializer, IntrestRequestSerializer, MessageSerializer
+
+
+class Command(BaseCommand):
+    """
+    @brief Management command running the serializer benchmark.
+    """
+    help = "Measure the CPU time of serializing list endpoint pages."
+
+    def add_arguments(self, parser):
+        """
+        @brief Declares the command line options.
+        """
+        parser.add_argument("--rows", type=int, default=10000)
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--json", help="Write the results to this file.")
+
+    def handle(self, *args, **options):
+        """
+        @brief Seeds the rows and times every serializer in every cache mode.
+        """
+        rows = options["rows"]
+        results = []
+        with benchmark_database():
+            users = seed_users(options["users"])
+            chats = seed_chats(users, options["users"])
+            seed_messages(chats, max(1, rows // len(chats)))
+            seed_requests(users, max(1, rows // len(users)))
+
+            messages = ChatMessage.objects.order_by("pk")[:rows]
+            chats = Chat.objects.order_by("pk")[:rows]
+            intrest_requests = IntrestRequest.objects.order_by("pk")[:rows]
+            cases = {
+                "messages": (
+                    MessageSerializer, list(messages.select_related("sender")),
+                    messageFromValues, list(messages.values(*MESSAGE_VALUES)),
+                ),
+                "chats": (
+                    ChatSerializer, list(chats.select_related("initiator", "acceptor")),
+                    chatFromValues, list(chats.values(*CHAT_VALUES)),
+                ),
+                "requests": (
+                    IntrestRequestSerializer, list(intrest_requests.select_related("request_from", "request_to")),
+                    intrestRequestFromValues, list(intrest_requests.values(*INTREST_REQUEST_VALUES)),
+                ),
+            }
+            enabled = profile_cache.enabled
+            try:
+                for name, (serializer, instances, builder, values) in cases.items():
+                    for mode in ("uncached", "cold", "warm", "fast"):
+                        profile_cache.enabled = mode != "uncached"
+                        samples = []
+                        for _ in range(options["repeat"]):
+                            if mode == "cold":
+                                profile_cache.clear()
+                            with Timer() as timer:
+                                if mode == "fast":
+                                    serializeValues(values, builder)
+                                else:
+                                    serializer(instances, many=True).data
+                            samples.append(timer.elapsed * 10000 / len(instances))
+                        result = {"serializer": name, "mode": mode, "rows": len(instances), **percentiles(samples)}
+                        result["rows_per_second"] = round(10000 / result["p50"] * 1000)
+                        results.append(result)
+                        self.stdout.write(
+                            f"{name:>9} {mode:>8} p50={result['p50']}ms per 10k rows "
+                            f"({result['rows_per_second']} rows/s)"
+                        )
+            finally:
+                profile_cache.enabled = enabled
+
+        if options["json"]:
+            with open(options["json"], "w", encoding="utf-8") as out:
+                json.dump(results, out, indent=2)
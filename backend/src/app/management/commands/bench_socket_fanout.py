@@ -0,0 +1,81 @@
+"""
+@file bench_socket_fanout.py
+@brief Socket.IO fan-out load test of the chat server.
+@details Seeds a throwaway database, connects N simulated clients spread over M chats
+         to the Socket.IO ASGI app in process (see socketload.py), has every client join
+         its chat with `connect:chat` and sends `message:send` events at a target rate.
+         Reports end-to-end delivery latency percentiles, lost deliveries, the number of
+         `message:notification` events received and the CPU time used. Client i joins
+         chat i mod M as one of its two participants, alternating between them; `--idle`
+         adds clients that stay connected without joining a chat.
+
+         By default events go through AsyncRedisManager's pub/sub path over an in-memory
+         fake Redis (needs the `fakeredis` package); `--manager memory` uses the
+         in-process manager and `--manager redis://...` a real Redis server.
+
+         Usage: `python manage.py bench_socket_fanout [--clients 200] [--chats 100]
+         [--idle 0] [--rate 200] [--duration 10] [--manager fakeredis] [--json out.json]`
+"""
+
+import json
+import socketio
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand
+from app.benchmarks import benchmark_database, seed_chats, seed_users
+from app.chatcache import chat_cache
+from app.sockets import sio
+from app.socketload import makeManager, planClients, runFanout
+
+
+class Command(BaseCommand):
+    """
+    @brief Management command running the Socket.IO fan-out load test.
+    """
+    help = "Measure Socket.IO delivery latency and loss with many clients and rooms."
+
+    def add_arguments(self, parser):
+        """
+        @brief Declares the command line options.
+        """
+        parser.add_argument("--clients", type=int, default=200)
+        parser.add_argument("--chats", type=int, default=100)
+        parser.add_argument("--idle", type=int, default=0, help="Extra clients that connect but join no chat.")
+        parser.add_argument("--rate", type=float, default=200, help="Messages sent per second, over all clients.")
+        parser.add_argument("--duration", type=float, default=10, help="Seconds to send for.")
+        parser.add_argument("--settle", type=float, default=2, help="Seconds to wait for deliveries after the last send.")
+        parser.add_argument("--manager", default="fakeredis",
+                            help="fakeredis, memory, or the redis:// URL of a real server.")
+        parser.add_argument("--json", help="Write the results to this file.")
+
+    def handle(self, *args, **options):
+        """
+        @brief Seeds the chats, runs the load and reports the results.
+        """
+        with benchmark_database():
+            users = seed_users(max(2, options["chats"] + 1))
+            chats = seed_chats(users, max(1, options["chats"]))
+            chat_cache.clear()
+            plan = planClients(users, chats, options["clients"], options["idle"])
+
+            result = async_to_sync(runFanout)(
+                socketio.ASGIApp(sio), sio, makeManager(options["manager"]), plan,
+                options["rate"], options["duration"], options["settle"],
+            )
+            result["manager"] = options["manager"]
+
+        latency = result["latency"]
+        self.stdout.write(
+            f"{result['clients']} clients ({result['idle_clients']} idle) in {result['chats']} chats "
+            f"over {result['manager']}, "
+            f"connected in {result['connect_seconds']}s, "
+            f"joined in {result['join_seconds']}s ({result['join_cpu_seconds']}s cpu)\n"
+            f"sent {result['messages']} messages at {result['send_rate']}/s (target {result['target_rate']}/s)\n"
+            f"delivered {result['deliveries']}/{result['expected_deliveries']} "
+            f"(lost {result['lost']}, {result['notifications']} notifications)\n"
+            f"latency p50={latency['p50']}ms p95={latency['p95']}ms p99={latency['p99']}ms max={latency['max']}ms\n"
+            f"cpu {result['cpu_seconds']}s ({result['cpu_percent']}% of one core, clients included)"
+        )
+
+        if options["json"]:
+            with open(options["json"], "w", encoding="utf-8") as out:
+                json.dump(result, out, indent=2)
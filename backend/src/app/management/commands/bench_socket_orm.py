@@ -0,0 +1,142 @@
+"""
+@file bench_socket_orm.py
+@brief Benchmark of the socket message path: sync_to_async thread hops vs the native async ORM.
+@details Sends messages from 1, 100 and 1000 concurrent senders through three variants
+         of the `message:send` persistence path and reports per-message latency
+         percentiles and throughput:
+         - `thread_hop`: the previous design, `sync_to_async` around get/get/create.
+         - `native`: the same three queries through `aget`/`acreate`.
+         - `handler`: the current `messageRecieve` handler (session user, cached chat).
+
+         Usage: `python manage.py bench_socket_orm [--messages 2000] [--json out.json]`
+"""
+
+import asyncio
+import json
+from unittest.mock import AsyncMock, patch
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from app import sockets
+from app.benchmarks import Timer, benchmark_database, percentiles, seed_chats, seed_users
+from app.chatcache import chat_cache
+from app.models import Chat, ChatMessage
+from authentication.serializers import userSerializer
+
+User = get_user_model()
+
+
+async def sendThreadHop(sender, chat, text):
+    """
+    @brief Persists a message the way the handler did before the async ORM rewrite.
+    """
+    user = await sync_to_async(User.objects.get)(username=sender["username"])
+    room = await sync_to_async(Chat.objects.get)(short_id=chat.short_id)
+    await sync_to_async(ChatMessage.objects.create, thread_sensitive=True)(
+        chat=room, sender=user, text=text
+    )
+
+
+async def sendNative(sender, chat, text):
+    """
+    @brief Persists a message with the same queries through the native async ORM.
+    """
+    user = await User.objects.aget(username=sender["username"])
+    room = await Chat.objects.aget(short_id=chat.short_id)
+    await ChatMessage.objects.acreate(chat=room, sender=user, text=text)
+
+
+async def sendHandler(sender, chat, text):
+    """
+    @brief Sends a message through the current `message:send` handler.
+    @details Includes serializing the emitted payload; the sender's sid is its username.
+    """
+    await sockets.messageRecieve(sender["username"], {"chat_id": chat.short_id, "message": text})
+
+
+VARIANTS = {
+    "thread_hop": sendThreadHop,
+    "native": sendNative,
+    "handler": sendHandler,
+}
+
+
+async def runSenders(send, senders, chats, per_sender):
+    """
+    @brief Runs every sender concurrently and records the latency of each message.
+    @param send The variant's send coroutine function.
+    @param senders The sender descriptions (username and session).
+    @param chats The chats, one per sender.
+    @param per_sender The number of messages each sender sends, one after the other.
+    @return list The per-message latencies in seconds.
+    """
+    samples = []
+
+    async def sender_loop(sender, chat):
+        for index in range(per_sender):
+            with Timer() as timer:
+                await send(sender, chat, f"bench message {index}")
+            samples.append(timer.elapsed)
+
+    await asyncio.gather(*(sender_loop(sender, chat) for sender, chat in zip(senders, chats)))
+    return samples
+
+
+class Command(BaseCommand):
+    """
+    @brief Management command running the socket ORM benchmark.
+    """
+    help = "Compare per-message latency and throughput of the socket message path."
+
+    def add_arguments(self, parser):
+        """
+        @brief Declares the command line options.
+        """
+        parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 100, 1000],
+                            help="Numbers of concurrent senders to measure.")
+        parser.add_argument("--messages", type=int, default=2000,
+                            help="Total messages sent per run.")
+        parser.add_argument("--variants", nargs="+", default=list(VARIANTS), choices=list(VARIANTS))
+        parser.add_argument("--json", help="Write the results to this file.")
+
+    def handle(self, *args, **options):
+        """
+        @brief Seeds a throwaway database and runs every variant at every concurrency.
+        """
+        results = []
+        with benchmark_database():
+            users = seed_users(max(options["concurrency"]) + 1)
+            chats = seed_chats(users, max(options["concurrency"]))
+            senders = [
+                {"username": user.username, "session": {"user_id": user.pk, "profile_version": user.profile_version, "user": userSerializer(user).data}}
+                for user in users
+            ]
+
+            sessions = {sender["username"]: sender["session"] for sender in senders}
+            with patch.object(sockets.sio, "emit", new=AsyncMock()), \
+                 patch.object(sockets.sio, "get_session", new=AsyncMock(side_effect=sessions.get)):
+                for concurrency in options["concurrency"]:
+                    per_sender = max(1, options["messages"] // concurrency)
+                    for variant in options["variants"]:
+                        chat_cache.clear()
+                        with Timer() as timer:
+                            samples = async_to_sync(runSenders)(
+                                VARIANTS[variant], senders[:concurrency], chats[:concurrency], per_sender
+                            )
+                        result = {
+                            "variant": variant,
+                            "concurrency": concurrency,
+                            "messages": len(samples),
+                            "seconds": round(timer.elapsed, 3),
+                            "throughput": round(len(samples) / timer.elapsed, 1),
+                            **percentiles(samples),
+                        }
+                        results.append(result)
+                        self.stdout.write(
+                            f"{variant:>10} c={concurrency:<5} {result['throughput']:>9} msg/s  "
+                            f"p50={result['p50']}ms p95={result['p95']}ms p99={result['p99']}ms"
+                        )
+
+        if options["json"]:
+            with open(options["json"], "w", encoding="utf-8") as out:
+                json.dump(results, out, indent=2)
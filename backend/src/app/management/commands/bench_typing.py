@@ -0,0 +1,87 @@
+"""
+@file bench_typing.py
+@brief Benchmark of typing indicator traffic against chat message throughput.
+@details Runs the Socket.IO fan-out load of bench_socket_fanout three times: with
+         messages only, with keystroke-rate typing events through the typing indicator
+         throttle, and with the throttle's interval set to 0 so every typing state change
+         is forwarded. Reports the message send rate, delivery latency and loss of each
+         run, next to the typing events received, the changes forwarded and the
+         `typing:update` events delivered.
+
+         Usage: `python manage.py bench_typing [--clients 200] [--chats 100] [--rate 200]
+         [--typing-rate 2000] [--duration 5] [--manager fakeredis] [--json out.json]`
+"""
+
+import json
+import socketio
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand
+from app.benchmarks import benchmark_database, seed_chats, seed_users
+from app.chatcache import chat_cache
+from app.sockets import sio
+from app.socketload import makeManager, planClients, runFanout
+from app.typingindicators import typing_indicators
+
+
+class Command(BaseCommand):
+    """
+    @brief Management command running the typing indicator benchmark.
+    """
+    help = "Measure message throughput and latency with and without typing traffic."
+
+    def add_arguments(self, parser):
+        """
+        @brief Declares the command line options.
+        """
+        parser.add_argument("--clients", type=int, default=200)
+        parser.add_argument("--chats", type=int, default=100)
+        parser.add_argument("--rate", type=float, default=200, help="Messages sent per second, over all clients.")
+        parser.add_argument("--typing-rate", type=float, default=2000,
+                            help="Typing events sent per second, over all clients.")
+        parser.add_argument("--duration", type=float, default=5, help="Seconds to send for.")
+        parser.add_argument("--manager", default="fakeredis",
+                            help="fakeredis, memory, or the redis:// URL of a real server.")
+        parser.add_argument("--json", help="Write the results to this file.")
+
+    def handle(self, *args, **options):
+        """
+        @brief Seeds the chats and runs the load without typing, throttled and unthrottled.
+        """
+        modes = {
+            "messages_only": (0, typing_indicators.interval),
+            "throttled": (options["typing_rate"], typing_indicators.interval),
+            "unthrottled": (options["typing_rate"], 0),
+        }
+        results = []
+        interval = typing_indicators.interval
+        with benchmark_database():
+            users = seed_users(max(2, options["chats"] + 1))
+            chats = seed_chats(users, max(1, options["chats"]))
+            plan = planClients(users, chats, options["clients"])
+            try:
+                for mode, (typing_rate, mode_interval) in modes.items():
+                    chat_cache.clear()
+                    typing_indicators.clear()
+                    typing_indicators.interval = mode_interval
+                    result = async_to_sync(runFanout)(
+                        socketio.ASGIApp(sio), sio, makeManager(options["manager"]), plan,
+                        options["rate"], options["duration"], typing_rate=typing_rate,
+                    )
+                    stats = typing_indicators.stats()
+                    result.update(mode=mode, interval=mode_interval,
+                                  typing_received=stats["received"], typing_forwarded=stats["forwarded"])
+                    results.append(result)
+                    latency = result["latency"]
+                    self.stdout.write(
+                        f"{mode:>13} messages {result['send_rate']}/s "
+                        f"p50={latency['p50']}ms p95={latency['p95']}ms p99={latency['p99']}ms "
+                        f"lost={result['lost']}  typing {result['typing_received']} received, "
+                        f"{result['typing_forwarded']} forwarded, {result['typing_updates']} delivered  "
+                        f"cpu {result['cpu_percent']}%"
+                    )
+            finally:
+                typing_indicators.interval = interval
+
+        if options["json"]:
+            with open(options["json"], "w", encoding="utf-8") as out:
+                json.dump(results, out, indent=2)
@@ -0,0 +1,64 @@
+"""
+@file bench_user_search.py
+@brief Benchmark of the ranked prefix search behind ListUsers.
+@details Seeds a throwaway database with users and their search terms, then times
+         searches for prefixes of increasing length and reports latency percentiles.
+
+         Usage: `python manage.py bench_user_search [--users 1000000] [--repeat 50] [--json out.json]`
+"""
+
+import json
+from django.core.management.base import BaseCommand
+from app.benchmarks import Timer, benchmark_database, percentiles, seed_users
+from app.pagination import KeysetPaginator
+from app.search import searchTerms
+
+QUERIES = ["b", "bench1", "bench12345", "first42", "last9 first9", "nomatch"]
+""" @brief Search strings, from broad prefixes to exact names. """
+
+
+class Command(BaseCommand):
+    """
+    @brief Management command running the user search benchmark.
+    """
+    help = "Measure the latency of ranked prefix searches over the user directory."
+
+    def add_arguments(self, parser):
+        """
+        @brief Declares the command line options.
+        """
+        parser.add_argument("--users", type=int, default=100000)
+        parser.add_argument("--repeat", type=int, default=50)
+        parser.add_argument("--limit", type=int, default=20)
+        parser.add_argument("--json", help="Write the results to this file.")
+
+    def handle(self, *args, **options):
+        """
+        @brief Seeds the users and times a first page of results for every query.
+        """
+        paginator = KeysetPaginator(("kind", "term", "user_id"))
+        results = []
+        with benchmark_database():
+            with Timer() as seeding:
+                seed_users(options["users"])
+            self.stdout.write(f"Seeded {options['users']} users in {seeding.elapsed:.1f}s")
+
+            for query in QUERIES:
+                samples = []
+                for _ in range(options["repeat"]):
+                    with Timer() as timer:
+                        rows = [
+                            term.user for term in
+                            searchTerms(query).order_by(*paginator.fields)[:options["limit"]]
+                        ]
+                    samples.append(timer.elapsed)
+                result = {"query": query, "rows": len(rows), **percentiles(samples)}
+                results.append(result)
+                self.stdout.write(
+                    f"{query!r:>16} rows={len(rows):<3} p50={result['p50']}ms "
+                    f"p95={result['p95']}ms p99={result['p99']}ms"
+                )
+
+        if options["json"]:
+            with open(options["json"], "w", encoding="utf-8") as out:
+                json.dump(results, out, indent=2)
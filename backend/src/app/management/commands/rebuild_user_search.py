@@ -0,0 +1,30 @@
+"""
+@file rebuild_user_search.py
+@brief Rebuilds the user search index from the user table.
+@details The index is kept in sync by the user save signal; run this command once after
+         deploying the search index, and after importing users with bulk operations
+         that bypass signals.
+
+         Usage: `python manage.py rebuild_user_search`
+"""
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from app.search import indexUsers
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    """
+    @brief Management command rebuilding the UserSearchTerm rows of every user.
+    """
+    help = "Rebuild the user search index."
+
+    def handle(self, *args, **options):
+        """
+        @brief Reindexes all users in chunks.
+        """
+        users = User.objects.only("pk", "username", "first_name", "last_name").order_by("pk")
+        terms = indexUsers(users.iterator(chunk_size=2000))
+        self.stdout.write(f"Indexed {terms} search terms.")
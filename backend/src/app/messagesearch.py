@@ -0,0 +1,112 @@
+"""
+@file messagesearch.py
+@brief Full-text search over chat messages.
+@details This file contains the SQLite FTS5 index over `ChatMessage.text` and the
+         query helpers behind MessageSearchView. The index is an external-content
+         FTS5 table created after `migrate` and kept in sync by database triggers, so
+         rows written with `bulk_create` (e.g. by the write-behind queue) are indexed
+         too. On other database backends the search falls back to `icontains`.
+"""
+
+from django.db import connections
+from django.db.models import BigIntegerField, F, Q
+from django.db.models.expressions import RawSQL
+from .models import ChatMessage
+
+FTS_TABLE = f"{ChatMessage._meta.db_table}_fts"
+""" @brief Name of the FTS5 table indexing the message texts. """
+
+SNIPPET_TOKENS = 12
+""" @brief Number of tokens around the match kept in a snippet. """
+
+
+def createSearchIndex(using="default", **kwargs):
+    """
+    @brief Creates the FTS5 table and its sync triggers if they do not exist.
+    @details Connected to `post_migrate`. When the table is created the existing messages
+             are indexed with a rebuild; afterwards the triggers index each insert,
+             update and delete incrementally.
+    @param using The alias of the database that was migrated.
+    @param kwargs Additional keyword arguments passed to the signal.
+    """
+    connection = connections[using]
+    if connection.vendor != "sqlite":
+        return
+
+    table = ChatMessage._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = %s", [FTS_TABLE])
+        if cursor.fetchone():
+            return
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+            f"text, content='{table}', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+        )
+        cursor.execute(
+            f"CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text); END"
+        )
+        cursor.execute(
+            f"CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON {table} BEGIN "
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text) VALUES ('delete', old.id, old.text); END"
+        )
+        cursor.execute(
+            f"CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF text ON {table} BEGIN "
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text) VALUES ('delete', old.id, old.text); "
+            f"INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text); END"
+        )
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def ftsQuery(query):
+    """
+    @brief Turns a user's search string into a safe FTS5 query.
+    @details Every word is quoted, so FTS5 operators typed by the user are searched
+             literally. All words must match, and the last one matches as a prefix.
+    @param query The raw search string.
+    @return str The FTS5 query, or an empty string if the search has no words.
+    """
+    words = ['"' + word.replace('"', '""') + '"' for word in query.split()]
+    if not words:
+        return ""
+    words[-1] += "*"
+    return " ".join(words)
+
+
+def searchMessages(user, query):
+    """
+    @brief Builds the search over the messages of the chats a user takes part in.
+    @details On SQLite the FTS5 table is joined in and each row gets a `snippet` of the
+             matching text, with matches wrapped in `[` and `]`. Results are keyed by
+             `match_id`, the message id as read from the FTS5 table: ordering by it lets
+             FTS5 return matches newest first and stop after a page, instead of
+             sorting every match of a common word.
+    @param user The user searching; only chats where they are initiator or acceptor are searched.
+    @param query The raw search string.
+    @return QuerySet The matching messages annotated with `snippet` and `match_id`,
+                     or None if the search has no words.
+    """
+    match = ftsQuery(query)
+    if not match:
+        return None
+
+    messages = ChatMessage.objects.filter(
+        Q(chat__initiator=user) | Q(chat__acceptor=user)
+    ).select_related("sender", "chat")
+
+    if connections[messages.db].vendor != "sqlite":
+        return (
+            messages.filter(text__icontains=query.strip())
+            .annotate(match_id=F("id"))
+            .extra(select={"snippet": "text"})
+        )
+
+    table = ChatMessage._meta.db_table
+    return messages.annotate(
+        match_id=RawSQL(f"{FTS_TABLE}.rowid", [], output_field=BigIntegerField())
+    ).extra(
+        tables=[FTS_TABLE],
+        where=[f"{FTS_TABLE}.rowid = {table}.id", f"{FTS_TABLE} MATCH %s"],
+        params=[match],
+        select={"snippet": f"snippet({FTS_TABLE}, 0, '[', ']', '…', {SNIPPET_TOKENS})"},
+    )
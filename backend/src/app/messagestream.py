@@ -0,0 +1,211 @@
+"""
+@file messagestream.py
+@brief Bounded per-chat log of the messages sent over Socket.IO, for reconnect replay.
+@details This file contains the MessageStream that `message:send` appends every emitted
+         `message:recieve` payload to. A client rejoining a chat with `connect:chat` can
+         pass the id of the last message it saw and is sent only the messages after it,
+         from the log while that message is still in the retained window and from the
+         database otherwise. The log lives in one capped Redis stream per chat shared by
+         every worker when REDIS_URL is set. Without it the log is one ring per chat in
+         process memory; as a ring only holds the messages sent through its own process,
+         replays then always read the database and only add the logged messages it does
+         not have yet.
+"""
+
+import logging
+from collections import OrderedDict, deque
+from django.conf import settings
+from django.db.models import Q
+from .models import ChatMessage
+from .fastserializers import MESSAGE_VALUES, messageFromValues, serializeValues
+from . import jsoncodec
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class MessageStream:
+    """
+    @brief Keeps the last `max_len` messages of each chat and replays the gap after a
+           given message.
+    @details Entries are kept in the order they were emitted. A replay is served from the
+             shared log when the last seen message is still in it; otherwise, and always
+             with the process-local log, which misses the messages sent through other
+             Socket.IO instances, the gap is read from the database, oldest first and at
+             most `replay_limit` messages, followed by the logged messages the database
+             does not have yet (rows the write-behind queue has not inserted).
+    """
+
+    def __init__(self, enabled=True, max_len=200, max_chats=10000, replay_limit=200, ttl=86400,
+                 redis_url=None, prefix="messages:"):
+        """
+        @brief Initializes the log.
+        @param enabled Whether `message:send` appends to the log and `connect:chat` replays.
+        @param max_len The number of messages retained per chat.
+        @param max_chats The largest number of chats kept in process memory.
+        @param replay_limit The largest number of messages sent by one replay.
+        @param ttl Seconds a chat's Redis stream is kept after its last message.
+        @param redis_url The URL of the shared Redis store, or None to keep the log in process.
+        @param prefix The prefix of the Redis keys.
+        """
+        self.enabled = enabled
+        self.max_len = max_len
+        self.max_chats = max_chats
+        self.replay_limit = replay_limit
+        self.ttl = ttl
+        self.prefix = prefix
+        self.aredis = None
+        if redis_url:
+            import redis.asyncio
+            self.aredis = redis.asyncio.Redis.from_url(redis_url)
+        self.appended = 0
+        self.replays = 0
+        self.window_replays = 0
+        self.database_replays = 0
+        self.replayed = 0
+        self._rings = OrderedDict()
+
+    @classmethod
+    def from_settings(cls):
+        """
+        @brief Builds the log from the MESSAGE_STREAM setting.
+        @return MessageStream The configured log.
+        """
+        options = getattr(settings, "MESSAGE_STREAM", {})
+        return cls(
+            enabled=options.get("ENABLED", True),
+            max_len=options.get("MAX_LEN", 200),
+            max_chats=options.get("MAX_CHATS", 10000),
+            replay_limit=options.get("REPLAY_LIMIT", 200),
+            ttl=options.get("TTL", 86400),
+            redis_url=options.get("REDIS_URL"),
+        )
+
+    async def append(self, chat_id, message):
+        """
+        @brief Appends an emitted message to its chat's log, dropping the oldest beyond `max_len`.
+        @details A failed Redis write is logged and otherwise ignored; the message still
+                 reaches the database, so a later replay falls back to it.
+        @param chat_id The chat's short_id.
+        @param message The serialized message, as emitted with `message:recieve`.
+        """
+        chat_id = str(chat_id)
+        self.appended += 1
+        if self.aredis is not None:
+            key = self.prefix + chat_id
+            try:
+                pipe = self.aredis.pipeline(transaction=False)
+                pipe.xadd(key, {"id": message["id"], "m": jsoncodec.dumpb(message)},
+                          maxlen=self.max_len, approximate=False)
+                pipe.expire(key, self.ttl)
+                await pipe.execute()
+            except Exception:
+                logger.exception("message stream redis append failed")
+            return
+        ring = self._rings.get(chat_id)
+        if ring is None:
+            ring = self._rings[chat_id] = deque(maxlen=self.max_len)
+            while len(self._rings) > self.max_chats:
+                self._rings.popitem(last=False)
+        else:
+            self._rings.move_to_end(chat_id)
+        ring.append(message)
+
+    async def window(self, chat_id):
+        """
+        @brief Returns the retained messages of a chat, oldest first.
+        @param chat_id The chat's short_id.
+        @return list The serialized messages.
+        """
+        chat_id = str(chat_id)
+        if self.aredis is None:
+            return list(self._rings.get(chat_id, ()))
+        try:
+            entries = await self.aredis.xrange(self.prefix + chat_id)
+        except Exception:
+            logger.exception("message stream redis read failed")
+            return []
+        return [jsoncodec.loads(fields[b"m"]) for _, fields in entries]
+
+    async def _fromDatabase(self, chat_pk, last_id):
+        """
+        @brief Reads the messages of a chat that follow a message, oldest first.
+        @param chat_pk The chat's primary key.
+        @param last_id The id of the last message seen.
+        @return list The serialized messages, at most `replay_limit` + 1 of them, or None
+                     if the last seen message is not in the chat.
+        """
+        last = await (
+            ChatMessage.objects.filter(chat_id=chat_pk, pk=last_id)
+            .values_list("created_at", flat=True).afirst()
+        )
+        if last is None:
+            return None
+        rows = (
+            ChatMessage.objects.filter(chat_id=chat_pk)
+            .filter(Q(created_at__gt=last) | Q(created_at=last, pk__gt=last_id))
+            .order_by("created_at", "id")
+            .values(*MESSAGE_VALUES)[:self.replay_limit + 1]
+        )
+        return serializeValues([row async for row in rows], messageFromValues)
+
+    async def since(self, chat, last_id):
+        """
+        @brief Returns the messages of a chat sent after the given one.
+        @param chat The chat's ChatMeta, from the chat metadata cache.
+        @param last_id The id of the last message the client saw.
+        @return tuple `(messages, truncated)`: the messages oldest first, and whether more
+                      followed than `replay_limit` or the gap could not be placed, in which
+                      case the client should reload the chat.
+        """
+        self.replays += 1
+        retained = await self.window(chat.short_id)
+        # A process-local log misses the messages sent through other processes.
+        shared = [message["id"] for message in retained] if self.aredis is not None else []
+        if last_id in shared:
+            gap = retained[shared.index(last_id) + 1:]
+            self.window_replays += 1
+        else:
+            self.database_replays += 1
+            gap = await self._fromDatabase(chat.pk, last_id)
+            if gap is None:
+                return [], True
+            if len(gap) <= self.replay_limit:
+                stored = {message["id"] for message in gap}
+                gap += [message for message in retained if message["id"] > last_id and message["id"] not in stored]
+        truncated = len(gap) > self.replay_limit
+        gap = gap[:self.replay_limit]
+        self.replayed += len(gap)
+        return gap, truncated
+
+    def clear(self):
+        """
+        @brief Forgets the in-process log and resets the counters.
+        """
+        self._rings.clear()
+        self.appended = self.replays = self.window_replays = 0
+        self.database_replays = self.replayed = 0
+
+    def stats(self):
+        """
+        @brief Returns the log's counters.
+        @return dict Chats logged in this process, appended messages, replays served from
+                     the window and from the database, and replayed messages.
+        """
+        return {
+            "enabled": self.enabled,
+            "shared": self.aredis is not None,
+            "chats": None if self.aredis is not None else len(self._rings),
+            "appended": self.appended,
+            "replays": self.replays,
+            "window_replays": self.window_replays,
+            "database_replays": self.database_replays,
+            "window_ratio": self.window_replays / self.replays if self.replays else None,
+            "replayed": self.replayed,
+        }
+
+
+message_stream = MessageStream.from_settings()
+""" @brief The process-wide message log used by the socket handlers. """
+
+metrics.register("message_stream", message_stream.stats)
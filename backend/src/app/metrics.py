@@ -0,0 +1,50 @@
+"""
+@file metrics.py
+@brief Registry of runtime counters for the application's caches and queues.
+@details This file contains a small registry that in-process components (caches,
+         background queues) add a stats callable to, and the MetricsView that
+         returns a snapshot of every registered component to staff users.
+"""
+
+from rest_framework import status
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework.permissions import IsAdminUser
+
+_providers = {}
+
+
+def register(name, provider):
+    """
+    @brief Registers a stats provider under a name.
+    @param name The key the stats are reported under.
+    @param provider A callable returning a JSON-serializable dict of counters.
+    """
+    _providers[name] = provider
+
+
+def snapshot():
+    """
+    @brief Collects the current stats of every registered provider.
+    @return dict A mapping from provider name to its stats.
+    """
+    return {name: provider() for name, provider in _providers.items()}
+
+
+class MetricsView(APIView):
+    """
+    @brief View for reading the runtime counters of this process.
+    @details This view handles GET requests and returns the stats of every registered
+             provider. Only staff users are allowed to access this view.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        """
+        @brief Handles GET requests for the MetricsView.
+        @param request The HTTP request object.
+        @return Response A Response object containing the counters of this process.
+        """
+        return Response({
+            "payload": snapshot()
+        }, status=status.HTTP_200_OK)
@@ -96,6 +96,36 @@ class Chat(models.Model):
     @param unique Ensures the identifier is unique.
     """
 
+    last_message = models.ForeignKey(
+        "ChatMessage", null=True, blank=True, on_delete=models.SET_NULL, related_name="+"
+    )
+    """
+    @brief The most recent message of the chat.
+    @details Denormalized from ChatMessage and kept up to date by the message write paths,
+             so the inbox can show previews without scanning each chat's messages.
+    """
+
+    last_activity_at = models.DateTimeField(default=timezone.now)
+    """
+    @brief Time of the chat's most recent message, or of its creation.
+    @details Denormalized alongside last_message; the inbox is sorted by this field.
+    """
+
+    class Meta:
+        """
+        @brief Meta options for the Chat model.
+        @details Declares the indexes used to list a user's chats by recent activity.
+        """
+
+        indexes = [
+            models.Index(fields=["initiator", "last_activity_at", "id"], name="chat_initiator_activity_idx"),
+            models.Index(fields=["acceptor", "last_activity_at", "id"], name="chat_acceptor_activity_idx"),
+        ]
+        """
+        @brief Indexes over (participant, last_activity_at, id).
+        @details Let the inbox seek to a page of a user's chats in activity order.
+        """
+
 class ChatMessage(models.Model):
     """
     @class ChatMessage
@@ -126,4 +156,129 @@ class ChatMessage(models.Model):
     """
     @brief Timestamp for when the message was created.
     @details This field records the date and time when the message was sent. Defaults to the current date and time.
-    """
\ No newline at end of file
+    """
+    class Meta:
+        """
+        @brief Meta options for the ChatMessage model.
+        @details Declares the composite index used to page through a chat's history.
+        """
+
+        indexes = [
+            models.Index(fields=["chat", "created_at", "id"], name="chatmessage_keyset_idx"),
+        ]
+        """
+        @brief Index over (chat, created_at, id).
+        @details Lets MessageView seek straight to a page of a chat's history in
+                 (created_at, id) order instead of scanning and sorting every message.
+        """
+
+class ReadPosition(models.Model):
+    """
+    @class ReadPosition
+    @brief Model representing how far a user has read a chat.
+    @details Each participant of a chat has one row, created with the chat. The unread
+             count is kept up to date as messages are stored, so listing unread counts
+             never counts messages: a new message adds one to the other participant's
+             count and resets its sender's, and reading up to a message recounts only the
+             messages after it.
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="read_positions")
+    """
+    @brief The reading user.
+    @param related_name A related name for reverse lookup.
+    """
+
+    chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name="read_positions")
+    """
+    @brief The chat being read.
+    @param related_name A related name for reverse lookup.
+    """
+
+    last_read_message_id = models.BigIntegerField(null=True, blank=True)
+    """
+    @brief The id of the newest message the user has read or sent in the chat.
+    @details Not a foreign key: messages queued by the write-behind queue can be read
+             before their row is inserted.
+    """
+
+    unread_count = models.PositiveIntegerField(default=0)
+    """
+    @brief The number of messages of the other participant after the read position.
+    """
+
+    class Meta:
+        """
+        @brief Meta options for the ReadPosition model.
+        @details One row per user and chat.
+        """
+
+        constraints = [
+            models.UniqueConstraint(fields=["user", "chat"], name="readposition_user_chat_unique"),
+        ]
+        """
+        @brief Unique (user, chat) constraint.
+        @details Also the index behind the per-user and per-row lookups of the read
+                 positions; rows are created with `ignore_conflicts`.
+        """
+
+class UserSearchTerm(models.Model):
+    """
+    @class UserSearchTerm
+    @brief Model representing one searchable, normalized name of a user.
+    @details Every user has one row for their username and one for each of their first and
+             last names, lowercased and stripped of accents. Prefix searches are range scans
+             over the (kind, term, user) index instead of scans of the whole user table.
+             Rows are kept in sync by the user save signal.
+    """
+
+    USERNAME = 0
+    """ @brief Kind of a term taken from the username. """
+
+    FIRST_NAME = 1
+    """ @brief Kind of a term taken from the first name. """
+
+    LAST_NAME = 2
+    """ @brief Kind of a term taken from the last name. """
+
+    KIND_CHOICES = (
+        (USERNAME, "username"),
+        (FIRST_NAME, "first name"),
+        (LAST_NAME, "last name")
+    )
+    """
+    @brief Choices for the kind of a term.
+    @details The kind doubles as the term's rank in search results: username matches first.
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="search_terms")
+    """
+    @brief The user the term belongs to.
+    @param related_name A related name for reverse lookup.
+    """
+
+    kind = models.PositiveSmallIntegerField(choices=KIND_CHOICES)
+    """
+    @brief Which of the user's names the term was taken from.
+    """
+
+    term = models.CharField(max_length=150)
+    """
+    @brief The normalized name.
+    @param max_length The maximum length of the term, that of the username.
+    """
+
+    class Meta:
+        """
+        @brief Meta options for the UserSearchTerm model.
+        @details Declares the index used for prefix range scans.
+        """
+
+        indexes = [
+            models.Index(fields=["kind", "term", "user"], name="usersearchterm_prefix_idx"),
+        ]
+        """
+        @brief Index over (kind, term, user).
+        @details A prefix search walks each kind's term range in order, so a ranked page
+                 is read straight off the index without sorting the matches.
+        """
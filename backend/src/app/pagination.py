@@ -0,0 +1,207 @@
+"""
+@file pagination.py
+@brief Keyset (cursor) pagination helpers for list endpoints.
+@details This file contains the KeysetPaginator class which pages through a
+         queryset by seeking past the last row seen instead of using OFFSET,
+         so the cost of fetching a page does not grow with the size of the table.
+         Cursors are opaque url-safe strings that encode the ordering key of a row.
+"""
+
+import base64
+import datetime
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """
+    @brief JSON encoder for cursor values.
+    @details Unlike DjangoJSONEncoder this keeps datetimes at full microsecond precision,
+             otherwise a cursor would not match the row it was taken from.
+    """
+
+    def default(self, o):
+        """
+        @brief Encodes values the stdlib encoder does not understand.
+        @param o The value to encode.
+        @return The JSON-serializable representation of the value.
+        """
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPage:
+    """
+    @brief A single page of results produced by the KeysetPaginator.
+    @details Rows are always in the paginator's order (ascending unless it is descending).
+             The before/after cursors point at the first and last rows of the page
+             and can be passed back to fetch the neighbouring pages.
+    """
+
+    def __init__(self, rows, before, after, has_more):
+        """
+        @brief Initializes the page.
+        @param rows The rows on this page, in the paginator's order.
+        @param before Cursor of the first row, or None for an empty page.
+        @param after Cursor of the last row, or None for an empty page.
+        @param has_more Whether more rows exist in the direction of travel.
+        """
+        self.rows = rows
+        self.before = before
+        self.after = after
+        self.has_more = has_more
+
+    def as_dict(self, payload):
+        """
+        @brief Builds the response body for this page.
+        @param payload The serialized rows of the page.
+        @return dict The response body including the cursors.
+        """
+        return {
+            "payload": payload,
+            "before": self.before,
+            "after": self.after,
+            "has_more": self.has_more
+        }
+
+
+class KeysetPaginator:
+    """
+    @brief Paginates a queryset over a unique, ordered tuple of fields.
+    @details The ordering fields must together be unique (end them with the primary key),
+             and should be backed by a composite index so each page is a single index seek.
+             Passing `after` returns the rows following the cursor, passing `before` returns
+             the rows preceding it. Without a cursor the first page is the head of the
+             ordering, or its tail when `from_end` is set (e.g. newest chat messages).
+             With `descending` set the ordering itself runs from the largest key to the
+             smallest (e.g. most recently active chats first).
+    """
+
+    def __init__(self, fields, default_limit=50, max_limit=200, from_end=False, descending=False):
+        """
+        @brief Initializes the paginator.
+        @param fields The ordering fields, e.g. ("created_at", "id").
+        @param default_limit The page size used when the client does not ask for one.
+        @param max_limit The largest page size a client may ask for.
+        @param from_end Whether the first page is the tail of the ordering.
+        @param descending Whether the ordering runs from the largest key to the smallest.
+        """
+        self.fields = tuple(fields)
+        self.default_limit = default_limit
+        self.max_limit = max_limit
+        self.from_end = from_end
+        self.descending = descending
+
+    def get_limit(self, request):
+        """
+        @brief Reads the page size from the `limit` query parameter.
+        @param request The HTTP request object.
+        @return int The page size, capped at max_limit.
+        @throws ValidationError if the limit is not a positive integer.
+        """
+        limit = request.query_params.get("limit")
+        if limit is None:
+            return self.default_limit
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValidationError({"limit": "limit must be an integer"})
+        if limit < 1:
+            raise ValidationError({"limit": "limit must be positive"})
+        return min(limit, self.max_limit)
+
+    def encode_cursor(self, row):
+        """
+        @brief Encodes the ordering key of a row into an opaque cursor.
+        @param row A model instance or a dict produced by `.values()`.
+        @return str The url-safe cursor string.
+        """
+        if isinstance(row, dict):
+            key = [row[field] for field in self.fields]
+        else:
+            key = [getattr(row, field) for field in self.fields]
+        raw = json.dumps(key, cls=CursorEncoder, separators=(",", ":"))
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+    def decode_cursor(self, queryset, cursor):
+        """
+        @brief Decodes a cursor back into typed ordering values.
+        @param queryset The queryset the cursor belongs to, used to look up field types.
+        @param cursor The cursor string sent by the client.
+        @return list The ordering values, converted with the to_python of each model field,
+                     or of the output field of each annotation.
+        @throws ValidationError if the cursor is malformed.
+        """
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if not isinstance(key, list) or len(key) != len(self.fields):
+                raise ValueError(cursor)
+            opts = queryset.model._meta
+            annotations = queryset.query.annotations
+            return [
+                (annotations[field].output_field if field in annotations else opts.get_field(field)).to_python(value)
+                for field, value in zip(self.fields, key)
+            ]
+        except Exception:
+            raise ValidationError({"cursor": "invalid cursor"})
+
+    def seek(self, values, forward):
+        """
+        @brief Builds the row-value comparison `(fields) > values` (or `<`) as a Q object.
+        @param values The decoded ordering values of the cursor row.
+        @param forward True to select rows after the cursor in the paginator's order,
+                       False for rows before it.
+        @return Q The filter expression.
+        """
+        lookup = "gt" if forward != self.descending else "lt"
+        condition = Q()
+        for index in range(len(self.fields)):
+            term = Q(**{f"{self.fields[index]}__{lookup}": values[index]})
+            for field, value in zip(self.fields[:index], values[:index]):
+                term &= Q(**{field: value})
+            condition |= term
+        return condition
+
+    def paginate(self, queryset, request):
+        """
+        @brief Fetches one page of the queryset according to the request's cursor.
+        @param queryset The filtered, unordered queryset to paginate.
+        @param request The HTTP request object carrying `before`, `after` and `limit`.
+        @return KeysetPage The requested page.
+        @throws ValidationError if both cursors are given or a cursor is malformed.
+        """
+        before = request.query_params.get("before")
+        after = request.query_params.get("after")
+        if before and after:
+            raise ValidationError({"cursor": "pass either before or after, not both"})
+
+        limit = self.get_limit(request)
+        ordering = [f"-{field}" if self.descending else field for field in self.fields]
+        reverse_ordering = [field if self.descending else f"-{field}" for field in self.fields]
+
+        if after:
+            queryset = queryset.filter(self.seek(self.decode_cursor(queryset, after), True))
+            forward = True
+        elif before:
+            queryset = queryset.filter(self.seek(self.decode_cursor(queryset, before), False))
+            forward = False
+        else:
+            forward = not self.from_end
+
+        # Fetch one extra row to learn whether another page exists.
+        rows = list(queryset.order_by(*(ordering if forward else reverse_ordering))[:limit + 1])
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if not forward:
+            rows.reverse()
+
+        return KeysetPage(
+            rows,
+            self.encode_cursor(rows[0]) if rows else None,
+            self.encode_cursor(rows[-1]) if rows else None,
+            has_more
+        )
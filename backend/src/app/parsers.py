@@ -0,0 +1,33 @@
+"""
+@file parsers.py
+@brief DRF parsers of the application.
+@details This file contains FastJSONParser, the default JSON parser of the REST API,
+         which decodes request bodies with the codec in jsoncodec.py.
+"""
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from . import jsoncodec
+from .renderers import FastJSONRenderer
+
+
+class FastJSONParser(JSONParser):
+    """
+    @brief JSON parser backed by the fast codec.
+    @details Request bodies are expected to be UTF-8, as RFC 8259 requires.
+    """
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        """
+        @brief Parses the request body as JSON.
+        @param stream The request body stream.
+        @param media_type The request's media type.
+        @param parser_context The view and request of the parse.
+        @return The decoded data.
+        @throws ParseError if the body is not valid JSON.
+        """
+        try:
+            return jsoncodec.loads(stream.read())
+        except ValueError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
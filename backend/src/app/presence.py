@@ -0,0 +1,390 @@
+"""
+@file presence.py
+@brief Online presence of users connected over Socket.IO.
+@details This file contains the Presence service used by the socket handlers and
+         PresenceView. Each user's connected sids are kept with an expiry that the process
+         holding the connection pushes back every TTL/3 seconds, and `presence:heartbeat`
+         events too; a user is online while any of their sids is live. Engine.IO's
+         ping/pong closes dead connections, so expiry only takes over when a whole
+         worker is gone. Presence never touches the database for writes: the sids live in process
+         memory or, with REDIS_URL set, in Redis sorted sets shared by every worker.
+         Changes are coalesced and pushed once per tick as `presence:update` events to
+         the online users the changed users have a chat with, one event per recipient.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from django.conf import settings
+from django.db.models import Q
+from .models import Chat
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def userRoom(user_id):
+    """
+    @brief Names the Socket.IO room holding every connection of a user.
+    @param user_id The user's primary key.
+    @return str The room name.
+    """
+    return f"user:{user_id}"
+
+
+class Presence:
+    """
+    @brief Tracks connected sids per user and publishes online/offline changes.
+    @details Connects and disconnects update the sid sets straight away, so lookups are
+             current. Heartbeats are only recorded and applied in bulk on the next tick,
+             which also renews the sids connected to this process and expires the sids
+             nobody renewed (e.g. a crashed worker's).
+             A user going online and offline again within one tick publishes nothing.
+    """
+
+    def __init__(self, enabled=True, ttl=60, tick=1.0, redis_url=None, prefix="presence:"):
+        """
+        @brief Initializes the service.
+        @param enabled Whether the socket handlers track presence.
+        @param ttl Seconds a sid stays live without a heartbeat.
+        @param tick Seconds between batches of heartbeats and published changes.
+        @param redis_url The URL of the shared Redis store, or None to keep presence in process.
+        @param prefix The prefix of the Redis keys.
+        """
+        self.enabled = enabled
+        self.ttl = ttl
+        self.tick = tick
+        self.prefix = prefix
+        self.server = None
+        self.redis = None
+        self.aredis = None
+        if redis_url:
+            import redis
+            import redis.asyncio
+            self.redis = redis.Redis.from_url(redis_url)
+            self.aredis = redis.asyncio.Redis.from_url(redis_url)
+        self.connects = 0
+        self.disconnects = 0
+        self.heartbeats = 0
+        self.expired = 0
+        self.published = 0
+        self.updates = 0
+        self._sids = {}
+        self._expiry = {}
+        self._local = {}
+        self._renewed_at = 0.0
+        self._pending_heartbeats = {}
+        self._changes = {}
+        self._lock = threading.Lock()
+        self._task = None
+
+    @classmethod
+    def from_settings(cls):
+        """
+        @brief Builds the service from the PRESENCE setting.
+        @return Presence The configured service.
+        """
+        options = getattr(settings, "PRESENCE", {})
+        return cls(
+            enabled=options.get("ENABLED", True),
+            ttl=options.get("TTL", 60),
+            tick=options.get("TICK", 1.0),
+            redis_url=options.get("REDIS_URL"),
+        )
+
+    def attach(self, server):
+        """
+        @brief Sets the Socket.IO server that presence updates are emitted through.
+        @param server The AsyncServer.
+        """
+        self.server = server
+
+    def _userKey(self, user_id):
+        """
+        @brief Names the Redis sorted set of a user's sids.
+        @param user_id The user's primary key.
+        @return str The key.
+        """
+        return f"{self.prefix}user:{user_id}"
+
+    def _record(self, user_id, online):
+        """
+        @brief Records a presence change for the next tick.
+        @param user_id The user's primary key.
+        @param online Whether the user is now online.
+        """
+        with self._lock:
+            self._changes.setdefault(user_id, [not online, online])[1] = online
+
+    def _ensure_started(self):
+        """
+        @brief Starts the background ticker on the running event loop, once.
+        """
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._task.get_loop() is loop:
+            return
+        self._task = loop.create_task(self._run())
+
+    async def connect(self, user_id, sid):
+        """
+        @brief Registers a new connection of a user.
+        @param user_id The user's primary key.
+        @param sid The connection's sid.
+        """
+        self._ensure_started()
+        now = time.time()
+        with self._lock:
+            self.connects += 1
+            self._local[sid] = user_id
+        if self.aredis is not None:
+            key = self._userKey(user_id)
+            pipe = self.aredis.pipeline(transaction=True)
+            pipe.zremrangebyscore(key, "-inf", now)
+            pipe.zadd(key, {sid: now + self.ttl})
+            pipe.zadd(self.prefix + "sids", {f"{user_id}:{sid}": now + self.ttl})
+            pipe.zcard(key)
+            pipe.expire(key, self.ttl * 2)
+            live = (await pipe.execute())[3]
+        else:
+            with self._lock:
+                sids = self._sids.setdefault(user_id, set())
+                sids.add(sid)
+                self._expiry[sid] = (user_id, now + self.ttl)
+                live = len(sids)
+        if live == 1:
+            self._record(user_id, True)
+
+    async def disconnect(self, user_id, sid):
+        """
+        @brief Unregisters a closed connection of a user.
+        @param user_id The user's primary key.
+        @param sid The connection's sid.
+        """
+        now = time.time()
+        with self._lock:
+            self.disconnects += 1
+            self._pending_heartbeats.pop(sid, None)
+            self._local.pop(sid, None)
+        if self.aredis is not None:
+            key = self._userKey(user_id)
+            pipe = self.aredis.pipeline(transaction=True)
+            pipe.zrem(key, sid)
+            pipe.zrem(self.prefix + "sids", f"{user_id}:{sid}")
+            pipe.zremrangebyscore(key, "-inf", now)
+            pipe.zcard(key)
+            removed, _, _, live = await pipe.execute()
+        else:
+            with self._lock:
+                sids = self._sids.get(user_id, set())
+                removed = sid in sids
+                sids.discard(sid)
+                self._expiry.pop(sid, None)
+                live = len(sids)
+                if not sids:
+                    self._sids.pop(user_id, None)
+        # A sid already expired by a tick was reported offline then.
+        if removed and live == 0:
+            self._record(user_id, False)
+
+    def heartbeat(self, user_id, sid):
+        """
+        @brief Records that a connection is still alive; applied on the next tick.
+        @param user_id The user's primary key.
+        @param sid The connection's sid.
+        """
+        with self._lock:
+            self.heartbeats += 1
+            self._pending_heartbeats[sid] = user_id
+
+    async def _applyHeartbeats(self, now):
+        """
+        @brief Pushes back the expiry of every sid that sent a heartbeat since the last tick,
+               and every TTL/3 seconds of every sid connected to this process.
+        @param now The current time.
+        """
+        with self._lock:
+            pending, self._pending_heartbeats = self._pending_heartbeats, {}
+            if now - self._renewed_at >= self.ttl / 3:
+                self._renewed_at = now
+                pending.update(self._local)
+            if self.aredis is None:
+                for sid, user_id in pending.items():
+                    if sid in self._expiry:
+                        self._expiry[sid] = (user_id, now + self.ttl)
+                return
+        if not pending:
+            return
+        pipe = self.aredis.pipeline(transaction=False)
+        for sid, user_id in pending.items():
+            # XX: sids that disconnected in the meantime are not added back.
+            pipe.zadd(self._userKey(user_id), {sid: now + self.ttl}, xx=True)
+            pipe.expire(self._userKey(user_id), self.ttl * 2)
+            pipe.zadd(self.prefix + "sids", {f"{user_id}:{sid}": now + self.ttl}, xx=True)
+        await pipe.execute()
+
+    async def _expire(self, now):
+        """
+        @brief Drops the sids whose heartbeats stopped and records the users left offline.
+        @param now The current time.
+        """
+        if self.aredis is None:
+            with self._lock:
+                stale = [(sid, user_id) for sid, (user_id, expires) in self._expiry.items() if expires <= now]
+                for sid, user_id in stale:
+                    del self._expiry[sid]
+                    sids = self._sids.get(user_id, set())
+                    sids.discard(sid)
+                    if not sids:
+                        self._sids.pop(user_id, None)
+                offline = {user_id for _, user_id in stale if user_id not in self._sids}
+                self.expired += len(stale)
+        else:
+            members = await self.aredis.zrangebyscore(self.prefix + "sids", "-inf", now)
+            if not members:
+                return
+            stale = [member.decode().split(":", 1) for member in members]
+            pipe = self.aredis.pipeline(transaction=False)
+            pipe.zrem(self.prefix + "sids", *members)
+            for user_id, sid in stale:
+                pipe.zrem(self._userKey(user_id), sid)
+            users = sorted({int(user_id) for user_id, _ in stale})
+            for user_id in users:
+                pipe.zcount(self._userKey(user_id), now, "+inf")
+            counts = (await pipe.execute())[1 + len(stale):]
+            offline = {user_id for user_id, count in zip(users, counts) if not count}
+            with self._lock:
+                self.expired += len(stale)
+        for user_id in offline:
+            self._record(user_id, False)
+
+    async def _online(self, user_ids, now):
+        """
+        @brief Tells which of the given users are online.
+        @param user_ids The users' primary keys.
+        @param now The current time.
+        @return set The primary keys of the online users.
+        """
+        user_ids = list(user_ids)
+        if self.aredis is None:
+            return self.lookupSync(user_ids, now)
+        pipe = self.aredis.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.zcount(self._userKey(user_id), now, "+inf")
+        counts = await pipe.execute()
+        return {user_id for user_id, count in zip(user_ids, counts) if count}
+
+    async def flush(self):
+        """
+        @brief Runs one tick: applies heartbeats, expires sids and publishes the changes.
+        @details The changed users' chat partners are read in one query; each online
+                 partner gets one `presence:update` event listing every change relevant
+                 to them, as `{"users": {<username>: <online>}}`.
+        @return int The number of `presence:update` events emitted.
+        """
+        now = time.time()
+        await self._applyHeartbeats(now)
+        await self._expire(now)
+        with self._lock:
+            changes, self._changes = self._changes, {}
+        changed = {user_id: after for user_id, (before, after) in changes.items() if before != after}
+        if not changed:
+            return 0
+
+        updates = {}
+        rows = Chat.objects.filter(
+            Q(initiator_id__in=changed) | Q(acceptor_id__in=changed)
+        ).values_list("initiator_id", "initiator__username", "acceptor_id", "acceptor__username")
+        async for initiator, initiator_name, acceptor, acceptor_name in rows:
+            if initiator in changed:
+                updates.setdefault(acceptor, {})[initiator_name] = changed[initiator]
+            if acceptor in changed:
+                updates.setdefault(initiator, {})[acceptor_name] = changed[acceptor]
+
+        recipients = await self._online(updates, now)
+        for user_id in recipients:
+            await self.server.emit("presence:update", {"users": updates[user_id]}, room=userRoom(user_id))
+        with self._lock:
+            self.published += len(changed)
+            self.updates += len(recipients)
+        return len(recipients)
+
+    async def _run(self):
+        """
+        @brief Background loop running a tick every `tick` seconds.
+        """
+        while True:
+            await asyncio.sleep(self.tick)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("presence tick failed")
+
+    async def stop(self):
+        """
+        @brief Stops the background ticker.
+        """
+        task, self._task = self._task, None
+        if task is not None and task.get_loop() is asyncio.get_running_loop():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    def lookupSync(self, user_ids, now=None):
+        """
+        @brief Tells which of the given users are online, from synchronous code.
+        @param user_ids The users' primary keys.
+        @param now The current time, or None for now.
+        @return set The primary keys of the online users.
+        """
+        now = time.time() if now is None else now
+        user_ids = list(user_ids)
+        if self.redis is not None:
+            pipe = self.redis.pipeline(transaction=False)
+            for user_id in user_ids:
+                pipe.zcount(self._userKey(user_id), now, "+inf")
+            return {user_id for user_id, count in zip(user_ids, pipe.execute()) if count}
+        with self._lock:
+            return {
+                user_id for user_id in user_ids
+                if any(self._expiry.get(sid, (None, 0))[1] > now for sid in self._sids.get(user_id, ()))
+            }
+
+    def clear(self):
+        """
+        @brief Forgets the local presence state and resets the counters.
+        """
+        with self._lock:
+            self._sids.clear()
+            self._expiry.clear()
+            self._local.clear()
+            self._renewed_at = 0.0
+            self._pending_heartbeats.clear()
+            self._changes.clear()
+            self.connects = self.disconnects = self.heartbeats = 0
+            self.expired = self.published = self.updates = 0
+
+    def stats(self):
+        """
+        @brief Returns the presence counters.
+        @return dict Online users and sids in this process, connects, disconnects,
+                     heartbeats, expired sids, published changes and emitted updates.
+        """
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "shared": self.redis is not None,
+                "online_users": None if self.redis is not None else len(self._sids),
+                "sids": None if self.redis is not None else len(self._expiry),
+                "connects": self.connects,
+                "disconnects": self.disconnects,
+                "heartbeats": self.heartbeats,
+                "expired": self.expired,
+                "published": self.published,
+                "updates": self.updates,
+            }
+
+
+presence = Presence.from_settings()
+""" @brief The process-wide presence service used by the socket handlers. """
+
+metrics.register("presence", presence.stats)
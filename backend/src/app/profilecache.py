@@ -0,0 +1,172 @@
+"""
+@file profilecache.py
+@brief Cache of serialized user profiles keyed by user id and profile version.
+@details This file contains the ProfileCache used by the nested user fields of the
+         serializers in serializers.py. Entries live in a size-bounded in-process LRU and,
+         optionally, in a cache shared between processes configured through Django's cache
+         framework (e.g. Redis). Keys carry the user's `profile_version`, which is bumped
+         on every profile change, so a cached profile can never be served stale; the User
+         post_save signal drops the superseded entries.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from authentication.serializers import userSerializer
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class ProfileCache:
+    """
+    @brief Two-tier cache of `userSerializer` output.
+    @details Lookups check the local LRU, then the shared tier (when configured), then
+             serialize the user and fill both tiers. The local tier is a plain dictionary:
+             a Django local-memory cache pickles every entry and costs more per hit than
+             serializing the profile. Returned profiles are shared and must not be
+             modified. Users without a known profile version, such as the unsaved users
+             rebuilt from older Socket.IO sessions, are always serialized directly.
+    """
+
+    def __init__(self, enabled=True, max_size=50000, shared=None, prefix="profile:"):
+        """
+        @brief Initializes the cache.
+        @param enabled Whether profiles are cached at all.
+        @param max_size The largest number of profiles kept in the local LRU.
+        @param shared The alias of the shared cache in the CACHES setting, or None.
+        @param prefix The prefix of the shared cache keys.
+        """
+        self.enabled = enabled
+        self.max_size = max_size
+        self.shared = shared
+        self.prefix = prefix
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._serializer = userSerializer()
+
+    @classmethod
+    def from_settings(cls):
+        """
+        @brief Builds the cache from the PROFILE_CACHE setting.
+        @return ProfileCache The configured cache.
+        """
+        options = getattr(settings, "PROFILE_CACHE", {})
+        return cls(
+            enabled=options.get("ENABLED", True),
+            max_size=options.get("MAX_SIZE", 50000),
+            shared=options.get("SHARED"),
+        )
+
+    def serialize(self, user):
+        """
+        @brief Serializes a user without the cache.
+        @details Reuses one serializer instance, as a nested serializer field does, so its
+                 fields are only built once.
+        @param user The user to serialize.
+        @return dict The user's profile as produced by userSerializer.
+        """
+        return dict(self._serializer.to_representation(user))
+
+    def _set_local(self, key, data):
+        """
+        @brief Stores a profile in the local LRU, evicting the least recently used ones.
+        @param key The (user id, profile version) key.
+        @param data The serialized profile.
+        """
+        with self._lock:
+            self._entries[key] = data
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get(self, user):
+        """
+        @brief Returns the serialized profile of a user.
+        @param user The user to serialize.
+        @return dict The user's profile as produced by userSerializer.
+        """
+        version = getattr(user, "profile_version", 0)
+        if not self.enabled or not version:
+            return self.serialize(user)
+
+        key = (user.pk, version)
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return data
+
+        if self.shared is not None:
+            try:
+                data = caches[self.shared].get(f"{self.prefix}{user.pk}", version=version)
+            except Exception:
+                logger.exception("profile cache shared read failed")
+            if data is not None:
+                with self._lock:
+                    self.shared_hits += 1
+                self._set_local(key, data)
+                return data
+
+        data = self.serialize(user)
+        with self._lock:
+            self.misses += 1
+        self._set_local(key, data)
+        if self.shared is not None:
+            try:
+                caches[self.shared].set(f"{self.prefix}{user.pk}", data, version=version)
+            except Exception:
+                logger.exception("profile cache shared write failed")
+        return data
+
+    def invalidate(self, user_id, version):
+        """
+        @brief Drops the cached profile of one version of a user.
+        @param user_id The user's primary key.
+        @param version The profile version to drop.
+        """
+        with self._lock:
+            self._entries.pop((user_id, version), None)
+        if self.shared is not None:
+            try:
+                caches[self.shared].delete(f"{self.prefix}{user_id}", version=version)
+            except Exception:
+                logger.exception("profile cache shared delete failed")
+
+    def clear(self):
+        """
+        @brief Empties the local LRU and resets the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.shared_hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """
+        @brief Returns the cache counters.
+        @return dict Size, hits, shared-tier hits, misses, evictions and the hit ratio.
+        """
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "evictions": self.evictions,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits + self.shared_hits) / lookups if lookups else None,
+            }
+
+
+profile_cache = ProfileCache.from_settings()
+""" @brief The process-wide profile cache used by the serializers. """
+
+metrics.register("profile_cache", profile_cache.stats)
@@ -0,0 +1,99 @@
+"""
+@file querybudget.py
+@brief Per-view database query budgets.
+@details This file contains the `query_budget` decorator for APIView handler methods.
+         It counts the queries a handler runs, records per-view counters (reported by
+         the metrics endpoint) and logs a warning, or raises QueryBudgetExceeded when
+         the QUERY_BUDGET_RAISE setting is on, if a handler goes over its budget.
+         Authentication runs before the handler and is not counted.
+"""
+
+import functools
+import logging
+import threading
+from django.conf import settings
+from django.db import connection
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+_stats = {}
+_lock = threading.Lock()
+
+
+class QueryBudgetExceeded(Exception):
+    """
+    @brief Raised when a view handler runs more queries than its budget allows.
+    """
+
+
+class QueryCounter:
+    """
+    @brief Database execute wrapper counting the queries run through it.
+    """
+
+    def __init__(self):
+        """
+        @brief Initializes the counter.
+        """
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        """
+        @brief Counts and runs one query.
+        """
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def record(name, count, budget):
+    """
+    @brief Records the query count of one handler call and checks it against the budget.
+    @param name The handler name, `<View>.<method>`.
+    @param count The number of queries the call ran.
+    @param budget The largest number of queries allowed.
+    @throws QueryBudgetExceeded if the budget is exceeded and QUERY_BUDGET_RAISE is on.
+    """
+    exceeded = count > budget
+    with _lock:
+        stats = _stats.setdefault(name, {"budget": budget, "calls": 0, "max_queries": 0, "exceeded": 0})
+        stats["calls"] += 1
+        stats["max_queries"] = max(stats["max_queries"], count)
+        stats["exceeded"] += exceeded
+
+    if not exceeded:
+        return
+    message = f"{name} ran {count} queries, over its budget of {budget}"
+    if getattr(settings, "QUERY_BUDGET_RAISE", False):
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+def query_budget(budget):
+    """
+    @brief Decorator limiting the number of queries an APIView handler method may run.
+    @param budget The largest number of queries allowed per call.
+    @return The decorator.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            counter = QueryCounter()
+            with connection.execute_wrapper(counter):
+                response = method(view, request, *args, **kwargs)
+            record(f"{type(view).__name__}.{method.__name__}", counter.count, budget)
+            return response
+        return wrapper
+    return decorator
+
+
+def stats():
+    """
+    @brief Returns the recorded per-view query counters.
+    @return dict A mapping from handler name to its budget and counters.
+    """
+    with _lock:
+        return {name: dict(values) for name, values in _stats.items()}
+
+
+metrics.register("query_budget", stats)
@@ -0,0 +1,204 @@
+"""
+@file readpositions.py
+@brief Coalesced read positions reported over Socket.IO.
+@details This file contains the ReadPositions service behind the `message:read` socket
+         event. Clients may report every message they display; the service keeps only
+         the newest message per (user, chat) in memory and writes the positions once per
+         `interval` seconds from a background task. Writing a position recounts the
+         user's unread messages after it, so the unread counts that the message write
+         paths keep up to date are corrected on every read.
+"""
+
+import asyncio
+import logging
+import threading
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, IntegerField, Q, Subquery
+from django.db.models.functions import Coalesce
+from .models import ChatMessage, ReadPosition
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def unreadAfter(user_id, chat_pk, message_id):
+    """
+    @brief Builds the count of a chat's messages from others after a message.
+    @details Messages are ordered by (created_at, id) as in the chat history. A message
+             that is not stored yet counts as the newest, so nothing follows it.
+    @param user_id The reading user's primary key.
+    @param chat_pk The chat's primary key.
+    @param message_id The id of the last message read.
+    @return Coalesce The count expression, for use in an UPDATE.
+    """
+    read_at = Subquery(ChatMessage.objects.filter(pk=message_id).values("created_at")[:1])
+    unread = (
+        ChatMessage.objects.filter(chat_id=chat_pk)
+        .filter(Q(created_at__gt=read_at) | Q(created_at=read_at, pk__gt=message_id))
+        .exclude(sender_id=user_id)
+        .order_by()
+        .values("chat")
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    return Coalesce(Subquery(unread, output_field=IntegerField()), 0)
+
+
+class ReadPositions:
+    """
+    @brief Coalesces `message:read` reports and writes them in batches.
+    @details Positions only move forward: a report of an older message than the stored
+             or pending one is ignored. Pending positions live in process memory and are
+             written on every tick and at shutdown.
+    """
+
+    def __init__(self, enabled=True, interval=1.0):
+        """
+        @brief Initializes the service.
+        @param enabled Whether the socket handlers accept `message:read`.
+        @param interval Seconds between two writes of the pending positions.
+        """
+        self.enabled = enabled
+        self.interval = interval
+        self.received = 0
+        self.written = 0
+        self.flushes = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._task = None
+
+    @classmethod
+    def from_settings(cls):
+        """
+        @brief Builds the service from the READ_POSITIONS setting.
+        @return ReadPositions The configured service.
+        """
+        options = getattr(settings, "READ_POSITIONS", {})
+        return cls(
+            enabled=options.get("ENABLED", True),
+            interval=options.get("INTERVAL", 1.0),
+        )
+
+    def _ensure_started(self):
+        """
+        @brief Starts the background writer on the running event loop, once.
+        """
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._task.get_loop() is loop:
+            return
+        self._task = loop.create_task(self._run())
+
+    async def read(self, user_id, chat_pk, message_id):
+        """
+        @brief Records that a user has read a chat up to a message.
+        @param user_id The reading user's primary key.
+        @param chat_pk The chat's primary key.
+        @param message_id The id of the newest message read.
+        """
+        self._ensure_started()
+        key = (user_id, chat_pk)
+        with self._lock:
+            self.received += 1
+            if message_id > self._pending.get(key, -1):
+                self._pending[key] = message_id
+
+    def write(self, pending):
+        """
+        @brief Writes read positions and recounts the unread messages after them.
+        @details Missing rows, e.g. of chats older than read tracking, are created in one
+                 query; every position is then one UPDATE, all in one transaction.
+        @param pending A mapping from `(user_id, chat_pk)` to the newest message id read.
+        @return int The number of positions that moved.
+        """
+        if not pending:
+            return 0
+        moved = 0
+        with transaction.atomic():
+            ReadPosition.objects.bulk_create([
+                ReadPosition(user_id=user_id, chat_id=chat_pk) for user_id, chat_pk in pending
+            ], ignore_conflicts=True)
+            for (user_id, chat_pk), message_id in pending.items():
+                moved += (
+                    ReadPosition.objects.filter(user_id=user_id, chat_id=chat_pk)
+                    .filter(Q(last_read_message_id__isnull=True) | Q(last_read_message_id__lt=message_id))
+                    .update(last_read_message_id=message_id,
+                            unread_count=unreadAfter(user_id, chat_pk, message_id))
+                )
+        return moved
+
+    async def flush(self):
+        """
+        @brief Writes the positions reported since the last flush.
+        @details Positions that fail to be written are put back for the next tick, unless
+                 a newer one was reported in the meantime.
+        @return int The number of positions that moved.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            moved = await sync_to_async(self.write)(pending)
+        except Exception:
+            with self._lock:
+                for key, message_id in pending.items():
+                    if message_id > self._pending.get(key, -1):
+                        self._pending[key] = message_id
+            raise
+        with self._lock:
+            self.flushes += 1
+            self.written += len(pending)
+        return moved
+
+    async def _run(self):
+        """
+        @brief Background loop writing the pending positions every `interval` seconds.
+        """
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("read position flush failed")
+
+    async def stop(self):
+        """
+        @brief Stops the background writer and writes the pending positions.
+        """
+        task, self._task = self._task, None
+        if task is not None and task.get_loop() is asyncio.get_running_loop():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        await self.flush()
+
+    def clear(self):
+        """
+        @brief Forgets the pending positions and resets the counters.
+        """
+        with self._lock:
+            self._pending.clear()
+            self.received = self.written = self.flushes = 0
+
+    def stats(self):
+        """
+        @brief Returns the service's counters.
+        @return dict Pending positions, received reports, written positions, flushes and
+                     the share of reports saved by coalescing.
+        """
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "pending": len(self._pending),
+                "received": self.received,
+                "written": self.written,
+                "flushes": self.flushes,
+                "coalesced_ratio": 1 - self.written / self.received if self.received else None,
+            }
+
+
+read_positions = ReadPositions.from_settings()
+""" @brief The process-wide read position service used by the socket handlers. """
+
+metrics.register("read_positions", read_positions.stats)
@@ -0,0 +1,296 @@
+"""
+@file recentmessages.py
+@brief Cache of the newest serialized messages of recently active chats.
+@details This file contains the RecentMessages cache that serves the first page of
+         MessageView, the newest messages of a chat, without SQL. A chat's window of the
+         last `size` messages is read from the database on the first request for it and
+         then kept up to date by the message write paths: `message:send` and the
+         ChatMessage post_save signal append to it. Windows are dropped when the chat is
+         saved or deleted, after `ttl` seconds, once they have been idle for `idle`
+         seconds, and least recently used first while the cache holds more than
+         `max_bytes` of encoded messages. Windows only follow the messages sent through
+         their own process, so the cache is off unless a single process serves the sockets.
+"""
+
+import bisect
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from .fastserializers import MESSAGE_VALUES, messageFromValues, serializeValues
+from .pagination import KeysetPage
+from . import jsoncodec
+from . import metrics
+
+KEY_FIELDS = ("created_at", "id")
+""" @brief The ordering fields of the chat history, as used by MessageView's paginator. """
+
+
+class RecentWindow:
+    """
+    @brief The cached newest messages of one chat.
+    @details `entries` holds `((created_at, id), message, size)` tuples, oldest first.
+             `complete` is set when the window starts at the chat's first message.
+    """
+    __slots__ = ("entries", "complete", "bytes", "loaded_at", "used_at")
+
+    def __init__(self, entries, complete, now):
+        """
+        @brief Initializes a window.
+        @param entries The window's entries, oldest first.
+        @param complete Whether the chat has no messages older than the window.
+        @param now The current monotonic time.
+        """
+        self.entries = entries
+        self.complete = complete
+        self.bytes = sum(size for _, _, size in entries)
+        self.loaded_at = now
+        self.used_at = now
+
+
+class RecentMessages:
+    """
+    @brief Read-through cache of the newest `size` messages per chat with memory accounting.
+    @details The size of a message is the length of its JSON encoding. Every state
+             change happens under one lock, since MessageView reads from request threads
+             while the socket handlers append from the event loop. A window loaded while
+             messages are appended to its chat is not stored, as the load may have missed
+             them.
+    """
+
+    def __init__(self, enabled=True, size=50, max_bytes=64 * 1024 * 1024, idle=600, ttl=300):
+        """
+        @brief Initializes the cache.
+        @param enabled Whether MessageView serves first pages from the cache.
+        @param size The number of newest messages kept per chat; first pages with a larger
+                    limit go to the database.
+        @param max_bytes The largest total size of the cached messages.
+        @param idle Seconds without a read or an append after which a chat is dropped.
+        @param ttl Seconds a window is trusted after it was read from the database.
+        """
+        self.enabled = enabled
+        self.size = size
+        self.max_bytes = max_bytes
+        self.idle = idle
+        self.ttl = ttl
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.appended = 0
+        self.evictions = 0
+        self.idle_evictions = 0
+        self._windows = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        """
+        @brief Builds the cache from the RECENT_MESSAGES setting.
+        @return RecentMessages The configured cache.
+        """
+        options = getattr(settings, "RECENT_MESSAGES", {})
+        return cls(
+            enabled=options.get("ENABLED", False),
+            size=options.get("SIZE", 50),
+            max_bytes=options.get("MAX_BYTES", 64 * 1024 * 1024),
+            idle=options.get("IDLE", 600),
+            ttl=options.get("TTL", 300),
+        )
+
+    def _drop(self, chat_pk):
+        """
+        @brief Removes a chat's window; the lock must be held.
+        @param chat_pk The chat's primary key.
+        """
+        window = self._windows.pop(chat_pk, None)
+        if window is not None:
+            self.bytes -= window.bytes
+
+    def _evict(self, now):
+        """
+        @brief Drops idle windows and, while over `max_bytes`, the least recently used
+               ones; the lock must be held.
+        @param now The current monotonic time.
+        """
+        while self._windows:
+            chat_pk, window = next(iter(self._windows.items()))
+            if self.bytes > self.max_bytes:
+                self.evictions += 1
+            elif now - window.used_at > self.idle:
+                self.idle_evictions += 1
+            else:
+                break
+            self._drop(chat_pk)
+
+    def _page(self, entries, complete, limit, paginator):
+        """
+        @brief Builds the first page of a chat from its window.
+        @param entries The window's entries, oldest first.
+        @param complete Whether the chat has no messages older than the window.
+        @param limit The page size.
+        @param paginator MessageView's paginator, used to encode the cursors.
+        @return KeysetPage The page, with serialized messages as rows.
+        """
+        has_more = len(entries) > limit or not complete
+        entries = entries[-limit:]
+        if not entries:
+            return KeysetPage([], None, None, has_more)
+        return KeysetPage(
+            [message for _, message, _ in entries],
+            paginator.encode_cursor(dict(zip(KEY_FIELDS, entries[0][0]))),
+            paginator.encode_cursor(dict(zip(KEY_FIELDS, entries[-1][0]))),
+            has_more,
+        )
+
+    def page(self, chat_pk, queryset, paginator, request):
+        """
+        @brief Returns the first page of a chat's history, from the cache when possible.
+        @details Requests with a cursor or a limit above `size` are left to the paginator.
+                 A miss reads the chat's newest `size` messages in one query and caches them.
+        @param chat_pk The chat's primary key.
+        @param queryset The chat's messages.
+        @param paginator MessageView's paginator.
+        @param request The HTTP request object.
+        @return KeysetPage The page, with serialized messages as rows, or None if the
+                           request is not served by the cache.
+        @throws ValidationError if the limit is invalid.
+        """
+        params = request.query_params
+        if not self.enabled or params.get("before") or params.get("after"):
+            return None
+        limit = paginator.get_limit(request)
+        now = time.monotonic()
+        with self._lock:
+            if limit > self.size:
+                self.bypasses += 1
+                return None
+            window = self._windows.get(chat_pk)
+            if window is not None and now - window.loaded_at > self.ttl:
+                self._drop(chat_pk)
+                window = None
+            if window is not None and (len(window.entries) >= limit or window.complete):
+                self.hits += 1
+                window.used_at = now
+                self._windows.move_to_end(chat_pk)
+                self._evict(now)
+                return self._page(list(window.entries), window.complete, limit, paginator)
+            self.misses += 1
+            self._loading[chat_pk] = False
+
+        rows = list(queryset.values(*MESSAGE_VALUES).order_by("-created_at", "-id")[:self.size + 1])
+        complete = len(rows) <= self.size
+        rows = rows[:self.size]
+        rows.reverse()
+        entries = [
+            ((row["created_at"], row["id"]), message, len(jsoncodec.dumpb(message)))
+            for row, message in zip(rows, serializeValues(rows, messageFromValues))
+        ]
+        with self._lock:
+            if self._loading.pop(chat_pk, True) is False:
+                self._drop(chat_pk)
+                window = self._windows[chat_pk] = RecentWindow(entries, complete, now)
+                self.bytes += window.bytes
+                self._evict(now)
+        return self._page(entries, complete, limit, paginator)
+
+    def holds(self, chat_pk):
+        """
+        @brief Tells whether appending to a chat would update the cache.
+        @param chat_pk The chat's primary key.
+        @return bool True if the chat's window is cached or being loaded.
+        """
+        with self._lock:
+            return chat_pk in self._windows or chat_pk in self._loading
+
+    def append(self, chat_pk, message, payload):
+        """
+        @brief Adds a new message to its chat's window, if the chat is cached.
+        @details Messages already in the window are ignored, so the socket handler and the
+                 post_save signal may both report the same message.
+        @param chat_pk The chat's primary key.
+        @param message The ChatMessage, for its `created_at` and id.
+        @param payload The serialized message.
+        @return bool True if the window changed.
+        """
+        if not self.holds(chat_pk):
+            return False
+        key = (message.created_at, message.id)
+        payload = dict(payload)
+        size = len(jsoncodec.dumpb(payload))
+        now = time.monotonic()
+        with self._lock:
+            if chat_pk in self._loading:
+                self._loading[chat_pk] = True
+            window = self._windows.get(chat_pk)
+            if window is None:
+                return False
+            entries = window.entries
+            index = bisect.bisect_left(entries, key, key=lambda entry: entry[0])
+            if index < len(entries) and entries[index][0] == key:
+                return False
+            if index == 0 and entries and not window.complete:
+                # Older than the window: it does not change the newest messages.
+                return False
+            entries.insert(index, (key, payload, size))
+            window.bytes += size
+            self.bytes += size
+            while len(entries) > self.size:
+                _, _, dropped = entries.pop(0)
+                window.bytes -= dropped
+                self.bytes -= dropped
+                window.complete = False
+            window.used_at = now
+            self._windows.move_to_end(chat_pk)
+            self.appended += 1
+            self._evict(now)
+        return True
+
+    def invalidate(self, chat_pk):
+        """
+        @brief Drops a chat's window, so the next first page reads it again.
+        @param chat_pk The chat's primary key.
+        """
+        with self._lock:
+            self._drop(chat_pk)
+            if chat_pk in self._loading:
+                self._loading[chat_pk] = True
+
+    def clear(self):
+        """
+        @brief Empties the cache and resets the counters.
+        """
+        with self._lock:
+            self._windows.clear()
+            self._loading.clear()
+            self.bytes = self.hits = self.misses = self.bypasses = self.appended = 0
+            self.evictions = self.idle_evictions = 0
+
+    def stats(self):
+        """
+        @brief Returns the cache's counters.
+        @return dict Cached chats and bytes, first page hits, misses and bypasses, the hit
+                     ratio, appended messages and evictions for memory and idleness.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "chats": len(self._windows),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypasses": self.bypasses,
+                "hit_ratio": self.hits / lookups if lookups else None,
+                "appended": self.appended,
+                "evictions": self.evictions,
+                "idle_evictions": self.idle_evictions,
+            }
+
+
+recent_messages = RecentMessages.from_settings()
+""" @brief The process-wide recent messages cache used by MessageView and the write paths. """
+
+metrics.register("recent_messages", recent_messages.stats)
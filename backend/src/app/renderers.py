@@ -0,0 +1,37 @@
+"""
+@file renderers.py
+@brief DRF renderers of the application.
+@details This file contains FastJSONRenderer, the default JSON renderer of the REST API,
+         which encodes responses with the codec in jsoncodec.py.
+"""
+
+from rest_framework.renderers import JSONRenderer
+from . import jsoncodec
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    @brief JSON renderer backed by the fast codec.
+    @details Produces the same compact UTF-8 output as DRF's JSONRenderer. Requests asking
+             for indented output, e.g. `Accept: application/json; indent=4`, are rendered
+             by the stock renderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """
+        @brief Renders `data` into JSON.
+        @param data The response data.
+        @param accepted_media_type The negotiated media type.
+        @param renderer_context The view, request and response of the render.
+        @return bytes The JSON bytestring.
+        """
+        if data is None:
+            return b""
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = jsoncodec.dumpb(data)
+        # Like JSONRenderer, escape U+2028 and U+2029 so the output is a strict JavaScript subset.
+        if b"\xe2\x80\xa8" in ret or b"\xe2\x80\xa9" in ret:
+            ret = ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+        return ret
@@ -0,0 +1,114 @@
+"""
+@file search.py
+@brief Prefix search over usernames and names for the user directory.
+@details This file contains the helpers that maintain the UserSearchTerm index and the
+         ranked prefix search used by ListUsers. A query is split into words; every word
+         must be a prefix of one of the user's normalized names. Results are ranked by
+         username, then first name, then last name prefix matches, and within a rank by
+         the matched name, so an exact match comes first.
+"""
+
+import unicodedata
+from django.db.models import Exists, OuterRef
+from .models import UserSearchTerm
+
+SEARCH_FIELDS = frozenset(["username", "first_name", "last_name"])
+"""
+@brief The user fields the search terms are built from.
+"""
+
+PREFIX_END = "\U0010ffff"
+"""
+@brief Character sorting after every other, used to turn a prefix into a range.
+"""
+
+
+def normalize(text):
+    """
+    @brief Normalizes a name for indexing and searching.
+    @details Lowercases the text and strips accents, so "José" is found by "jose".
+    @param text The text to normalize.
+    @return str The normalized text.
+    """
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower().strip()
+
+
+def userSearchTerms(user):
+    """
+    @brief Builds the search terms of a user.
+    @param user The user to index.
+    @return list The unsaved UserSearchTerm rows of the user.
+    """
+    names = (
+        (UserSearchTerm.USERNAME, user.username),
+        (UserSearchTerm.FIRST_NAME, user.first_name),
+        (UserSearchTerm.LAST_NAME, user.last_name),
+    )
+    return [
+        UserSearchTerm(user_id=user.pk, kind=kind, term=normalize(name)[:150])
+        for kind, name in names
+        if normalize(name)
+    ]
+
+
+def indexUsers(users):
+    """
+    @brief Replaces the search terms of the given users.
+    @param users The users to (re)index.
+    @return int The number of terms written.
+    """
+    users = list(users)
+    written = 0
+    for start in range(0, len(users), 500):
+        chunk = users[start:start + 500]
+        UserSearchTerm.objects.filter(user__in=[user.pk for user in chunk]).delete()
+        terms = [term for user in chunk for term in userSearchTerms(user)]
+        UserSearchTerm.objects.bulk_create(terms)
+        written += len(terms)
+    return written
+
+
+def prefixRange(word, prefix=""):
+    """
+    @brief Builds the range lookup matching terms that start with a word.
+    @param word The normalized word.
+    @param prefix The lookup path to the term field, e.g. "search_terms__".
+    @return dict The `term__gte`/`term__lt` lookup arguments.
+    """
+    return {f"{prefix}term__gte": word, f"{prefix}term__lt": word + PREFIX_END}
+
+
+def searchTerms(query, excluded=()):
+    """
+    @brief Finds the search terms matching a query, one per user, in rank order.
+    @details Each matching user is represented by their best ranked matching term: the
+             username before the first name before the last name. Ordered by
+             (kind, term, user) the rows come straight off the term index, so the first
+             page costs the same however many users match. Further words of the query
+             must match one of the user's terms too.
+    @param query The raw search string.
+    @param excluded Querysets of user ids (`.values(...)`) to leave out of the results.
+    @return QuerySet The matching UserSearchTerm rows with their users joined in,
+                     or None if the query has no words.
+    """
+    words = normalize(query).split()
+    if not words:
+        return None
+
+    better_match = UserSearchTerm.objects.filter(
+        user=OuterRef("user"), kind__lt=OuterRef("kind"), **prefixRange(words[0])
+    )
+    terms = (
+        UserSearchTerm.objects.filter(kind__in=[kind for kind, _ in UserSearchTerm.KIND_CHOICES])
+        .filter(**prefixRange(words[0]))
+        .exclude(Exists(better_match))
+        .select_related("user")
+    )
+    for word in words[1:]:
+        terms = terms.filter(Exists(
+            UserSearchTerm.objects.filter(user=OuterRef("user"), **prefixRange(word))
+        ))
+    for ids in excluded:
+        terms = terms.exclude(user_id__in=ids)
+    return terms
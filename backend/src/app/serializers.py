@@ -5,9 +5,32 @@
          field definitions, validation logic, and nested user serializers.
 """
 
-from rest_framework.serializers import ModelSerializer, ValidationError
+from rest_framework.serializers import ModelSerializer, ValidationError, IntegerField, CharField, SlugRelatedField, Field
 from .models import IntrestRequest, Chat, ChatMessage
-from authentication.serializers import userSerializer
+from .profilecache import profile_cache
+
+class ProfileField(Field):
+    """
+    @brief Read-only field serializing a related user through the profile cache.
+    @details Produces the same output as a nested read-only userSerializer, but each
+             profile is serialized once per profile version instead of once per row.
+    """
+
+    def __init__(self, **kwargs):
+        """
+        @brief Initializes the field as read-only.
+        @param kwargs Keyword arguments passed to Field.
+        """
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        """
+        @brief Returns the cached profile of a user.
+        @param value The related user.
+        @return dict The user's serialized profile.
+        """
+        return profile_cache.get(value)
 
 class IntrestRequestSerializer(ModelSerializer):
     """
@@ -16,18 +39,18 @@ class IntrestRequestSerializer(ModelSerializer):
              IntrestRequest instances, including validation and nested user serializers.
     """
     
-    request_to = userSerializer(read_only=True)
+    request_to = ProfileField()
     """
     @brief The user who receives the request.
     @details This field represents the user to whom the interest request is sent. 
-             It is a read-only field and uses the userSerializer to serialize the user data.
+             It is a read-only field serialized through the profile cache.
     """
     
-    request_from = userSerializer(read_only=True)
+    request_from = ProfileField()
     """
     @brief The user who sends the request.
     @details This field represents the user who initiates the interest request. 
-             It is a read-only field and uses the userSerializer to serialize the user data.
+             It is a read-only field serialized through the profile cache.
     """
     
     class Meta:
@@ -79,11 +102,11 @@ class MessageSerializer(ModelSerializer):
     @details This serializer handles the serialization of chat messages, excluding the 'chat' field.
     """
     
-    sender = userSerializer(read_only=True)
+    sender = ProfileField()
     """
     @brief The user who sent the message.
     @details This field represents the user who sent the chat message. 
-             It is a read-only field and uses the userSerializer to serialize the user data.
+             It is a read-only field serialized through the profile cache.
     """
     
     class Meta:
@@ -99,24 +122,55 @@ class MessageSerializer(ModelSerializer):
         exclude = ("chat",)
         """ @brief Fields to exclude from the serialized output. """
 
+class MessageSearchSerializer(MessageSerializer):
+    """
+    @brief Serializer for a message found by the message search.
+    @details Extends the MessageSerializer with the chat the message belongs to and a
+             snippet of the matching text.
+    """
+
+    chat = SlugRelatedField(slug_field="short_id", read_only=True)
+    """
+    @brief The short ID of the chat the message belongs to.
+    """
+
+    snippet = CharField(read_only=True)
+    """
+    @brief The matching part of the text, with matches wrapped in `[` and `]`.
+    @details Read from the `snippet` column added by the search queryset.
+    """
+
+    class Meta:
+        """
+        @brief Meta options for the MessageSearchSerializer.
+        @details This inner class defines the model being serialized and the fields to include
+                 in the serialized representation.
+        """
+
+        model = ChatMessage
+        """ @brief The model being serialized. """
+
+        fields = ["id", "chat", "sender", "text", "created_at", "snippet"]
+        """ @brief The fields to include in the serialized output. """
+
 class ChatSerializer(ModelSerializer):
     """
     @brief Serializer for the Chat model.
     @details This serializer handles the serialization of Chat instances, including nested user data.
     """
     
-    initiator = userSerializer(read_only=True)
+    initiator = ProfileField()
     """
     @brief The user who initiated the chat.
     @details This field represents the user who initiated the chat. 
-             It is a read-only field and uses the userSerializer to serialize the user data.
+             It is a read-only field serialized through the profile cache.
     """
     
-    acceptor = userSerializer(read_only=True)
+    acceptor = ProfileField()
     """
     @brief The user who accepted the chat.
     @details This field represents the user who accepted the chat request. 
-             It is a read-only field and uses the userSerializer to serialize the user data.
+             It is a read-only field serialized through the profile cache.
     """
     
     class Meta:
@@ -140,3 +194,30 @@ class ChatSerializer(ModelSerializer):
         @return Returns the validated data.
         """
         return data
+
+class InboxSerializer(ChatSerializer):
+    """
+    @brief Serializer for a chat as shown in the inbox.
+    @details Extends the ChatSerializer with the chat's last message, its last activity
+             time and the requesting user's unread count.
+    """
+
+    last_message = MessageSerializer(read_only=True)
+    """
+    @brief The most recent message of the chat, or None for a chat without messages.
+    """
+
+    unread_count = IntegerField(read_only=True)
+    """
+    @brief The number of messages the requesting user has not read yet.
+    @details Read from the `unread_count` annotation added by the inbox queryset.
+    """
+
+    class Meta(ChatSerializer.Meta):
+        """
+        @brief Meta options for the InboxSerializer.
+        @details Adds the inbox fields to the ChatSerializer's fields.
+        """
+
+        fields = ChatSerializer.Meta.fields + ["last_message", "last_activity_at", "unread_count"]
+        """ @brief The fields to include in the serialized output. """
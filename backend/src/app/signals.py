@@ -7,12 +7,17 @@
 """
 
 from .models import IntrestRequest
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
-from .models import Chat
+from .models import Chat, ChatMessage
 from .sockets import sio
-from .serializers import ChatSerializer
+from .serializers import ChatSerializer, MessageSerializer
+from .chatcache import chat_cache
+from .recentmessages import recent_messages
+from .inbox import createReadPositions, recordLastMessages, recordUnread
+from .search import SEARCH_FIELDS, indexUsers
+from .profilecache import profile_cache
 
 User = get_user_model()
 
@@ -40,4 +45,125 @@ def addFriend(sender, instance, **kwargs):
 
     # Add both users as friends
     instance.request_to.friends.add(instance.request_from)
-    instance.request_from.friends.add(instance.request_to)
\ No newline at end of file
+    instance.request_from.friends.add(instance.request_to)
+
+@receiver(post_save, sender=Chat)
+@receiver(post_delete, sender=Chat)
+def invalidateChatCache(sender, instance, **kwargs):
+    """
+    @brief Drops a chat from the chat metadata and recent messages caches when it is
+           saved or deleted.
+    @details Keeps the socket handlers and MessageView from serving a stale or
+             deleted chat out of the cache.
+
+    @param sender The model class that sent the signal (Chat).
+    @param instance The Chat instance being saved or deleted.
+    @param kwargs Additional keyword arguments passed to the signal.
+    """
+    chat_cache.invalidate(instance.short_id)
+    recent_messages.invalidate(instance.pk)
+
+@receiver(post_save, sender=Chat)
+def addReadPositions(sender, instance, created, **kwargs):
+    """
+    @brief Creates the read positions of both participants of a new chat.
+
+    @param sender The model class that sent the signal (Chat).
+    @param instance The Chat instance being saved.
+    @param created Whether the chat was just created.
+    @param kwargs Additional keyword arguments passed to the signal.
+    """
+    if created:
+        createReadPositions([instance])
+
+@receiver(post_save, sender=ChatMessage)
+def updateLastMessage(sender, instance, created, **kwargs):
+    """
+    @brief Records a new message as its chat's last message.
+    @details Messages inserted in bulk by the write-behind queue do not send this signal;
+             the queue records them itself after each batch.
+
+    @param sender The model class that sent the signal (ChatMessage).
+    @param instance The ChatMessage instance being saved.
+    @param created Whether the message was just created.
+    @param kwargs Additional keyword arguments passed to the signal.
+    """
+    if created:
+        recordLastMessages([instance])
+
+@receiver(post_save, sender=ChatMessage)
+def updateUnreadCounts(sender, instance, created, **kwargs):
+    """
+    @brief Counts a new message as unread for the other participant.
+    @details Also moves the sender's read position to the message. Messages inserted in
+             bulk by the write-behind queue do not send this signal; the queue records
+             them itself after each batch.
+
+    @param sender The model class that sent the signal (ChatMessage).
+    @param instance The ChatMessage instance being saved.
+    @param created Whether the message was just created.
+    @param kwargs Additional keyword arguments passed to the signal.
+    """
+    if created:
+        recordUnread([instance])
+
+@receiver(post_save, sender=ChatMessage)
+def appendRecentMessage(sender, instance, created, **kwargs):
+    """
+    @brief Adds a new message to its chat's cached newest messages.
+    @details Only chats whose newest messages are cached pay for serializing the message.
+             Messages inserted in bulk by the write-behind queue do not send this signal;
+             the socket handler appends them itself. An edited message drops the window.
+
+    @param sender The model class that sent the signal (ChatMessage).
+    @param instance The ChatMessage instance being saved.
+    @param created Whether the message was just created.
+    @param kwargs Additional keyword arguments passed to the signal.
+    """
+    if not created:
+        recent_messages.invalidate(instance.chat_id)
+    elif recent_messages.holds(instance.chat_id):
+        recent_messages.append(instance.chat_id, instance, MessageSerializer(instance).data)
+
+@receiver(post_delete, sender=ChatMessage)
+def dropRecentMessages(sender, instance, **kwargs):
+    """
+    @brief Drops the cached newest messages of a chat one of whose messages was deleted.
+
+    @param sender The model class that sent the signal (ChatMessage).
+    @param instance The ChatMessage instance being deleted.
+    @param kwargs Additional keyword arguments passed to the signal.
+    """
+    recent_messages.invalidate(instance.chat_id)
+
+@receiver(post_save, sender=User)
+def indexUserSearchTerms(sender, instance, update_fields=None, **kwargs):
+    """
+    @brief Keeps a user's search terms in sync with their username and names.
+    @details Saves limited by `update_fields` to other fields, such as `last_login` on
+             every login, leave the terms alone. Terms of deleted users are removed by the
+             cascade on UserSearchTerm.user.
+
+    @param sender The model class that sent the signal (User).
+    @param instance The User instance being saved.
+    @param update_fields The fields being saved, or None for all of them.
+    @param kwargs Additional keyword arguments passed to the signal.
+    """
+    if update_fields is not None and not SEARCH_FIELDS & set(update_fields):
+        return
+    indexUsers([instance])
+
+@receiver(post_save, sender=User)
+def invalidateProfileCache(sender, instance, created, **kwargs):
+    """
+    @brief Drops the superseded cached profile of a user whose profile changed.
+    @details Saving a profile field bumps `profile_version`, so later lookups already miss
+             the old entry; dropping it frees the space straight away.
+
+    @param sender The model class that sent the signal (User).
+    @param instance The User instance being saved.
+    @param created Whether the user was just created.
+    @param kwargs Additional keyword arguments passed to the signal.
+    """
+    if not created and instance.profile_version > 1:
+        profile_cache.invalidate(instance.pk, instance.profile_version - 1)
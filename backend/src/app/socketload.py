@@ -0,0 +1,398 @@
+"""
+@file socketload.py
+@brief In-process Socket.IO load generator for the chat server.
+@details This file contains the pieces behind the `bench_socket_fanout` command: a
+         minimal Socket.IO client speaking the Engine.IO v4 websocket protocol straight
+         to an ASGI application, a client manager backed by an in-memory fake Redis, and
+         the fan-out run itself. Nothing listens on a port and no Redis server is needed:
+         every frame goes through the real `socketio.ASGIApp`, the server's handlers and
+         the pub/sub client manager, so the measured latency covers the whole server path.
+"""
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+import socketio
+from socketio import packet
+from .benchmarks import percentiles
+from authentication.tokens import VersionedRefreshToken
+
+try:
+    import fakeredis
+except ImportError:  # pragma: no cover
+    fakeredis = None
+
+ENGINEIO_OPEN, ENGINEIO_PING, ENGINEIO_PONG, ENGINEIO_MESSAGE = "0", "2", "3", "4"
+""" @brief The Engine.IO packet types used over the websocket transport. """
+
+
+class FakeRedisManager(socketio.AsyncRedisManager):
+    """
+    @brief AsyncRedisManager publishing through an in-memory fake Redis server.
+    @details Keeps the production manager's pub/sub round trip, serialization included,
+             while needing no Redis server. Requires the `fakeredis` package.
+    """
+
+    def __init__(self, channel="socketio"):
+        """
+        @brief Initializes the manager with its own fake Redis server.
+        @param channel The pub/sub channel name.
+        """
+        if fakeredis is None:
+            raise RuntimeError("the fake Redis manager needs the fakeredis package")
+        super().__init__(url="redis://fakeredis", channel=channel)
+        self.fake_server = fakeredis.FakeServer()
+
+    def _redis_connect(self):
+        """
+        @brief Connects to the fake Redis server instead of a real one.
+        """
+        # redis-py 6+ caps async pools at 100 connections; concurrent publishes need more.
+        self.redis = fakeredis.aioredis.FakeRedis(server=self.fake_server, max_connections=2 ** 31)
+        self.pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        self.connected = True
+
+    async def ready(self, timeout=5.0):
+        """
+        @brief Waits until the listener has subscribed to the channel.
+        @details Events published before the subscription would be lost.
+        @param timeout The longest time to wait, in seconds.
+        """
+        deadline = time.perf_counter() + timeout
+        while not (self.pubsub is not None and self.pubsub.subscribed):
+            if time.perf_counter() > deadline:
+                raise TimeoutError("the fake Redis listener did not subscribe")
+            await asyncio.sleep(0.01)
+
+
+def makeManager(kind):
+    """
+    @brief Builds the client manager a load run uses.
+    @param kind `"fakeredis"` for the Redis pub/sub path over a fake Redis, `"memory"` for
+                the in-process manager, or a `redis://` URL for a real server.
+    @return AsyncManager The manager.
+    """
+    if kind == "memory":
+        return socketio.AsyncManager()
+    if kind == "fakeredis":
+        return FakeRedisManager()
+    return socketio.AsyncRedisManager(kind)
+
+
+@asynccontextmanager
+async def usingManager(server, manager):
+    """
+    @brief Swaps a server's client manager for the duration of a block.
+    @details Stops the manager's listener and the server's background tasks on exit and
+             puts the original manager back.
+    @param server The AsyncServer.
+    @param manager The manager to use, not yet attached to a server.
+    """
+    original = server.manager, server.manager_initialized
+    server.manager = manager
+    server.manager_initialized = False
+    manager.set_server(server)
+    try:
+        yield manager
+    finally:
+        thread = getattr(manager, "thread", None)
+        if thread is not None:
+            thread.cancel()
+            # A redis client can swallow the cancellation while reading; don't wait forever.
+            await asyncio.wait([thread], timeout=1.0)
+        if server.eio.service_task_handle is not None:
+            # Engine.IO's shutdown() fails once its service task is gone.
+            await server.shutdown()
+        server.manager, server.manager_initialized = original
+
+
+class LoadClient:
+    """
+    @brief Socket.IO client connected to an ASGI application in process.
+    @details Drives one websocket connection of the ASGI app through its `receive` and
+             `send` callables. Received events are passed to `on_event` with the time they
+             were handed to the transport; runFanout() sets `joined` once the client
+             receives a `message:notification`.
+    """
+
+    def __init__(self, app, on_event=None):
+        """
+        @brief Initializes a disconnected client.
+        @param app The ASGI application, e.g. `socketio.ASGIApp(sio)`.
+        @param on_event Callable `(client, event, data, received_at)` for every event.
+        """
+        self.app = app
+        self.on_event = on_event
+        self.sid = None
+        self.error = None
+        self.joined = False
+        self._inbox = asyncio.Queue()
+        self._connected = asyncio.Event()
+        self._task = None
+
+    async def _receive(self):
+        """
+        @brief ASGI receive callable: hands the server the next frame sent by the client.
+        """
+        return await self._inbox.get()
+
+    async def _send(self, message):
+        """
+        @brief ASGI send callable: handles a message from the server.
+        @param message The ASGI message.
+        """
+        if message["type"] == "websocket.close":
+            self.error = self.error or message.get("reason")
+            self._connected.set()
+            return
+        if message["type"] != "websocket.send":
+            return
+        frame = message.get("text")
+        if frame is None or not frame:
+            return
+        if frame[0] == ENGINEIO_PING:
+            self._push(ENGINEIO_PONG + frame[1:])
+        elif frame[0] == ENGINEIO_OPEN:
+            self._push(ENGINEIO_MESSAGE + packet.Packet(packet.CONNECT, data=self._auth).encode())
+        elif frame[0] == ENGINEIO_MESSAGE:
+            received_at = time.perf_counter()
+            pkt = packet.Packet(encoded_packet=frame[1:])
+            if pkt.packet_type == packet.CONNECT:
+                self.sid = pkt.data.get("sid")
+                self._connected.set()
+            elif pkt.packet_type == packet.CONNECT_ERROR:
+                self.error = pkt.data
+                self._connected.set()
+            elif pkt.packet_type == packet.EVENT and self.on_event is not None:
+                self.on_event(self, pkt.data[0], pkt.data[1] if len(pkt.data) > 1 else None, received_at)
+
+    def _push(self, frame):
+        """
+        @brief Queues a text frame for the server.
+        @param frame The Engine.IO frame.
+        """
+        self._inbox.put_nowait({"type": "websocket.receive", "text": frame})
+
+    async def connect(self, auth, timeout=10.0):
+        """
+        @brief Opens the websocket and connects to the default namespace.
+        @param auth The Socket.IO auth payload, e.g. `{"token": <access token>}`.
+        @param timeout The longest time to wait for the server's answer, in seconds.
+        @throws ConnectionError if the server refuses the connection.
+        """
+        self._auth = auth
+        scope = {
+            "type": "websocket",
+            "path": "/socket.io/",
+            "query_string": b"EIO=4&transport=websocket",
+            "headers": [(b"upgrade", b"websocket"), (b"connection", b"Upgrade")],
+        }
+        self._inbox.put_nowait({"type": "websocket.connect"})
+        self._task = asyncio.ensure_future(self.app(scope, self._receive, self._send))
+        await asyncio.wait_for(self._connected.wait(), timeout)
+        if self.sid is None:
+            raise ConnectionError(f"connection refused: {self.error}")
+
+    def emit(self, event, data):
+        """
+        @brief Sends an event to the server.
+        @param event The event name.
+        @param data The event payload.
+        """
+        self._push(ENGINEIO_MESSAGE + packet.Packet(packet.EVENT, data=[event, data]).encode())
+
+    async def disconnect(self):
+        """
+        @brief Closes the websocket and waits for the server to finish with it.
+        """
+        if self._task is None:
+            return
+        self._inbox.put_nowait({"type": "websocket.disconnect", "code": 1000})
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+
+def planClients(users, chats, count, idle=0):
+    """
+    @brief Spreads simulated clients over chats, as participants of those chats.
+    @details Client i joins chat i mod len(chats) as its initiator or acceptor, alternating
+             on every pass over the chats, so a chat can have several connections per user.
+             Idle clients connect as the given users in turn but join no chat.
+    @param users The users, including every chat's participants.
+    @param chats The chats to spread the clients over.
+    @param count The number of clients joining a chat.
+    @param idle The number of extra clients that only connect.
+    @return list The `(token, chat_id)` pairs for runFanout(), with a None chat_id for
+                 the idle clients.
+    """
+    by_id = {user.pk: user for user in users}
+    tokens = {}
+
+    def token(user):
+        if user.pk not in tokens:
+            tokens[user.pk] = str(VersionedRefreshToken.for_user(user).access_token)
+        return tokens[user.pk]
+
+    plan = []
+    for index in range(count):
+        chat = chats[index % len(chats)]
+        user_id = chat.initiator_id if index // len(chats) % 2 == 0 else chat.acceptor_id
+        plan.append((token(by_id[user_id]), chat.short_id))
+    for index in range(idle):
+        plan.append((token(users[index % len(users)]), None))
+    return plan
+
+
+async def paced(count, rate, start, action):
+    """
+    @brief Calls an action `count` times at a steady rate.
+    @param count The number of calls.
+    @param rate The calls per second.
+    @param start The `time.perf_counter()` value of the first call.
+    @param action Callable taking the call's index.
+    """
+    for index in range(count):
+        delay = start + index / rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        action(index)
+        if index % 64 == 63:
+            await asyncio.sleep(0)
+
+
+async def runFanout(app, server, manager, plan, rate, duration, settle=2.0, typing_rate=0, stop_every=4,
+                    join_timeout=30.0):
+    """
+    @brief Connects the planned clients, has them join their chats and sends messages at a rate.
+    @details Every message carries a sequence number; its expected deliveries are the
+             clients joined to its chat. Delivery latency runs from the moment the event is
+             handed to the server to the moment the server writes it to a recipient's
+             transport. Messages still undelivered `settle` seconds after the last send
+             count as lost. CPU time is the whole process's, clients included.
+             With a `typing_rate`, clients also send typing events like keystrokes while
+             the messages go out: `typing:start`, with a `typing:stop` every `stop_every`
+             events of a client.
+    @param app The ASGI application.
+    @param server The AsyncServer behind the application.
+    @param manager The client manager to use for the run, from makeManager().
+    @param plan A list of `(token, chat_id)` pairs, one per client; clients with a None
+                chat_id stay connected without joining a chat.
+    @param rate The target number of messages sent per second, over all clients.
+    @param duration The number of seconds to send for.
+    @param settle The seconds to wait for outstanding deliveries after the last send.
+    @param typing_rate The typing events sent per second, over all clients.
+    @param stop_every Every how many typing events of a client one is a `typing:stop`.
+    @param join_timeout The longest time to wait for every client's `connect:chat` to be
+                        acknowledged and the fan-out of the joins to finish, in seconds.
+    @return dict Connection, join, delivery, loss, notification, typing and CPU figures.
+    """
+    sent = {}
+    delivered = {}
+    samples = []
+    notifications = [0]
+    typing_updates = [0]
+    members = {}
+
+    received = [0]
+
+    def onEvent(client, event, data, received_at):
+        received[0] += 1
+        if event == "message:recieve":
+            try:
+                sequence = int(data["text"].split()[1])
+            except (KeyError, IndexError, ValueError, TypeError):
+                return
+            if sequence in sent:
+                samples.append(received_at - sent[sequence])
+                delivered[sequence] = delivered.get(sequence, 0) + 1
+        elif event == "message:notification":
+            notifications[0] += 1
+            client.joined = True
+        elif event == "typing:update":
+            typing_updates[0] += 1
+
+    async with usingManager(server, manager):
+        clients = [LoadClient(app, on_event=onEvent) for _ in plan]
+        connect_start = time.perf_counter()
+        await asyncio.gather(*(client.connect({"token": token}) for client, (token, _) in zip(clients, plan)))
+        connect_seconds = time.perf_counter() - connect_start
+        if isinstance(manager, FakeRedisManager):
+            await manager.ready()
+
+        for client, (_, chat_id) in zip(clients, plan):
+            if chat_id is None:
+                client.joined = True
+                continue
+            client.emit("connect:chat", {"chat_id": chat_id})
+            members.setdefault(chat_id, []).append(client)
+        # Let every join and the notifications it fans out go through before sending.
+        join_start, join_cpu_start = time.perf_counter(), time.process_time()
+        last, deadline = -1, join_start + join_timeout
+        while time.perf_counter() < deadline:
+            if received[0] == last and all(client.joined for client in clients):
+                break
+            last = received[0]
+            await asyncio.sleep(0.1)
+        # The last 0.1s poll only confirmed that nothing else arrived.
+        join_seconds = max(0.0, time.perf_counter() - join_start - 0.1)
+        join_cpu = time.process_time() - join_cpu_start
+
+        chats = list(members)
+        total = max(1, int(rate * duration))
+        typing_total = int(typing_rate * duration)
+
+        def sendMessage(sequence):
+            chat_id = chats[sequence % len(chats)]
+            senders = members[chat_id]
+            sent[sequence] = time.perf_counter()
+            senders[sequence // len(chats) % len(senders)].emit(
+                "message:send", {"chat_id": chat_id, "message": f"load {sequence}"}
+            )
+
+        typists = [(client, chat_id) for client, (_, chat_id) in zip(clients, plan) if chat_id is not None]
+
+        def sendTyping(index):
+            client, chat_id = typists[index % len(typists)]
+            event = "typing:stop" if index // len(typists) % stop_every == stop_every - 1 else "typing:start"
+            client.emit(event, {"chat_id": chat_id})
+
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        typing = asyncio.ensure_future(paced(typing_total, typing_rate or 1, wall_start, sendTyping))
+        await paced(total, rate, wall_start, sendMessage)
+        send_seconds = time.perf_counter() - wall_start
+        await typing
+
+        expected = sum(len(members[chats[sequence % len(chats)]]) for sequence in sent)
+        deadline = time.perf_counter() + settle
+        while len(samples) < expected and time.perf_counter() < deadline:
+            await asyncio.sleep(0.01)
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+
+        await asyncio.gather(*(client.disconnect() for client in clients))
+
+    return {
+        "clients": len(plan),
+        "idle_clients": len(plan) - len(typists),
+        "chats": len(chats),
+        "connect_seconds": round(connect_seconds, 3),
+        "join_seconds": round(join_seconds, 3),
+        "join_cpu_seconds": round(join_cpu, 3),
+        "messages": len(sent),
+        "target_rate": rate,
+        "send_rate": round(len(sent) / send_seconds, 1) if send_seconds else None,
+        "expected_deliveries": expected,
+        "deliveries": len(samples),
+        "lost": expected - len(samples),
+        "loss_ratio": round((expected - len(samples)) / expected, 6) if expected else 0,
+        "messages_fully_delivered": sum(
+            1 for sequence, count in delivered.items()
+            if count >= len(members[chats[sequence % len(chats)]])
+        ),
+        "notifications": notifications[0],
+        "typing_events": typing_total,
+        "typing_updates": typing_updates[0],
+        "cpu_seconds": round(cpu, 3),
+        "cpu_percent": round(cpu / wall * 100, 1) if wall else None,
+        "latency": percentiles(samples),
+    }
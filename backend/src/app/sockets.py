@@ -7,10 +7,25 @@
 
 import socketio
 import json
-from asgiref.sync import sync_to_async
 from .serializers import MessageSerializer, ChatSerializer
 from django.contrib.auth import get_user_model
-from .models import ChatMessage, Chat
+from .models import ChatMessage
+from .writebehind import write_behind
+from .chatcache import chat_cache
+from .messagestream import message_stream
+from .recentmessages import recent_messages
+from .readpositions import read_positions
+from django.utils import timezone
+from .profilecache import profile_cache
+from .presence import presence, userRoom
+from .typingindicators import typing_indicators
+from . import jsoncodec
+from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from authentication.tokens import TOKEN_VERSION_CLAIM
+from authentication.usernameindex import username_index
+from asgiref.sync import sync_to_async
 from dotenv import load_dotenv
 from django.conf import settings
 import os
@@ -29,58 +44,276 @@ mgr = socketio.AsyncRedisManager(os.getenv('REDIS_URL') if os.getenv('REDIS_URL'
 """
 @brief Initializes the Socket.IO server.
 @details This sets up the AsyncServer with ASGI mode, allowing cross-origin 
-         requests from any origin.
+         requests from any origin. Packets are encoded with the fast JSON codec.
 """
 sio = socketio.AsyncServer(
-    async_mode="asgi", client_manager=mgr, cors_allowed_origins="*"
+    async_mode="asgi", client_manager=mgr, cors_allowed_origins="*", json=jsoncodec
 )
+presence.attach(sio)
+typing_indicators.attach(sio)
+
+async def startup():
+    """
+    @brief Prepares the socket layer's background services on application startup.
+    @details Re-inserts chat messages spilled by the write-behind queue of a previous process
+             and loads the username index.
+    """
+    await write_behind.recover()
+    await sync_to_async(username_index.load)()
+
+async def shutdown():
+    """
+    @brief Stops the socket layer's background services on application shutdown.
+    @details Drains the write-behind queue so no accepted message is lost, writes the
+             pending read positions and stops the presence and typing indicator tickers.
+    """
+    await write_behind.drain()
+    await read_positions.stop()
+    await presence.stop()
+    await typing_indicators.stop()
+
+async def authenticateToken(token):
+    """
+    @brief Validates a JWT access token and loads the user it was issued to.
+    @details Runs once per Socket.IO connection; the result is kept in the session.
+             The user is loaded with the native async ORM.
+    @param token The raw access token sent by the client.
+    @return User The active user the token belongs to, or None if the token is invalid
+                 or revoked.
+    """
+    try:
+        access = AccessToken(token)
+        user_id = access[jwt_settings.USER_ID_CLAIM]
+    except (TokenError, KeyError):
+        return None
+    user = await User.objects.filter(pk=user_id, is_active=True).afirst()
+    if user is not None and access.get(TOKEN_VERSION_CLAIM, user.token_version) != user.token_version:
+        return None
+    return user
+
+def sessionUser(session):
+    """
+    @brief Rebuilds the connected user from the Socket.IO session without a query.
+    @param session The session saved by the connect handler.
+    @return User An unsaved User instance carrying the id, profile version and profile fields.
+    """
+    return User(pk=session["user_id"], profile_version=session.get("profile_version", 0), **session["user"])
+
+def isParticipant(user_id, chat):
+    """
+    @brief Tells whether a user may join, post to and report reads of a chat.
+    @param user_id The user's primary key.
+    @param chat The chat's ChatMeta, from the chat metadata cache.
+    @return bool True if the user is one of the chat's participants.
+    """
+    return user_id in (chat.initiator_id, chat.acceptor_id)
 
 @sio.on("connect")
 async def connect(sid, env, auth):
     """
     @brief Handles client connections to the Socket.IO server.
-    @details This event handler is triggered when a client successfully connects to the server.
+    @details This event handler is triggered when a client connects to the server. The JWT
+             access token in `auth` is validated once here, and the user's id and serialized
+             profile are stored in the session so later events need no user queries.
     @param sid The session ID for the connected client.
     @param env The environment in which the connection is established.
-    @param auth Authentication data provided by the client, if any.
+    @param auth Authentication data provided by the client, `{"token": <access token>}`.
+    @throws ConnectionRefusedError if the token is missing or invalid.
+    """
+    token = auth.get("token") if isinstance(auth, dict) else None
+    if not token:
+        raise socketio.exceptions.ConnectionRefusedError("authentication required")
+
+    user = await authenticateToken(token)
+    if user is None:
+        raise socketio.exceptions.ConnectionRefusedError("authentication failed")
+
+    await sio.save_session(sid, {
+        "user_id": user.pk,
+        "profile_version": user.profile_version,
+        "user": profile_cache.get(user)
+    })
+
+    if presence.enabled:
+        await sio.enter_room(sid, userRoom(user.pk))
+        await presence.connect(user.pk, sid)
+
+@sio.on("disconnect")
+async def disconnect(sid, *args):
+    """
+    @brief Handles client disconnections.
+    @details Stops the connection's typing indicators and unregisters it from the presence
+             service; the user goes offline once their last connection is gone.
+    @param sid The session ID of the disconnected client.
+    """
+    await typing_indicators.disconnect(sid)
+    if not presence.enabled:
+        return
+    session = await sio.get_session(sid)
+    if session:
+        await presence.disconnect(session["user_id"], sid)
+
+@sio.on("presence:heartbeat")
+async def presenceHeartbeat(sid, data=None):
     """
-    print("Client connected...")
+    @brief Handles a client's presence heartbeat.
+    @details Optional: the server renews the connections it holds by itself, and clients
+             that send it merely renew theirs sooner.
+    @param sid The session ID for the connected client.
+    @param data Unused.
+    """
+    if not presence.enabled:
+        return
+    session = await sio.get_session(sid)
+    presence.heartbeat(session["user_id"], sid)
 
 @sio.on("connect:chat")
 async def connectChat(sid, data):
     """
     @brief Handles a client's request to join a chat room.
     @details This event handler allows a client to join a specific chat room based on the chat ID provided.
+             Only the chat's participants may join; the `message:notification` acknowledging
+             the join goes to the joining connection alone. A client rejoining after a
+             dropped connection passes the id of the last message it saw as `last_id` and
+             is then sent the messages it missed in one `message:replay` event,
+             `{"chat_id", "messages", "truncated"}`. Messages sent while the replay is read
+             may arrive both live and replayed; clients drop duplicates by id. With
+             `truncated` set the client should reload the chat from MessageView.
     @param sid The session ID for the connected client.
-    @param data A dictionary containing the chat ID.
+    @param data A dictionary containing the chat ID and optionally `last_id`.
     """
     data = data
+    session = await sio.get_session(sid)
+
+    chat = await chat_cache.aget(data["chat_id"])
+    if chat is None:
+        await sio.emit("message:error", {"msg": "Chat not found"}, to=sid)
+        return
+    if not isParticipant(session["user_id"], chat):
+        await sio.emit("message:error", {"msg": "Not a member of this chat"}, to=sid)
+        return
 
     await sio.enter_room(sid, data["chat_id"])
     payload = {
         "msg": "Entered the room"
     }
-    await sio.emit("message:notification", payload)
+    await sio.emit("message:notification", payload, to=sid)
+
+    if data.get("last_id") is None or not message_stream.enabled:
+        return
+    try:
+        last_id = int(data["last_id"])
+    except (TypeError, ValueError):
+        await sio.emit("message:error", {"msg": "Invalid last_id"}, to=sid)
+        return
+    messages, truncated = await message_stream.since(chat, last_id)
+    await sio.emit("message:replay", {
+        "chat_id": data["chat_id"],
+        "messages": messages,
+        "truncated": truncated,
+    }, to=sid)
 
 @sio.on("message:send")
 async def messageRecieve(sid, data):
     """
     @brief Handles the reception of a message from a client.
     @details This event handler processes incoming messages, saves them to the database,
-             and broadcasts them to all clients in the relevant chat room.
+             appends them to the chat's replay log and recent messages and broadcasts them
+             to all clients in the relevant chat room.
     @param sid The session ID for the connected client.
-    @param data A dictionary containing the sender's username and the message content.
+    @param data A dictionary containing the chat ID and the message content. The sender
+                is always the authenticated user of the connection, who must be one of
+                the chat's participants.
     """
     data = data
-    sender = await sync_to_async(User.objects.get)(username=data["sender"])
-    chat = await sync_to_async(Chat.objects.get)(short_id=data["chat_id"])
-    
-    message = await sync_to_async(ChatMessage.objects.create, thread_sensitive=True)(
-        chat=chat,
-        sender=sender,
-        text=data["message"]
-    )
+    sender = sessionUser(await sio.get_session(sid))
+    chat = await chat_cache.aget(data["chat_id"])
+    if chat is None:
+        await sio.emit("message:error", {"msg": "Chat not found"}, to=sid)
+        return
+    if not isParticipant(sender.pk, chat):
+        await sio.emit("message:error", {"msg": "Not a member of this chat"}, to=sid)
+        return
+
+    if write_behind.enabled:
+        # Emit straight away; the row is inserted by the write-behind flusher.
+        message = ChatMessage(
+            id=write_behind.ids.next_id(),
+            chat_id=chat.pk,
+            sender=sender,
+            text=data["message"],
+            created_at=timezone.now()
+        )
+        await write_behind.put(message)
+    else:
+        message = await ChatMessage.objects.acreate(
+            chat_id=chat.pk,
+            sender=sender,
+            text=data["message"]
+        )
 
     serializer = MessageSerializer(message)
 
-    await sio.emit("message:recieve", serializer.data, room=data["chat_id"])
\ No newline at end of file
+    recent_messages.append(chat.pk, message, serializer.data)
+    if message_stream.enabled:
+        await message_stream.append(data["chat_id"], serializer.data)
+    await sio.emit("message:recieve", serializer.data, room=data["chat_id"])
+
+@sio.on("message:read")
+async def messageRead(sid, data):
+    """
+    @brief Handles a client's report that it has displayed a chat up to a message.
+    @details Clients may send it for every message shown; positions are coalesced and
+             written every READ_POSITIONS['INTERVAL'] seconds, which also recounts the
+             user's unread messages in the chat.
+    @param sid The session ID for the connected client.
+    @param data A dictionary containing the chat ID and the `message_id` read.
+    """
+    if not read_positions.enabled:
+        return
+    session = await sio.get_session(sid)
+    chat = await chat_cache.aget(data["chat_id"])
+    if chat is None or not isParticipant(session["user_id"], chat):
+        await sio.emit("message:error", {"msg": "Chat not found"}, to=sid)
+        return
+    try:
+        message_id = int(data["message_id"])
+    except (KeyError, TypeError, ValueError):
+        await sio.emit("message:error", {"msg": "Invalid message_id"}, to=sid)
+        return
+    await read_positions.read(session["user_id"], chat.pk, message_id)
+
+async def typingUpdate(sid, data, typing):
+    """
+    @brief Passes a typing event of a chat participant to the typing indicator throttle.
+    @param sid The session ID for the connected client.
+    @param data A dictionary containing the chat ID.
+    @param typing Whether the user started or stopped typing.
+    """
+    if not typing_indicators.enabled:
+        return
+    session = await sio.get_session(sid)
+    chat = await chat_cache.aget(data["chat_id"])
+    if chat is None or not isParticipant(session["user_id"], chat):
+        return
+    await typing_indicators.update(sid, data["chat_id"], session["user"]["username"], typing)
+
+@sio.on("typing:start")
+async def typingStart(sid, data):
+    """
+    @brief Handles a client's typing notification.
+    @details Clients may send it on every keystroke; the chat room receives at most one
+             `typing:update` per connection and interval.
+    @param sid The session ID for the connected client.
+    @param data A dictionary containing the chat ID.
+    """
+    await typingUpdate(sid, data, True)
+
+@sio.on("typing:stop")
+async def typingStop(sid, data):
+    """
+    @brief Handles a client's notification that it stopped typing.
+    @param sid The session ID for the connected client.
+    @param data A dictionary containing the chat ID.
+    """
+    await typingUpdate(sid, data, False)
@@ -7,13 +7,58 @@
 """
 
 from django.test import TestCase
+from django.core.management import call_command
 from rest_framework.test import APITestCase
 from django.urls import reverse
 from rest_framework import status
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import get_user_model
-from .models import IntrestRequest, Chat, ChatMessage
-from .serializers import userSerializer
+from .models import IntrestRequest, Chat, ChatMessage, ReadPosition
+from .serializers import MessageSerializer, ChatSerializer, IntrestRequestSerializer
+from authentication.serializers import userSerializer
+from .fastserializers import (
+    CHAT_VALUES, INTREST_REQUEST_VALUES, MESSAGE_VALUES, PROFILE_FIELDS,
+    chatFromValues, intrestRequestFromValues, messageFromValues, serializeValues,
+)
+from .writebehind import MessageIdAllocator, MessageWriteBehind
+from django.utils import timezone
+from django.db import DatabaseError, connection
+from django.test.utils import CaptureQueriesContext
+from unittest.mock import AsyncMock, patch
+from asgiref.sync import async_to_sync
+from . import sockets
+from .chatcache import ChatMetaCache, chat_cache
+from .messagestream import MessageStream
+from .recentmessages import RecentMessages, recent_messages
+from .views import MessageView
+from .readpositions import read_positions
+from .inbox import recordUnread
+from .intrestrequests import sendRequests
+from .profilecache import ProfileCache, profile_cache
+from .benchmarks import seed_messages, seed_users
+from .management.commands.bench_endpoints import ENDPOINTS, compareReports
+from .socketload import makeManager, runFanout
+from .presence import Presence, presence, userRoom
+from .typingindicators import TypingIndicators, typing_indicators
+from .querybudget import QueryBudgetExceeded, query_budget
+from . import querybudget
+from django.test import override_settings
+from django.core.exceptions import ImproperlyConfigured
+from .renderers import FastJSONRenderer
+from . import jsoncodec
+from rest_framework.renderers import JSONRenderer
+from django.utils.translation import gettext_lazy
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+import fakeredis
+import io
+import json
+import os
+import socketio
+import tempfile
+import time
+import uuid
+from types import SimpleNamespace
 
 User = get_user_model()
 
@@ -30,7 +75,11 @@ class TestSetup(APITestCase):
         @brief Initializes test data before each test case.
         @details Creates two users, a chat interest request, a chat, and a chat message. 
                  Also obtains a JWT token for authentication in test requests.
+                 The profile and recent messages caches are emptied,
+                 as user and chat ids are reused between tests.
         """
+        profile_cache.clear()
+        recent_messages.clear()
         self.user1 = User.objects.create_user(username='user1', password='password123')
         self.user2 = User.objects.create_user(username='user2', password='password123')
 
@@ -120,6 +169,133 @@ class IntrestRequestViewTest(TestSetup):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['payload']['status'], "accept")
         
+class IntrestRequestBulkViewTest(TestSetup):
+    """
+    @brief Test case for the bulk IntrestRequest view.
+    @details Tests per-item results, the batched side effects of accepted requests and
+             the query count of large calls.
+    """
+
+    def setUp(self):
+        """
+        @brief Adds ten users besides the common test data.
+        """
+        super().setUp()
+        self.others = [User.objects.create_user(username=f'bulk{index}', password='password123') for index in range(10)]
+        self.url = reverse('request_bulk')
+
+    def test_send(self):
+        """
+        @brief Tests sending requests to many usernames.
+        @details Ensures every distinct username gets a result and only new requests are created.
+        """
+        User.objects.get(username='user2').friends.add(self.user1)
+        IntrestRequest.objects.create(request_from=self.user1, request_to=self.others[0])
+        data = {"request_to": ["bulk0", "bulk1", "bulk1", "user1", "user2", "nobody", "bulk2"]}
+        response = self.client.post(self.url, data, format='json', **self.auth_headers(self.token))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = {item["username"]: item["result"] for item in response.data["payload"]}
+        self.assertEqual(results, {
+            "bulk0": "already_sent", "bulk1": "sent", "user1": "invalid", "user2": "already_friends",
+            "nobody": "not_found", "bulk2": "sent",
+        })
+        sent = [item["request_id"] for item in response.data["payload"] if item["result"] == "sent"]
+        self.assertEqual(
+            set(IntrestRequest.objects.filter(request_from=self.user1, pk__in=sent).values_list("request_to__username", flat=True)),
+            {"bulk1", "bulk2"},
+        )
+
+    def test_send_failure(self):
+        """
+        @brief Tests a write failing part way through sending.
+        @details Ensures the requests written before the failure are rolled back with it.
+        """
+        bulk_create = IntrestRequest.objects.bulk_create
+
+        def failMidway(rows):
+            bulk_create(rows[:1])
+            raise DatabaseError("disk I/O error")
+
+        with patch.object(IntrestRequest.objects, "bulk_create", side_effect=failMidway):
+            with self.assertRaises(DatabaseError):
+                sendRequests(self.user1, ["bulk0", "bulk1", "bulk2"])
+        self.assertFalse(IntrestRequest.objects.filter(request_from=self.user1, request_to__in=self.others).exists())
+
+    def test_answer(self):
+        """
+        @brief Tests accepting and rejecting many requests at once.
+        @details Ensures accepted requests create a chat with read positions and a friendship,
+                 and requests that are not the user's or not pending are left alone.
+        """
+        requests = [IntrestRequest.objects.create(request_from=other, request_to=self.user1) for other in self.others[:3]]
+        foreign = IntrestRequest.objects.create(request_from=self.user1, request_to=self.others[3])
+        data = {"requests": [
+            {"request_id": requests[0].id, "status": "accept"},
+            {"request_id": requests[1].id, "status": "reject"},
+            {"request_id": requests[2].id, "status": "accept"},
+            {"request_id": foreign.id, "status": "accept"},
+        ]}
+        response = self.client.patch(self.url, data, format='json', **self.auth_headers(self.token))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [item["result"] for item in response.data["payload"]], ["accept", "reject", "accept", "not_found"]
+        )
+        self.assertEqual(
+            set(self.user1.friends.values_list("username", flat=True)), {"bulk0", "bulk2"}
+        )
+        self.assertTrue(self.others[0].friends.filter(pk=self.user1.pk).exists())
+        chats = Chat.objects.filter(acceptor=self.user1, initiator__in=[self.others[0], self.others[2]])
+        self.assertEqual(chats.count(), 2)
+        self.assertEqual(ReadPosition.objects.filter(chat__in=chats).count(), 4)
+        self.assertEqual(IntrestRequest.objects.get(pk=foreign.pk).status, "pending")
+
+        response = self.client.patch(self.url, {"requests": data["requests"][:1]}, format='json',
+                                     **self.auth_headers(self.token))
+        self.assertEqual(response.data["payload"], [{"request_id": requests[0].id, "result": "not_pending"}])
+
+    def test_invalid(self):
+        """
+        @brief Tests malformed bulk calls.
+        @details Ensures a bad status, a missing list or too many items are rejected as a whole.
+        """
+        for method, data in (
+            ("post", {"request_to": "bulk0"}),
+            ("post", {"request_to": ["bulk0"] * 501}),
+            ("patch", {"requests": [{"request_id": self.intrest_request.id, "status": "pending"}]}),
+            ("patch", {"requests": [{"request_id": "x", "status": "accept"}]}),
+        ):
+            response = getattr(self.client, method)(self.url, data, format='json', **self.auth_headers(self.token))
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(IntrestRequest.objects.get(pk=self.intrest_request.pk).status, "pending")
+
+    def test_query_count(self):
+        """
+        @brief Tests that answering and sending 500 requests runs a handful of queries.
+        """
+        senders = User.objects.bulk_create([User(username=f'sender{index}') for index in range(500)])
+        requests = IntrestRequest.objects.bulk_create([
+            IntrestRequest(request_from=sender, request_to=self.user1) for sender in senders
+        ])
+        data = {"requests": [
+            {"request_id": request.id, "status": "accept" if index % 2 else "reject"}
+            for index, request in enumerate(requests)
+        ]}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(self.url, data, format='json', **self.auth_headers(self.token))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.user1.friends.count(), 250)
+        # SQLite splits the 500 rows of each write into batches; PostgreSQL writes each in one.
+        self.assertLessEqual(len(queries.captured_queries), 13)
+
+        usernames = [f'sender{index}' for index in range(500)]
+        IntrestRequest.objects.filter(request_from=self.user1).delete()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, {"request_to": usernames}, format='json',
+                                        **self.auth_headers(self.token))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(IntrestRequest.objects.filter(request_from=self.user1).count(), 250)
+        self.assertLessEqual(len(queries.captured_queries), 8)
+
 class ListUsersTest(TestSetup):
     """
     @brief Test case for the ListUsers view.
@@ -217,3 +393,1444 @@ class MessageViewTest(TestSetup):
         response = self.client.get(url, **self.auth_headers(self.token))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data['payload']), 0)
+
+    def test_get_messages_paginated(self):
+        """
+        @brief Tests paging through a chat's history with cursors.
+        @details Ensures the first page holds the newest messages in chronological order and that
+                 following the `before` cursor walks back through older messages without gaps or repeats.
+        """
+        for index in range(4):
+            ChatMessage.objects.create(chat=self.chat, sender=self.user2, text=f"message {index}")
+
+        url = reverse('messages') + f'?chat_id={self.chat.short_id}&limit=2'
+        response = self.client.get(url, **self.auth_headers(self.token))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([m['text'] for m in response.data['payload']], ["message 2", "message 3"])
+        self.assertTrue(response.data['has_more'])
+
+        seen = [m['id'] for m in response.data['payload']]
+        cursor = response.data['before']
+        while True:
+            response = self.client.get(url + f'&before={cursor}', **self.auth_headers(self.token))
+            seen = [m['id'] for m in response.data['payload']] + seen
+            if not response.data['has_more']:
+                break
+            cursor = response.data['before']
+
+        expected = list(ChatMessage.objects.filter(chat=self.chat).order_by('created_at', 'id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_get_messages_after_cursor(self):
+        """
+        @brief Tests fetching messages newer than a cursor.
+        @details Ensures the `after` cursor only returns messages created after the cursor row.
+        """
+        url = reverse('messages') + f'?chat_id={self.chat.short_id}'
+        response = self.client.get(url, **self.auth_headers(self.token))
+        cursor = response.data['after']
+
+        ChatMessage.objects.create(chat=self.chat, sender=self.user2, text="new")
+        response = self.client.get(url + f'&after={cursor}', **self.auth_headers(self.token))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([m['text'] for m in response.data['payload']], ["new"])
+
+    def test_get_messages_invalid_cursor(self):
+        """
+        @brief Tests a malformed cursor.
+        @details Ensures the Message view rejects cursors it did not issue with a 400 response.
+        """
+        url = reverse('messages') + f'?chat_id={self.chat.short_id}&before=not-a-cursor'
+        response = self.client.get(url, **self.auth_headers(self.token))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class MessageWriteBehindTest(TestSetup):
+    """
+    @brief Test case for the write-behind message queue.
+    @details Tests id allocation, batched flushing, draining and spill recovery.
+    """
+
+    def build_message(self, write_behind, text):
+        """
+        @brief Builds an unsaved message with a pre-assigned id.
+        @param write_behind The queue whose allocator assigns the id.
+        @param text The message text.
+        @return ChatMessage The unsaved message.
+        """
+        return ChatMessage(id=write_behind.ids.next_id(), chat=self.chat, sender=self.user1, text=text)
+
+    def test_ids_are_unique_and_increasing(self):
+        """
+        @brief Tests the message id allocator.
+        @details Ensures ids from one allocator strictly increase and stay JavaScript-safe.
+        """
+        allocator = MessageIdAllocator(worker_id=3)
+        ids = [allocator.next_id() for _ in range(5000)]
+        self.assertEqual(ids, sorted(set(ids)))
+        self.assertLess(ids[-1], 2 ** 53)
+
+    def test_worker_id_required(self):
+        """
+        @brief Tests the worker id setting.
+        @details Ensures an enabled queue refuses to start without a valid worker id.
+        """
+        for worker_id in (None, 128, "x"):
+            options = {"ENABLED": True, "WORKER_ID": worker_id}
+            with override_settings(CHAT_WRITE_BEHIND=options), self.assertRaises(ImproperlyConfigured):
+                MessageWriteBehind.from_settings()
+        with override_settings(CHAT_WRITE_BEHIND={"ENABLED": True, "WORKER_ID": "5"}):
+            self.assertEqual(MessageWriteBehind.from_settings().ids.worker_id, 5)
+
+    async def test_drain_writes_all_batches(self):
+        """
+        @brief Tests that draining the queue writes every queued message.
+        @details Queues more messages than fit in one batch and ensures they are all inserted
+                 with the ids that were handed out before the insert.
+        """
+        write_behind = MessageWriteBehind(enabled=True, batch_size=2, flush_interval=60)
+        messages = [self.build_message(write_behind, f"queued {index}") for index in range(5)]
+        for message in messages:
+            await write_behind.put(message)
+
+        self.assertEqual(await write_behind.drain(), 0)
+        saved = [m async for m in ChatMessage.objects.filter(text__startswith="queued").order_by("id").values_list("id", flat=True)]
+        self.assertEqual(saved, [message.id for message in messages])
+
+    def test_spill_and_recover(self):
+        """
+        @brief Tests the shutdown journal.
+        @details Ensures spilled messages are inserted again by recover() and the journal is removed.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "spill.jsonl")
+            write_behind = MessageWriteBehind(enabled=True, spill_path=path)
+            message = self.build_message(write_behind, "spilled")
+            message.created_at = timezone.now()
+            write_behind._queue.append(message)
+            write_behind.spill()
+            self.assertEqual(len(write_behind), 0)
+
+            self.assertEqual(async_to_sync(write_behind.recover)(), 1)
+            self.assertTrue(ChatMessage.objects.filter(id=message.id, text="spilled").exists())
+            self.assertFalse(os.path.exists(path))
+
+    async def test_poison_row_is_dead_lettered(self):
+        """
+        @brief Tests that a row the database refuses does not block the rows behind it.
+        @details Queues a message reusing a stored id followed by good ones, and ensures the
+                 good ones are written and the bad one goes to the dead-letter journal.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "dead.jsonl")
+            write_behind = MessageWriteBehind(enabled=True, batch_size=10, flush_interval=60, dead_letter_path=path)
+            stored = await ChatMessage.objects.acreate(chat=self.chat, sender=self.user1, text="stored")
+            poison = ChatMessage(id=stored.id, chat=self.chat, sender=self.user1, text="poison")
+            poison.created_at = timezone.now()
+            good = [self.build_message(write_behind, f"good {index}") for index in range(3)]
+            for message in [poison, *good]:
+                await write_behind.put(message)
+
+            self.assertEqual(await write_behind.drain(), 0)
+            saved = [m async for m in ChatMessage.objects.filter(text__startswith="good").order_by("id").values_list("id", flat=True)]
+            self.assertEqual(saved, [message.id for message in good])
+            self.assertEqual(write_behind.stats()["dead_letters"], 1)
+            with open(path, encoding="utf-8") as journal:
+                self.assertEqual([json.loads(line)["text"] for line in journal], ["poison"])
+
+class SocketHandlersTest(TestSetup):
+    """
+    @brief Test case for the Socket.IO event handlers.
+    @details Calls the handlers directly with the server's emit and session methods patched.
+    """
+
+    async def test_connect_requires_token(self):
+        """
+        @brief Tests connecting without a valid token.
+        @details Ensures connections without a token or with a forged one are refused.
+        """
+        with self.assertRaises(socketio.exceptions.ConnectionRefusedError):
+            await sockets.connect("sid", {}, None)
+        with self.assertRaises(socketio.exceptions.ConnectionRefusedError):
+            await sockets.connect("sid", {}, {"token": "forged"})
+
+    async def test_connect_saves_session(self):
+        """
+        @brief Tests connecting with a valid token.
+        @details Ensures the user's id and profile are stored in the Socket.IO session.
+        """
+        with patch.object(sockets.sio, "save_session", new=AsyncMock()) as save_session:
+            await sockets.connect("sid", {}, {"token": self.token})
+        save_session.assert_awaited_once()
+        session = save_session.await_args.args[1]
+        self.assertEqual(session["user_id"], self.user1.pk)
+        self.assertEqual(session["user"]["username"], "user1")
+
+    def test_message_send_uses_session_user(self):
+        """
+        @brief Tests sending a message over the socket.
+        @details Ensures the sender comes from the session, not from the payload, and that
+                 no user is queried while handling the message.
+        """
+        session = {"user_id": self.user1.pk, "user": userSerializer(self.user1).data}
+        data = {"sender": "user2", "chat_id": self.chat.short_id, "message": "over the socket"}
+        with patch.object(sockets.sio, "get_session", new=AsyncMock(return_value=session)), \
+             patch.object(sockets.sio, "emit", new=AsyncMock()) as emit:
+            with CaptureQueriesContext(connection) as queries:
+                async_to_sync(sockets.messageRecieve)("sid", data)
+
+        self.assertFalse(any("authentication_customuser" in q["sql"] for q in queries.captured_queries))
+        payload = emit.await_args.args[1]
+        self.assertEqual(payload["sender"]["username"], "user1")
+        message = ChatMessage.objects.get(text="over the socket")
+        self.assertEqual(message.sender_id, self.user1.pk)
+
+    def test_connect_chat_notifies_joining_sid(self):
+        """
+        @brief Tests joining a chat over the socket.
+        @details Ensures a participant enters the room and only the joining connection is
+                 notified.
+        """
+        session = {"user_id": self.user2.pk, "user": userSerializer(self.user2).data}
+        with patch.object(sockets.sio, "get_session", new=AsyncMock(return_value=session)), \
+             patch.object(sockets.sio, "enter_room", new=AsyncMock()) as enter_room, \
+             patch.object(sockets.sio, "emit", new=AsyncMock()) as emit:
+            async_to_sync(sockets.connectChat)("sid", {"chat_id": self.chat.short_id})
+        enter_room.assert_awaited_once_with("sid", self.chat.short_id)
+        emit.assert_awaited_once_with("message:notification", {"msg": "Entered the room"}, to="sid")
+
+    def test_non_members_are_refused(self):
+        """
+        @brief Tests joining and posting to another users' chat.
+        @details Ensures a connection cannot enter the room of a chat its user is not part
+                 of, nor post to it.
+        """
+        user3 = User.objects.create_user(username='user3', password='password123')
+        session = {"user_id": user3.pk, "user": userSerializer(user3).data}
+        data = {"chat_id": self.chat.short_id, "message": "intruder"}
+        with patch.object(sockets.sio, "get_session", new=AsyncMock(return_value=session)), \
+             patch.object(sockets.sio, "enter_room", new=AsyncMock()) as enter_room, \
+             patch.object(sockets.sio, "emit", new=AsyncMock()) as emit:
+            async_to_sync(sockets.connectChat)("sid", data)
+            async_to_sync(sockets.messageRecieve)("sid", data)
+        enter_room.assert_not_awaited()
+        self.assertEqual(
+            [call.args[0] for call in emit.await_args_list], ["message:error", "message:error"]
+        )
+        self.assertFalse(ChatMessage.objects.filter(text="intruder").exists())
+
+class ChatMetaCacheTest(TestSetup):
+    """
+    @brief Test case for the chat metadata cache.
+    @details Tests LRU behaviour, counters, signal invalidation and its use by MessageView.
+    """
+
+    def test_hits_and_misses(self):
+        """
+        @brief Tests the cache's lookups and counters.
+        @details Ensures the first lookup queries the database and the second one does not.
+        """
+        cache = ChatMetaCache(max_size=10)
+        with self.assertNumQueries(1):
+            meta = cache.get(self.chat.short_id)
+        with self.assertNumQueries(0):
+            self.assertEqual(cache.get(self.chat.short_id), meta)
+        self.assertEqual(meta.pk, self.chat.pk)
+        self.assertEqual((meta.initiator_id, meta.acceptor_id), (self.user1.pk, self.user2.pk))
+        self.assertIsNone(cache.get("missing"))
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 2))
+
+    def test_size_bound(self):
+        """
+        @brief Tests LRU eviction.
+        @details Ensures the least recently used chat is evicted once the cache is full.
+        """
+        cache = ChatMetaCache(max_size=1)
+        other = Chat.objects.create(initiator=self.user2, acceptor=self.user1)
+        cache.get(self.chat.short_id)
+        cache.get(other.short_id)
+        stats = cache.stats()
+        self.assertEqual((stats["size"], stats["evictions"]), (1, 1))
+
+    def test_invalidated_on_delete(self):
+        """
+        @brief Tests signal invalidation.
+        @details Ensures a deleted chat is no longer served from the shared cache.
+        """
+        self.assertIsNotNone(chat_cache.get(self.chat.short_id))
+        ChatMessage.objects.filter(chat=self.chat).delete()
+        self.chat.delete()
+        self.assertIsNone(chat_cache.get(self.chat.short_id))
+
+    def test_message_view_uses_cache(self):
+        """
+        @brief Tests MessageView with a warm cache.
+        @details Ensures a warm cache saves the chat lookup on the messages endpoint.
+        """
+        url = reverse('messages') + f'?chat_id={self.chat.short_id}'
+        self.client.get(url, **self.auth_headers(self.token))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, **self.auth_headers(self.token))
+        self.assertEqual(len(response.data['payload']), 1)
+        self.assertFalse(any('"app_chat"' in q["sql"] for q in queries.captured_queries))
+
+    def test_metrics_view(self):
+        """
+        @brief Tests the metrics endpoint.
+        @details Ensures the cache counters are reported to staff users only.
+        """
+        url = reverse('metrics')
+        response = self.client.get(url, **self.auth_headers(self.token))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.user1.is_staff = True
+        self.user1.save()
+        response = self.client.get(url, **self.auth_headers(self.token))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("hits", response.data['payload']['chat_cache'])
+
+class InboxTest(TestSetup):
+    """
+    @brief Test case for the inbox mode of the Chats view.
+    @details Tests last-message upkeep, unread counts, ordering and the query count.
+    """
+
+    def test_inbox(self):
+        """
+        @brief Tests the inbox of a user.
+        @details Ensures chats come most recently active first with their last message and
+                 the number of messages received since the user's own latest message.
+        """
+        user3 = User.objects.create_user(username='user3', password='password123')
+        quiet = Chat.objects.create(initiator=user3, acceptor=self.user1)
+        ChatMessage.objects.create(chat=self.chat, sender=self.user2, text="are you there?")
+        ChatMessage.objects.create(chat=self.chat, sender=self.user2, text="hello?")
+
+        url = reverse('chats') + '?inbox=1'
+        response = self.client.get(url, **self.auth_headers(self.token))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        payload = response.data['payload']
+        self.assertEqual([chat['short_id'] for chat in payload], [str(self.chat.short_id), str(quiet.short_id)])
+        self.assertEqual(payload[0]['last_message']['text'], "hello?")
+        self.assertEqual(payload[0]['unread_count'], 2)
+        self.assertIsNone(payload[1]['last_message'])
+        self.assertEqual(payload[1]['unread_count'], 0)
+
+    def test_backfill(self):
+        """
+        @brief Tests the backfill of chats older than the last-message columns.
+        @details Ensures chats get their newest message and sort by its time, and chats
+                 without messages by the time of the request that opened them.
+        """
+        now = timezone.now()
+        user3 = User.objects.create_user(username='user3', password='password123')
+        user4 = User.objects.create_user(username='user4', password='password123')
+        busy = Chat.objects.create(initiator=user3, acceptor=self.user1)
+        newest = ChatMessage.objects.create(chat=busy, sender=user3, text="newest", created_at=now - timedelta(days=1))
+        ChatMessage.objects.filter(pk=self.chat_message.pk).update(created_at=now - timedelta(days=2))
+        IntrestRequest.objects.create(request_from=user4, request_to=self.user1, status="accept",
+                                      dt=now - timedelta(days=3))
+        quiet = Chat.objects.get(initiator=user4)
+        Chat.objects.update(last_message=None, last_activity_at=now)
+
+        call_command("backfill_last_messages", stdout=io.StringIO())
+        response = self.client.get(reverse('chats') + '?inbox=1', **self.auth_headers(self.token))
+        payload = response.data['payload']
+        self.assertEqual([chat['short_id'] for chat in payload],
+                         [str(busy.short_id), str(self.chat.short_id), str(quiet.short_id)])
+        self.assertEqual(payload[0]['last_message']['id'], newest.id)
+        self.assertEqual(payload[1]['last_message']['text'], "Hello")
+        self.assertIsNone(payload[2]['last_message'])
+
+    def test_inbox_query_count(self):
+        """
+        @brief Tests the inbox query count.
+        @details Ensures the inbox costs the same number of queries for 1 and for 30 chats.
+        """
+        url = reverse('chats') + '?inbox=1'
+        with CaptureQueriesContext(connection) as one_chat:
+            self.client.get(url, **self.auth_headers(self.token))
+
+        for index in range(30):
+            other = User.objects.create(username=f'inbox{index}')
+            chat = Chat.objects.create(initiator=other, acceptor=self.user1)
+            ChatMessage.objects.create(chat=chat, sender=other, text="hi")
+
+        with CaptureQueriesContext(connection) as many_chats:
+            response = self.client.get(url + '&limit=100', **self.auth_headers(self.token))
+        self.assertEqual(len(response.data['payload']), 31)
+        self.assertEqual(len(many_chats), len(one_chat))
+
+    def test_inbox_pagination(self):
+        """
+        @brief Tests paging through the inbox.
+        @details Ensures the `after` cursor continues with less recently active chats.
+        """
+        Chat.objects.create(initiator=User.objects.create(username='user3'), acceptor=self.user1)
+        url = reverse('chats') + '?inbox=1&limit=1'
+        first = self.client.get(url, **self.auth_headers(self.token)).data
+        second = self.client.get(url + f"&after={first['after']}", **self.auth_headers(self.token)).data
+        self.assertTrue(first['has_more'])
+        self.assertFalse(second['has_more'])
+        self.assertNotEqual(first['payload'][0]['short_id'], second['payload'][0]['short_id'])
+
+@override_settings(QUERY_BUDGET_RAISE=True)
+class QueryBudgetTest(TestSetup):
+    """
+    @brief Test case for the query budgets of the list views.
+    @details Seeds 1,000 rows behind every list endpoint and ensures each one stays within
+             its query budget, which raises QueryBudgetExceeded in these tests.
+    """
+
+    def setUp(self):
+        """
+        @brief Seeds 1,000 interest requests, chats and messages for user1.
+        """
+        super().setUp()
+        others = seed_users(1000, prefix="budget")
+        IntrestRequest.objects.bulk_create(
+            [IntrestRequest(request_from=other, request_to=self.user1) for other in others]
+        )
+        IntrestRequest.objects.bulk_create(
+            [IntrestRequest(request_from=self.user1, request_to=other) for other in others[:500]]
+        )
+        Chat.objects.bulk_create([Chat(initiator=other, acceptor=self.user1) for other in others])
+        seed_messages([self.chat], 1000)
+
+    def test_list_views_within_budget(self):
+        """
+        @brief Tests every list endpoint against its budget.
+        @details Ensures each endpoint returns its full page without going over budget.
+        """
+        headers = self.auth_headers(self.token)
+        response = self.client.get(reverse('request'), **headers)
+        self.assertEqual(len(response.data['payload']), 1001)
+        response = self.client.get(reverse('chats'), **headers)
+        self.assertEqual(len(response.data['payload']), 1001)
+        response = self.client.get(reverse('chats') + '?inbox=1&limit=100', **headers)
+        self.assertEqual(len(response.data['payload']), 100)
+        response = self.client.get(reverse('messages') + f'?chat_id={self.chat.short_id}&limit=200', **headers)
+        self.assertEqual(len(response.data['payload']), 200)
+        response = self.client.get(reverse('list_users'), **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        recorded = querybudget.stats()
+        for name in ("IntrestRequestView.get", "ChatsView.get", "MessageView.get", "ListUsers.get"):
+            self.assertLessEqual(recorded[name]["max_queries"], recorded[name]["budget"], name)
+
+    def test_budget_exceeded(self):
+        """
+        @brief Tests the guard itself.
+        @details Ensures a handler running more queries than its budget raises.
+        """
+        class Handler:
+            @query_budget(1)
+            def get(self, request):
+                list(User.objects.all())
+                list(Chat.objects.all())
+
+        with self.assertRaises(QueryBudgetExceeded):
+            Handler().get(None)
+
+class ListUsersPaginationTest(TestSetup):
+    """
+    @brief Test case for the exclusions and pagination of the ListUsers view.
+    """
+
+    def test_excludes_requested_and_friends(self):
+        """
+        @brief Tests the excluded users.
+        @details Ensures users the caller has sent a request to, friends, and the caller
+                 themselves are not listed.
+        """
+        requested, friend, stranger = seed_users(3, prefix="dir")
+        IntrestRequest.objects.create(request_from=self.user1, request_to=requested)
+        self.user1.friends.add(friend)
+
+        response = self.client.get(reverse('list_users'), **self.auth_headers(self.token))
+        usernames = [user['username'] for user in response.data['payload']]
+        self.assertEqual(usernames, ["dir2", "user2"])
+
+    def test_pages_cover_directory(self):
+        """
+        @brief Tests paging through the directory.
+        @details Ensures following `after` cursors lists every user once, in username order,
+                 and that the page size is capped.
+        """
+        seed_users(150, prefix="page")
+        url = reverse('list_users') + '?limit=1000'
+        response = self.client.get(url, **self.auth_headers(self.token))
+        self.assertEqual(len(response.data['payload']), 100)
+
+        usernames = [user['username'] for user in response.data['payload']]
+        while response.data['has_more']:
+            response = self.client.get(url + f"&after={response.data['after']}", **self.auth_headers(self.token))
+            usernames += [user['username'] for user in response.data['payload']]
+        self.assertEqual(usernames, sorted(User.objects.exclude(pk=self.user1.pk).values_list('username', flat=True)))
+
+class UserSearchTest(TestSetup):
+    """
+    @brief Test case for the indexed user search of the ListUsers view.
+    @details Tests index upkeep through signals, ranking, multi-word queries and paging.
+    """
+
+    def search(self, query, extra=""):
+        """
+        @brief Searches the directory as user1.
+        @param query The search string.
+        @param extra Additional query string parameters.
+        @return dict The response data.
+        """
+        url = reverse('list_users') + f'?s={query}{extra}'
+        return self.client.get(url, **self.auth_headers(self.token)).data
+
+    def test_ranking(self):
+        """
+        @brief Tests the order of search results.
+        @details Ensures username matches come before first name and last name matches,
+                 and that accents and case are ignored.
+        """
+        User.objects.create_user(username='zed', first_name='Jöhn', password='password123')
+        User.objects.create_user(username='amy', last_name='Johnson', password='password123')
+        User.objects.create_user(username='johnny', password='password123')
+        usernames = [user['username'] for user in self.search('JOHN')['payload']]
+        self.assertEqual(usernames, ['johnny', 'zed', 'amy'])
+
+    def test_index_follows_renames(self):
+        """
+        @brief Tests the save signal.
+        @details Ensures a renamed user is found by the new name only.
+        """
+        self.user2.username = 'renamed'
+        self.user2.save()
+        self.assertEqual(self.search('user2')['payload'], [])
+        self.assertEqual(self.search('ren')['payload'][0]['username'], 'renamed')
+
+    def test_other_saves_keep_index(self):
+        """
+        @brief Tests that saves of fields other than the names leave the terms alone.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            self.user2.last_login = timezone.now()
+            self.user2.save(update_fields=["last_login"])
+            self.user2.revokeTokens()
+        self.assertFalse(any("app_usersearchterm" in q["sql"] for q in queries.captured_queries))
+        self.assertEqual(self.search('user2')['payload'][0]['username'], 'user2')
+
+    def test_multiple_words(self):
+        """
+        @brief Tests multi-word queries.
+        @details Ensures every word has to match one of the user's names.
+        """
+        User.objects.create_user(username='jd', first_name='John', last_name='Doe', password='password123')
+        User.objects.create_user(username='js', first_name='John', last_name='Smith', password='password123')
+        usernames = [user['username'] for user in self.search('john%20do')['payload']]
+        self.assertEqual(usernames, ['jd'])
+
+    def test_search_pagination(self):
+        """
+        @brief Tests paging through search results.
+        @details Ensures each matching user is listed once across pages, and excluded users never.
+        """
+        users = seed_users(30, prefix="match")
+        self.user1.friends.add(users[0])
+        data = self.search('match', '&limit=7')
+        usernames = [user['username'] for user in data['payload']]
+        while data['has_more']:
+            data = self.search('match', f"&limit=7&after={data['after']}")
+            usernames += [user['username'] for user in data['payload']]
+        self.assertEqual(sorted(usernames), sorted(user.username for user in users[1:]))
+
+
+class MessageSearchTest(TestSetup):
+    """
+    @brief Test case for the MessageSearch view.
+    @details Tests matching, snippets, chat scoping, index upkeep and pagination.
+    """
+
+    def search(self, query, extra=''):
+        """
+        @brief Searches messages as user1.
+        @param query The search string.
+        @param extra Additional query parameters.
+        @return dict The response data.
+        """
+        url = reverse('message_search') + f'?q={query}{extra}'
+        response = self.client.get(url, **self.auth_headers(self.token))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_search(self):
+        """
+        @brief Tests a search over the user's messages.
+        @details Ensures prefixes of the last word match and the snippet marks the match.
+        """
+        ChatMessage.objects.create(chat=self.chat, sender=self.user2, text="see you at the station tonight")
+        payload = self.search('stat')['payload']
+        self.assertEqual(len(payload), 1)
+        self.assertEqual(payload[0]['chat'], str(self.chat.short_id))
+        self.assertIn('[station]', payload[0]['snippet'])
+        self.assertEqual(self.search('')['payload'], [])
+
+    def test_search_is_limited_to_own_chats(self):
+        """
+        @brief Tests the chat scoping of the search.
+        @details Ensures messages of chats the user is not part of are never returned.
+        """
+        user3 = User.objects.create_user(username='user3', password='password123')
+        other = Chat.objects.create(initiator=self.user2, acceptor=user3)
+        ChatMessage.objects.create(chat=other, sender=user3, text="secret plans")
+        self.assertEqual(self.search('secret')['payload'], [])
+
+    def test_index_follows_writes(self):
+        """
+        @brief Tests the index triggers.
+        @details Ensures edited, deleted and bulk-created messages are indexed.
+        """
+        self.chat_message.text = "Goodbye"
+        self.chat_message.save()
+        self.assertEqual(self.search('hello')['payload'], [])
+        self.assertEqual(len(self.search('goodbye')['payload']), 1)
+
+        self.chat_message.delete()
+        self.assertEqual(self.search('goodbye')['payload'], [])
+
+        ChatMessage.objects.bulk_create([ChatMessage(chat=self.chat, sender=self.user1, text="bulk note")])
+        self.assertEqual(len(self.search('bulk')['payload']), 1)
+
+    def test_operators_are_literal(self):
+        """
+        @brief Tests that FTS5 syntax typed by the user does not break the query.
+        """
+        for query in ['"', 'hello%20OR', 'NEAR(', '*', 'hel-lo']:
+            self.search(query)
+
+    def test_search_pagination(self):
+        """
+        @brief Tests paging through search results.
+        @details Ensures results come newest first and each match is listed once.
+        """
+        ChatMessage.objects.bulk_create([
+            ChatMessage(chat=self.chat, sender=self.user1, text=f"ping {index}") for index in range(9)
+        ])
+        data = self.search('ping', '&limit=4')
+        ids = [message['id'] for message in data['payload']]
+        while data['has_more']:
+            data = self.search('ping', f"&limit=4&after={data['after']}")
+            ids += [message['id'] for message in data['payload']]
+        self.assertEqual(len(ids), 9)
+        self.assertEqual(ids, sorted(ids, reverse=True))
+
+
+class ProfileCacheTest(TestSetup):
+    """
+    @brief Test case for the serialized user profile cache.
+    @details Tests hits, version bumps on profile changes and the uncached paths.
+    """
+
+    def test_profiles_are_cached(self):
+        """
+        @brief Tests that a profile is serialized once per version.
+        @details Ensures a page of messages from one sender serializes the sender once and
+                 matches the output of userSerializer.
+        """
+        ChatMessage.objects.bulk_create([
+            ChatMessage(chat=self.chat, sender=self.user1, text=f"message {index}") for index in range(9)
+        ])
+        messages = ChatMessage.objects.filter(chat=self.chat).select_related("sender")
+        data = MessageSerializer(messages, many=True).data
+        self.assertEqual(data[0]['sender'], userSerializer(self.user1).data)
+        stats = profile_cache.stats()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hits'], 9)
+
+    def test_profile_change_bumps_version(self):
+        """
+        @brief Tests the invalidation of a changed profile.
+        @details Ensures renaming a user bumps its version, serves the new name and drops
+                 the superseded entry.
+        """
+        version = self.user2.profile_version
+        self.assertEqual(profile_cache.get(self.user2)['username'], 'user2')
+        self.user2.username = 'renamed'
+        self.user2.save()
+        self.assertEqual(self.user2.profile_version, version + 1)
+        self.assertNotIn((self.user2.pk, version), profile_cache._entries)
+
+        user = User.objects.get(pk=self.user2.pk)
+        self.assertEqual(profile_cache.get(user)['username'], 'renamed')
+
+    def test_non_profile_save_keeps_version(self):
+        """
+        @brief Tests saves that do not touch the profile.
+        @details Ensures updating only `last_login` keeps the profile version.
+        """
+        version = self.user1.profile_version
+        self.user1.last_login = timezone.now()
+        self.user1.save(update_fields=['last_login'])
+        self.assertEqual(User.objects.get(pk=self.user1.pk).profile_version, version)
+
+    def test_unversioned_users_are_not_cached(self):
+        """
+        @brief Tests users without a known profile version.
+        @details Ensures users rebuilt from sessions that carry no version bypass the cache.
+        """
+        user = sockets.sessionUser({"user_id": self.user1.pk, "user": {"username": "stale"}})
+        self.assertEqual(profile_cache.get(user)['username'], 'stale')
+        self.assertEqual(profile_cache.stats()['misses'], 0)
+        self.assertEqual(profile_cache.get(self.user1)['username'], 'user1')
+
+    def test_shared_tier(self):
+        """
+        @brief Tests the shared tier.
+        @details Ensures a profile cached by one process is read by another one from the
+                 shared cache instead of being serialized again.
+        """
+        first = ProfileCache(shared='default')
+        second = ProfileCache(shared='default')
+        first.get(self.user1)
+        self.assertEqual(second.get(self.user1)['username'], 'user1')
+        self.assertEqual(second.stats()['shared_hits'], 1)
+        self.assertEqual(second.stats()['misses'], 0)
+
+
+class FastSerializersTest(TestSetup):
+    """
+    @brief Test case for the read-only fast serializers.
+    @details Checks every `*FromValues` function against the serializer it stands in for.
+    """
+
+    def setUp(self):
+        """
+        @brief Adds rows with unusual values to the common test data.
+        """
+        super().setUp()
+        user3 = User.objects.create_user(
+            username='jöhn', first_name='Jöhn', last_name='', email='j@example.com', password='password123'
+        )
+        chat = Chat.objects.create(initiator=user3, acceptor=self.user1)
+        ChatMessage.objects.create(
+            chat=chat, sender=user3, text='naïve ✓',
+            created_at=timezone.now().replace(microsecond=123456),
+        )
+        ChatMessage.objects.create(chat=chat, sender=self.user1, text='', created_at=timezone.now().replace(microsecond=0))
+        IntrestRequest.objects.create(request_from=user3, request_to=self.user1)
+
+    def assertSameOutput(self, fast, slow):
+        """
+        @brief Asserts both outputs have the same rows, values and key order.
+        @param fast The fast path output.
+        @param slow The serializer output.
+        """
+        self.assertEqual(fast, slow)
+        for fast_row, slow_row in zip(fast, slow):
+            self.assertEqual(list(fast_row), list(slow_row))
+
+    def test_messages(self):
+        """
+        @brief Tests messageFromValues() against MessageSerializer, in local time and UTC.
+        """
+        messages = ChatMessage.objects.order_by('id')
+        for zone in ('Asia/Kolkata', 'UTC'):
+            with timezone.override(zone):
+                self.assertSameOutput(
+                    serializeValues(messages.values(*MESSAGE_VALUES), messageFromValues),
+                    MessageSerializer(messages.select_related('sender'), many=True).data,
+                )
+
+    def test_chats(self):
+        """
+        @brief Tests chatFromValues() against ChatSerializer.
+        """
+        chats = Chat.objects.order_by('id')
+        self.assertSameOutput(
+            serializeValues(chats.values(*CHAT_VALUES), chatFromValues),
+            ChatSerializer(chats, many=True).data,
+        )
+
+    def test_intrest_requests(self):
+        """
+        @brief Tests intrestRequestFromValues() against IntrestRequestSerializer.
+        """
+        intrest_requests = IntrestRequest.objects.order_by('id')
+        self.assertSameOutput(
+            serializeValues(intrest_requests.values(*INTREST_REQUEST_VALUES), intrestRequestFromValues),
+            IntrestRequestSerializer(intrest_requests, many=True).data,
+        )
+
+    def test_profile_fields(self):
+        """
+        @brief Tests that the fast path covers exactly the readable userSerializer fields.
+        """
+        self.assertEqual(list(PROFILE_FIELDS), list(userSerializer(self.user1).data))
+
+
+class JSONCodecTest(TestSetup):
+    """
+    @brief Test case for the fast JSON codec, renderer and parser.
+    @details Compares the output with DRF's stock JSONRenderer, with and without orjson.
+    """
+
+    data = {
+        'payload': [{
+            'id': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+            'at': datetime(2024, 5, 1, 12, 30, tzinfo=dt_timezone.utc),
+            'amount': Decimal('1.50'),
+            'text': 'naïve ✓ \u2028 line',
+            'label': gettext_lazy('lazy'),
+            1: None,
+        }],
+    }
+    """ @brief Response data using every type the encoders special-case. """
+
+    def assertSameAsStock(self):
+        """
+        @brief Asserts the fast renderer's output decodes to the stock renderer's output.
+        """
+        fast = FastJSONRenderer().render(self.data)
+        stock = JSONRenderer().render(self.data)
+        self.assertNotIn('\u2028'.encode(), fast)
+        self.assertEqual(json.loads(fast), json.loads(stock))
+
+    def test_renderer_matches_stock(self):
+        """
+        @brief Tests the renderer with the codec's preferred backend.
+        """
+        self.assertSameAsStock()
+
+    def test_stdlib_fallback(self):
+        """
+        @brief Tests the renderer without orjson.
+        """
+        with patch.object(jsoncodec, 'orjson', None):
+            self.assertEqual(jsoncodec.backend(), 'json')
+            self.assertSameAsStock()
+            self.assertEqual(jsoncodec.loads(jsoncodec.dumps({'a': [1]})), {'a': [1]})
+
+    def test_parser_rejects_invalid_json(self):
+        """
+        @brief Tests that a malformed request body is answered with 400.
+        """
+        response = self.client.post(
+            reverse('request'), data='{"request_to": ', content_type='application/json',
+            **self.auth_headers(self.token)
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_socketio_uses_codec(self):
+        """
+        @brief Tests that Socket.IO packets are encoded with the codec.
+        """
+        self.assertIs(sockets.sio.packet_class.json, jsoncodec)
+        packet = sockets.sio.packet_class(socketio.packet.EVENT, data=['message:recieve', {'text': 'hi'}])
+        self.assertEqual(packet.encode(), '2["message:recieve",{"text":"hi"}]')
+
+
+class EndpointBenchmarkTest(TestCase):
+    """
+    @brief Test case for the endpoint benchmark suite.
+    @details Checks that every route is benchmarked and how reports are compared with a baseline.
+    """
+
+    def test_covers_every_route(self):
+        """
+        @brief Tests that the benchmark calls every route of the app and authentication URLs.
+        """
+        from . import urls as app_urls
+        from authentication import urls as auth_urls
+        routes = {str(pattern.pattern) for pattern in app_urls.urlpatterns + auth_urls.urlpatterns}
+        self.assertEqual({route for _, _, route in ENDPOINTS}, routes)
+
+    def test_compare_reports(self):
+        """
+        @brief Tests that extra queries and slower p95 latencies are reported as regressions.
+        """
+        baseline = {'endpoints': {
+            'chats': {'queries': 1, 'p95': 10.0},
+            'messages': {'queries': 1, 'p95': 10.0},
+        }}
+        report = {'endpoints': {
+            'chats': {'queries': 2, 'p95': 12.0},
+            'messages': {'queries': 1, 'p95': 20.0},
+            'new': {'queries': 5, 'p95': 50.0},
+        }}
+        self.assertEqual(compareReports(baseline, report, 0.25), [
+            'chats: 1 -> 2 queries',
+            'messages: p95 10.0ms -> 20.0ms',
+        ])
+
+
+class SocketFanoutTest(TestSetup):
+    """
+    @brief Test case for the in-process Socket.IO load generator.
+    @details Runs a short load through the real ASGI app and checks every message reaches
+             every client joined to its chat.
+    """
+
+    def runLoad(self, manager):
+        """
+        @brief Runs a short load with two clients in one chat.
+        @param manager The client manager kind.
+        @return dict The run's results.
+        """
+        token2 = self.get_jwt_token(self.user2)
+        plan = [(self.token, self.chat.short_id), (token2, self.chat.short_id)]
+        return async_to_sync(runFanout)(
+            socketio.ASGIApp(sockets.sio), sockets.sio, makeManager(manager), plan,
+            rate=50, duration=0.2, settle=1.0,
+        )
+
+    def test_memory_manager(self):
+        """
+        @brief Tests delivery with the in-process manager.
+        """
+        result = self.runLoad("memory")
+        self.assertEqual(result["messages"], 10)
+        self.assertEqual(result["expected_deliveries"], 20)
+        self.assertEqual(result["lost"], 0)
+        self.assertEqual(ChatMessage.objects.filter(text__startswith="load ").count(), 10)
+
+    def test_fake_redis_manager(self):
+        """
+        @brief Tests delivery through the Redis pub/sub manager over a fake Redis.
+        """
+        result = self.runLoad("fakeredis")
+        self.assertEqual(result["lost"], 0)
+        self.assertEqual(result["deliveries"], 20)
+        self.assertIs(sockets.sio.manager, sockets.mgr)
+
+
+class PresenceTest(TestSetup):
+    """
+    @brief Test case for the presence service, its socket handlers and PresenceView.
+    @details Ticks are run by calling flush(); time is patched to expire connections.
+    """
+
+    def setUp(self):
+        """
+        @brief Creates the test data and an in-process presence service with a mocked server.
+        """
+        super().setUp()
+        presence.clear()
+        self.presence = Presence(ttl=60)
+        self.server = AsyncMock()
+        self.presence.attach(self.server)
+
+    async def test_changes_go_to_online_partners(self):
+        """
+        @brief Tests that a change is pushed once per tick to the online chat partners only.
+        """
+        await self.presence.connect(self.user2.pk, "sid2")
+        self.assertEqual(await self.presence.flush(), 0)
+
+        await self.presence.connect(self.user1.pk, "sid1a")
+        await self.presence.connect(self.user1.pk, "sid1b")
+        self.assertEqual(await self.presence.flush(), 1)
+        self.server.emit.assert_awaited_once_with(
+            "presence:update", {"users": {"user1": True}}, room=userRoom(self.user2.pk)
+        )
+
+        self.server.emit.reset_mock()
+        await self.presence.disconnect(self.user1.pk, "sid1a")
+        self.assertEqual(await self.presence.flush(), 0)
+        await self.presence.disconnect(self.user1.pk, "sid1b")
+        await self.presence.connect(self.user1.pk, "sid1c")
+        self.assertEqual(await self.presence.flush(), 0)
+        self.server.emit.assert_not_awaited()
+        await self.presence.stop()
+
+    async def test_connections_are_renewed(self):
+        """
+        @brief Tests that connections held by the process stay online without client heartbeats.
+        """
+        await self.presence.connect(self.user1.pk, "sid1")
+        await self.presence.connect(self.user2.pk, "sid2")
+        await self.presence.flush()
+        start = time.time()
+        for offset in (30, 60, 90):
+            with patch("app.presence.time.time", return_value=start + offset):
+                self.assertEqual(await self.presence.flush(), 0)
+        with patch("app.presence.time.time", return_value=start + 90):
+            self.assertEqual(self.presence.lookupSync([self.user1.pk, self.user2.pk]), {self.user1.pk, self.user2.pk})
+        self.assertEqual(self.presence.stats()["expired"], 0)
+        await self.presence.stop()
+
+    async def test_crashed_worker_expires(self):
+        """
+        @brief Tests that the connections of a worker that stopped renewing them expire.
+        @details Two services share a fake Redis; the second one never ticks again.
+        """
+        store = fakeredis.FakeServer()
+        services = []
+        for _ in range(2):
+            service = Presence(ttl=60)
+            service.redis = fakeredis.FakeRedis(server=store)
+            service.aredis = fakeredis.FakeAsyncRedis(server=store)
+            service.attach(self.server)
+            services.append(service)
+        alive, crashed = services
+        await alive.connect(self.user1.pk, "sid1")
+        await crashed.connect(self.user2.pk, "sid2")
+        await alive.flush()
+        start = time.time()
+
+        with patch("app.presence.time.time", return_value=start + 40):
+            await alive.flush()
+        with patch("app.presence.time.time", return_value=start + 70):
+            self.assertEqual(await alive.flush(), 1)
+            self.assertEqual(alive.lookupSync([self.user1.pk, self.user2.pk]), {self.user1.pk})
+        self.server.emit.assert_awaited_with(
+            "presence:update", {"users": {"user2": False}}, room=userRoom(self.user1.pk)
+        )
+        self.assertEqual(alive.stats()["expired"], 1)
+        await alive.stop()
+        await crashed.stop()
+
+    def test_socket_handlers(self):
+        """
+        @brief Tests that connecting and disconnecting a socket registers it with the presence service.
+        """
+        session = {"user_id": self.user1.pk, "user": userSerializer(self.user1).data}
+        with patch.object(sockets.sio, "save_session", new=AsyncMock()), \
+             patch.object(sockets.sio, "enter_room", new=AsyncMock()) as enter_room, \
+             patch.object(sockets.sio, "get_session", new=AsyncMock(return_value=session)):
+            async_to_sync(sockets.connect)("sid", {}, {"token": self.token})
+            self.assertEqual(presence.lookupSync([self.user1.pk]), {self.user1.pk})
+            enter_room.assert_awaited_once_with("sid", userRoom(self.user1.pk))
+            async_to_sync(sockets.presenceHeartbeat)("sid", {})
+            async_to_sync(sockets.disconnect)("sid")
+        self.assertEqual(presence.lookupSync([self.user1.pk]), set())
+        self.assertEqual(presence.stats()["heartbeats"], 1)
+
+    def test_lookup_view(self):
+        """
+        @brief Tests the bulk lookup, which writes nothing and only reveals chat partners.
+        """
+        stranger = User.objects.create_user(username='stranger', password='password123')
+        async_to_sync(presence.connect)(self.user2.pk, "sid2")
+        async_to_sync(presence.connect)(stranger.pk, "sid3")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('presence'), {'users': 'user1,user2,stranger,nobody'}, **self.auth_headers(self.token)
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['payload'], {'user1': False, 'user2': True, 'stranger': False, 'nobody': False})
+        self.assertTrue(all(q['sql'].startswith('SELECT') for q in queries.captured_queries))
+
+        response = self.client.get(
+            reverse('presence'), {'users': ','.join(f'u{n}' for n in range(201))}, **self.auth_headers(self.token)
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TypingIndicatorsTest(TestSetup):
+    """
+    @brief Test case for the typing indicator throttle and its socket handlers.
+    @details Ticks are run by calling flush(); the monotonic clock is patched to move time.
+    """
+
+    def setUp(self):
+        """
+        @brief Creates the test data and a throttle with a mocked server.
+        """
+        super().setUp()
+        typing_indicators.clear()
+        self.typing = TypingIndicators(interval=1.0, expiry=5.0)
+        self.server = AsyncMock()
+        self.typing.attach(self.server)
+        self.now = time.monotonic()
+
+    def at(self, seconds):
+        """
+        @brief Patches the throttle's clock.
+        @param seconds The offset from the test's start time.
+        @return The patch, to use as a context manager.
+        """
+        return patch("app.typingindicators.time.monotonic", return_value=self.now + seconds)
+
+    def updates(self):
+        """
+        @brief Lists the typing values emitted so far.
+        @return list The `typing` field of every emitted update.
+        """
+        return [call.args[1]["typing"] for call in self.server.emit.await_args_list]
+
+    async def test_keystrokes_are_throttled(self):
+        """
+        @brief Tests that repeated starts forward one update and a quick stop waits for the interval.
+        """
+        with self.at(0):
+            self.assertTrue(await self.typing.update("sid", "chat", "user1", True))
+            for _ in range(10):
+                self.assertFalse(await self.typing.update("sid", "chat", "user1", True))
+        with self.at(0.5):
+            self.assertFalse(await self.typing.update("sid", "chat", "user1", False))
+            self.assertEqual(await self.typing.flush(), 0)
+        with self.at(1.0):
+            self.assertEqual(await self.typing.flush(), 1)
+        self.assertEqual(self.updates(), [True, False])
+        self.server.emit.assert_awaited_with(
+            "typing:update", {"chat_id": "chat", "username": "user1", "typing": False},
+            room="chat", skip_sid="sid",
+        )
+        self.assertEqual(self.typing.stats()["received"], 12)
+        await self.typing.stop()
+
+    async def test_undone_change_is_dropped(self):
+        """
+        @brief Tests that a stop undone by a start within the interval forwards nothing.
+        """
+        with self.at(0):
+            await self.typing.update("sid", "chat", "user1", True)
+        with self.at(0.2):
+            await self.typing.update("sid", "chat", "user1", False)
+        with self.at(0.4):
+            await self.typing.update("sid", "chat", "user1", True)
+        with self.at(1.5):
+            await self.typing.flush()
+        self.assertEqual(self.updates(), [True])
+        await self.typing.stop()
+
+    async def test_expiry_and_disconnect(self):
+        """
+        @brief Tests that typing stops by itself after the expiry and when the connection closes.
+        """
+        with self.at(0):
+            await self.typing.update("sid", "chat", "user1", True)
+            await self.typing.update("sid", "other", "user1", True)
+        with self.at(4):
+            await self.typing.update("sid", "chat", "user1", True)
+        with self.at(6):
+            await self.typing.flush()
+        self.assertEqual(self.updates(), [True, True, False])
+        self.assertEqual(self.typing.stats()["expired"], 1)
+
+        await self.typing.disconnect("sid")
+        self.assertEqual(self.updates(), [True, True, False, False])
+        self.assertEqual(self.typing.stats()["states"], 0)
+        await self.typing.stop()
+
+    def test_socket_handlers(self):
+        """
+        @brief Tests that only the chat's participants' typing events are forwarded.
+        """
+        session = {"user_id": self.user1.pk, "user": userSerializer(self.user1).data}
+        with patch.object(sockets.sio, "get_session", new=AsyncMock(return_value=session)), \
+             patch.object(sockets.sio, "emit", new=AsyncMock()) as emit:
+            async_to_sync(sockets.typingStart)("sid", {"chat_id": self.chat.short_id})
+            emit.assert_awaited_once_with(
+                "typing:update", {"chat_id": self.chat.short_id, "username": "user1", "typing": True},
+                room=self.chat.short_id, skip_sid="sid",
+            )
+
+            other = Chat.objects.create(
+                initiator=self.user2, acceptor=User.objects.create_user(username='user3', password='password123')
+            )
+            async_to_sync(sockets.typingStart)("sid", {"chat_id": other.short_id})
+            async_to_sync(sockets.typingStop)("sid", {"chat_id": "missing"})
+        self.assertEqual(emit.await_count, 1)
+        self.assertEqual(typing_indicators.stats()["received"], 1)
+
+
+class MessageStreamTest(TestSetup):
+    """
+    @brief Test case for the per-chat message log and reconnect replay.
+    @details Tests replays from the retained window and from the database, and the
+             `last_id` option of `connect:chat`.
+    """
+
+    def setUp(self):
+        """
+        @brief Adds a logged chat history of five messages on top of the common test data.
+        """
+        super().setUp()
+        self.meta = chat_cache.get(self.chat.short_id)
+        self.stream = MessageStream(max_len=3, replay_limit=10)
+        self.messages = [self.chat_message] + [
+            ChatMessage.objects.create(chat=self.chat, sender=self.user2, text=f"message {index}")
+            for index in range(4)
+        ]
+        self.ids = [message.id for message in self.messages]
+        for message in self.messages:
+            async_to_sync(self.stream.append)(self.chat.short_id, MessageSerializer(message).data)
+
+    def replayed(self, last_id):
+        """
+        @brief Replays the test chat after a message.
+        @param last_id The id of the last message seen.
+        @return tuple The replayed ids and the truncated flag.
+        """
+        messages, truncated = async_to_sync(self.stream.since)(self.meta, last_id)
+        return [message["id"] for message in messages], truncated
+
+    def test_replay_from_window(self):
+        """
+        @brief Tests a gap within the retained window of the shared log.
+        @details Ensures only the missed messages are sent, without touching the database.
+        """
+        stream = MessageStream(max_len=3)
+        stream.aredis = fakeredis.FakeAsyncRedis()
+        for message in self.messages:
+            async_to_sync(stream.append)(self.chat.short_id, MessageSerializer(message).data)
+        with self.assertNumQueries(0):
+            messages, truncated = async_to_sync(stream.since)(self.meta, self.ids[2])
+            self.assertEqual(([message["id"] for message in messages], truncated), (self.ids[3:], False))
+            messages, truncated = async_to_sync(stream.since)(self.meta, self.ids[4])
+            self.assertEqual((messages, truncated), ([], False))
+        self.assertEqual(stream.stats()["window_replays"], 2)
+
+    def test_local_log_reads_database(self):
+        """
+        @brief Tests a replay from a process-local log.
+        @details Ensures messages sent through another process, which are not in the local
+                 ring, are replayed from the database.
+        """
+        elsewhere = ChatMessage.objects.create(chat=self.chat, sender=self.user2, text="other process")
+        self.assertEqual(self.replayed(self.ids[3]), ([self.ids[4], elsewhere.id], False))
+        self.assertEqual(self.stream.stats()["window_replays"], 0)
+
+    def test_replay_from_database(self):
+        """
+        @brief Tests a gap older than the retained window.
+        @details Ensures the gap is read from the database and cut at the replay limit.
+        """
+        with self.assertNumQueries(2):
+            self.assertEqual(self.replayed(self.ids[0]), (self.ids[1:], False))
+        self.stream.replay_limit = 2
+        self.assertEqual(self.replayed(self.ids[0]), (self.ids[1:3], True))
+        self.assertEqual(self.replayed(-1), ([], True))
+        self.assertEqual(self.stream.stats()["database_replays"], 3)
+
+    def test_unwritten_messages_are_replayed(self):
+        """
+        @brief Tests a database replay while the newest messages are not inserted yet.
+        @details Ensures logged messages missing from the database follow the stored ones.
+        """
+        pending = ChatMessage(id=self.ids[-1] + 1, chat=self.chat, sender=self.user1, text="pending",
+                              created_at=timezone.now())
+        async_to_sync(self.stream.append)(self.chat.short_id, MessageSerializer(pending).data)
+        self.assertEqual(self.replayed(self.ids[0]), (self.ids[1:] + [pending.id], False))
+
+    def test_connect_chat_replays(self):
+        """
+        @brief Tests rejoining a chat with the id of the last message seen.
+        @details Ensures a message sent over the socket is logged and replayed to the
+                 rejoining connection only.
+        """
+        session = {"user_id": self.user1.pk, "user": userSerializer(self.user1).data}
+        data = {"chat_id": self.chat.short_id, "message": "while away"}
+        with patch.object(sockets.sio, "get_session", new=AsyncMock(return_value=session)), \
+             patch.object(sockets.sio, "enter_room", new=AsyncMock()), \
+             patch.object(sockets.sio, "emit", new=AsyncMock()) as emit:
+            async_to_sync(sockets.messageRecieve)("sid", data)
+            sent = emit.await_args.args[1]
+            async_to_sync(sockets.connectChat)("sid", {"chat_id": self.chat.short_id, "last_id": self.ids[-1]})
+        emit.assert_awaited_with("message:replay", {
+            "chat_id": self.chat.short_id, "messages": [sent], "truncated": False,
+        }, to="sid")
+
+
+class RecentMessagesTest(TestSetup):
+    """
+    @brief Test case for the recent messages cache behind MessageView's first page.
+    @details Tests cached pages against the database path, appends from the write paths
+             and eviction.
+    """
+
+    def setUp(self):
+        """
+        @brief Enables the cache and adds four more messages to the test chat.
+        """
+        super().setUp()
+        recent_messages.enabled = True
+        self.addCleanup(setattr, recent_messages, "enabled", False)
+        for index in range(4):
+            ChatMessage.objects.create(chat=self.chat, sender=self.user2, text=f"message {index}")
+        self.url = reverse('messages') + f'?chat_id={self.chat.short_id}'
+
+    def get(self, query=""):
+        """
+        @brief Reads the test chat's history.
+        @param query Extra query parameters.
+        @return tuple The response data and the number of queries on the message table.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url + query, **self.auth_headers(self.token))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data, sum('"app_chatmessage"' in q["sql"] for q in queries.captured_queries)
+
+    def test_first_page_is_cached(self):
+        """
+        @brief Tests serving the first page from the cache.
+        @details Ensures a cached page matches the database's, cursors included, and that
+                 its `before` cursor leads on to the older messages.
+        """
+        recent_messages.enabled = False
+        try:
+            expected, _ = self.get("&limit=2")
+        finally:
+            recent_messages.enabled = True
+        self.assertEqual(self.get("&limit=2"), (expected, 1))
+        self.assertEqual(self.get("&limit=2"), (expected, 0))
+        older, _ = self.get(f"&limit=2&before={expected['before']}")
+        self.assertEqual([message["text"] for message in older["payload"]], ["message 0", "message 1"])
+        stats = recent_messages.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["chats"]), (1, 1, 1))
+        self.assertGreater(stats["bytes"], 0)
+
+    def test_new_messages_are_appended(self):
+        """
+        @brief Tests that messages sent after the window was cached are served from it.
+        """
+        self.get()
+        ChatMessage.objects.create(chat=self.chat, sender=self.user1, text="saved")
+        session = {"user_id": self.user1.pk, "user": userSerializer(self.user1).data}
+        with patch.object(sockets.sio, "get_session", new=AsyncMock(return_value=session)), \
+             patch.object(sockets.sio, "emit", new=AsyncMock()):
+            async_to_sync(sockets.messageRecieve)("sid", {"chat_id": self.chat.short_id, "message": "sent"})
+        data, queries = self.get("&limit=3")
+        self.assertEqual(queries, 0)
+        self.assertEqual([message["text"] for message in data["payload"]], ["message 3", "saved", "sent"])
+        self.assertTrue(data["has_more"])
+
+    def test_eviction(self):
+        """
+        @brief Tests the memory bound and the eviction of idle chats.
+        """
+        other = Chat.objects.create(initiator=self.user2, acceptor=self.user1)
+        ChatMessage.objects.create(chat=other, sender=self.user2, text="other")
+        cache = RecentMessages(size=10, max_bytes=1)
+        request = SimpleNamespace(query_params={"limit": "10"})
+        paginator = MessageView.paginator
+        for chat in (self.chat, other):
+            cache.page(chat.pk, ChatMessage.objects.filter(chat=chat), paginator, request)
+        self.assertEqual(cache.stats()["evictions"], 2)
+        self.assertEqual(cache.stats()["bytes"], 0)
+
+        cache = RecentMessages(size=10, idle=0.05)
+        cache.page(self.chat.pk, ChatMessage.objects.filter(chat=self.chat), paginator, request)
+        time.sleep(0.1)
+        cache.page(other.pk, ChatMessage.objects.filter(chat=other), paginator, request)
+        self.assertEqual((cache.stats()["chats"], cache.stats()["idle_evictions"]), (1, 1))
+
+
+class ReadPositionsTest(TestSetup):
+    """
+    @brief Test case for read positions and the unread counts kept from them.
+    @details Tests the counts kept by the message write paths, coalesced `message:read`
+             reports and the unread counts endpoint.
+    """
+
+    def setUp(self):
+        """
+        @brief Empties the pending read positions.
+        """
+        super().setUp()
+        read_positions.clear()
+
+    def unread(self, user):
+        """
+        @brief Reads a user's stored unread count in the test chat.
+        @param user The user.
+        @return int The unread count.
+        """
+        return ReadPosition.objects.get(user=user, chat=self.chat).unread_count
+
+    def test_backfill(self):
+        """
+        @brief Tests the backfill of chats older than read tracking.
+        @details Ensures missing positions count the other participant's messages after the
+                 user's own newest one, and that running the backfill again changes nothing.
+        """
+        ReadPosition.objects.all().delete()
+        ChatMessage.objects.create(chat=self.chat, sender=self.user2, text="one")
+        ChatMessage.objects.create(chat=self.chat, sender=self.user2, text="two")
+        call_command("backfill_read_positions", stdout=io.StringIO())
+        self.assertEqual((self.unread(self.user1), self.unread(self.user2)), (2, 0))
+        self.assertEqual(
+            ReadPosition.objects.get(user=self.user1, chat=self.chat).last_read_message_id, self.chat_message.id
+        )
+
+        ChatMessage.objects.create(chat=self.chat, sender=self.user2, text="three")
+        call_command("backfill_read_positions", stdout=io.StringIO())
+        self.assertEqual((self.unread(self.user1), self.unread(self.user2)), (3, 0))
+        self.assertEqual(self.client.get(reverse('unread'), **self.auth_headers(self.token)).data["payload"],
+                         {str(self.chat.short_id): 3})
+
+    def test_recover_twice_counts_once(self):
+        """
+        @brief Tests that recovering a journal already written does not count its messages again.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "spill.jsonl")
+            write_behind = MessageWriteBehind(enabled=True, spill_path=path)
+            message = ChatMessage(id=write_behind.ids.next_id(), chat=self.chat, sender=self.user2, text="spilled")
+            message.created_at = timezone.now()
+            write_behind._queue.append(message)
+            write_behind.spill()
+            with open(path, encoding="utf-8") as journal:
+                spilled = journal.read()
+
+            async_to_sync(write_behind.recover)()
+            self.assertEqual(self.unread(self.user1), 1)
+            with open(path, "w", encoding="utf-8") as journal:
+                journal.write(spilled)
+            async_to_sync(write_behind.recover)()
+            self.assertEqual(self.unread(self.user1), 1)
+
+    def test_counts_follow_new_messages(self):
+        """
+        @brief Tests the counts kept by the message save signal and in batches.
+        @details Ensures a message counts as unread for the other participant only and
+                 that sending a message marks the chat as read for its sender.
+        """
+        self.assertEqual((self.unread(self.user1), self.unread(self.user2)), (0, 1))
+        ChatMessage.objects.create(chat=self.chat, sender=self.user2, text="one")
+        ChatMessage.objects.create(chat=self.chat, sender=self.user2, text="two")
+        self.assertEqual((self.unread(self.user1), self.unread(self.user2)), (2, 0))
+
+        # A write-behind batch: user2 answers once, user1 replies, then user2 twice more.
+        batch = ChatMessage.objects.bulk_create([
+            ChatMessage(chat=self.chat, sender=sender, text="batched")
+            for sender in (self.user2, self.user1, self.user2, self.user2)
+        ])
+        recordUnread(batch)
+        self.assertEqual((self.unread(self.user1), self.unread(self.user2)), (2, 0))
+        position = ReadPosition.objects.get(user=self.user2, chat=self.chat)
+        self.assertEqual(position.last_read_message_id, batch[-1].id)
+
+    def test_message_read_is_coalesced(self):
+        """
+        @brief Tests reports of read messages over the socket.
+        @details Ensures repeated reports are written once, recount the messages after
+                 the newest one read, and never move the position back.
+        """
+        messages = [ChatMessage.objects.create(chat=self.chat, sender=self.user2, text=f"m{index}") for index in range(3)]
+        session = {"user_id": self.user1.pk, "user": userSerializer(self.user1).data}
+        with patch.object(sockets.sio, "get_session", new=AsyncMock(return_value=session)), \
+             patch.object(sockets.sio, "emit", new=AsyncMock()) as emit:
+            for message in (messages[0], messages[1], messages[0]):
+                async_to_sync(sockets.messageRead)("sid", {"chat_id": self.chat.short_id, "message_id": message.id})
+            async_to_sync(sockets.messageRead)("sid", {"chat_id": "missing", "message_id": messages[2].id})
+        emit.assert_awaited_once()
+        self.assertEqual(read_positions.stats()["pending"], 1)
+
+        async_to_sync(read_positions.flush)()
+        position = ReadPosition.objects.get(user=self.user1, chat=self.chat)
+        self.assertEqual((position.last_read_message_id, position.unread_count), (messages[1].id, 1))
+        self.assertEqual(read_positions.write({(self.user1.pk, self.chat.pk): messages[0].id}), 0)
+        self.assertEqual(read_positions.stats()["written"], 1)
+
+    def test_unread_counts_view(self):
+        """
+        @brief Tests the unread counts endpoint.
+        @details Ensures every chat of the user is listed, chats without a read position
+                 as read.
+        """
+        user3 = User.objects.create_user(username='user3', password='password123')
+        quiet = Chat.objects.create(initiator=user3, acceptor=self.user1)
+        ReadPosition.objects.filter(chat=quiet).delete()
+        ChatMessage.objects.create(chat=self.chat, sender=self.user2, text="unread")
+        response = self.client.get(reverse('unread'), **self.auth_headers(self.token))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['payload'], {str(self.chat.short_id): 1, str(quiet.short_id): 0})
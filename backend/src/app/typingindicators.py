@@ -0,0 +1,224 @@
+"""
+@file typingindicators.py
+@brief Coalesced typing indicators for the Socket.IO layer.
+@details This file contains the TypingIndicators throttle behind the `typing:start` and
+         `typing:stop` socket events. Clients may send `typing:start` on every keystroke;
+         the server forwards at most one state change per (sid, chat) every `interval`
+         seconds as a `typing:update` event to the chat room, so typing traffic through
+         the client manager stays bounded however fast users type. A typing state that is
+         not refreshed within `expiry` seconds turns into a stop on its own.
+"""
+
+import asyncio
+import logging
+import time
+from django.conf import settings
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class TypingState:
+    """
+    @brief The typing state of one connection in one chat.
+    """
+    __slots__ = ("username", "wanted", "published", "changed_at", "expires_at")
+
+    def __init__(self, username):
+        """
+        @brief Initializes a state that is not typing.
+        @param username The typing user's username, sent with the updates.
+        """
+        self.username = username
+        self.wanted = False
+        self.published = False
+        self.changed_at = float("-inf")
+        self.expires_at = 0.0
+
+
+class TypingIndicators:
+    """
+    @brief Debounces and throttles typing state changes per (sid, chat).
+    @details A change is forwarded straight away when the last forwarded change of the
+             same (sid, chat) is at least `interval` seconds old; otherwise it waits for the
+             background tick, by which time it may have been undone and is dropped. The
+             state lives on the event loop and is only touched from it.
+    """
+
+    def __init__(self, enabled=True, interval=1.0, expiry=5.0):
+        """
+        @brief Initializes the throttle.
+        @param enabled Whether the socket handlers forward typing events at all.
+        @param interval The shortest time in seconds between two forwarded changes of one
+                        (sid, chat); 0 forwards every change.
+        @param expiry Seconds after the last `typing:start` at which typing stops by itself.
+        """
+        self.enabled = enabled
+        self.interval = interval
+        self.expiry = expiry
+        self.server = None
+        self.received = 0
+        self.forwarded = 0
+        self.expired = 0
+        self._states = {}
+        self._chats = {}
+        self._task = None
+
+    @classmethod
+    def from_settings(cls):
+        """
+        @brief Builds the throttle from the TYPING_INDICATORS setting.
+        @return TypingIndicators The configured throttle.
+        """
+        options = getattr(settings, "TYPING_INDICATORS", {})
+        return cls(
+            enabled=options.get("ENABLED", True),
+            interval=options.get("INTERVAL", 1.0),
+            expiry=options.get("EXPIRY", 5.0),
+        )
+
+    def attach(self, server):
+        """
+        @brief Sets the Socket.IO server that typing updates are emitted through.
+        @param server The AsyncServer.
+        """
+        self.server = server
+
+    def _ensure_started(self):
+        """
+        @brief Starts the background ticker on the running event loop, once.
+        """
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._task.get_loop() is loop:
+            return
+        self._task = loop.create_task(self._run())
+
+    async def _publish(self, sid, chat_id, state, now):
+        """
+        @brief Forwards a state's wanted value to the chat room, except to its own sid.
+        @param sid The typing connection's sid.
+        @param chat_id The chat's short_id, which is also its room.
+        @param state The TypingState.
+        @param now The current monotonic time.
+        """
+        state.published = state.wanted
+        state.changed_at = now
+        self.forwarded += 1
+        await self.server.emit("typing:update", {
+            "chat_id": chat_id,
+            "username": state.username,
+            "typing": state.published,
+        }, room=chat_id, skip_sid=sid)
+
+    async def update(self, sid, chat_id, username, typing):
+        """
+        @brief Handles a `typing:start` or `typing:stop` event.
+        @param sid The connection's sid.
+        @param chat_id The chat's short_id.
+        @param username The typing user's username.
+        @param typing True for `typing:start`, False for `typing:stop`.
+        @return bool Whether the event was forwarded straight away.
+        """
+        self.received += 1
+        now = time.monotonic()
+        key = (sid, chat_id)
+        state = self._states.get(key)
+        if state is None:
+            if not typing:
+                return False
+            state = self._states[key] = TypingState(username)
+            self._chats.setdefault(sid, set()).add(chat_id)
+            self._ensure_started()
+        state.wanted = typing
+        if typing:
+            state.expires_at = now + self.expiry
+        if state.published != state.wanted and now - state.changed_at >= self.interval:
+            await self._publish(sid, chat_id, state, now)
+            return True
+        return False
+
+    async def flush(self):
+        """
+        @brief Runs one tick: expires stale typing states and forwards held back changes.
+        @details States that are idle for longer than `interval` are forgotten.
+        @return int The number of changes forwarded.
+        """
+        now = time.monotonic()
+        forwarded = 0
+        for (sid, chat_id), state in list(self._states.items()):
+            if state.wanted and state.expires_at <= now:
+                state.wanted = False
+                self.expired += 1
+            if state.published != state.wanted:
+                if now - state.changed_at >= self.interval:
+                    await self._publish(sid, chat_id, state, now)
+                    forwarded += 1
+            elif not state.wanted and now - state.changed_at >= self.interval:
+                del self._states[(sid, chat_id)]
+                chats = self._chats.get(sid)
+                if chats is not None:
+                    chats.discard(chat_id)
+                    if not chats:
+                        del self._chats[sid]
+        return forwarded
+
+    async def disconnect(self, sid):
+        """
+        @brief Forgets a closed connection and stops its published typing states.
+        @param sid The connection's sid.
+        """
+        for chat_id in self._chats.pop(sid, ()):
+            state = self._states.pop((sid, chat_id), None)
+            if state is not None and state.published:
+                state.wanted = False
+                await self._publish(sid, chat_id, state, time.monotonic())
+
+    async def _run(self):
+        """
+        @brief Background loop running a tick every `interval` seconds, or at least once
+               per `expiry`.
+        """
+        while True:
+            await asyncio.sleep(min(self.interval, self.expiry) or 0.1)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("typing indicator tick failed")
+
+    async def stop(self):
+        """
+        @brief Stops the background ticker.
+        """
+        task, self._task = self._task, None
+        if task is not None and task.get_loop() is asyncio.get_running_loop():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    def clear(self):
+        """
+        @brief Forgets every typing state and resets the counters.
+        """
+        self._states.clear()
+        self._chats.clear()
+        self.received = self.forwarded = self.expired = 0
+
+    def stats(self):
+        """
+        @brief Returns the throttle's counters.
+        @return dict Tracked states, received events, forwarded changes, the share of
+                     events suppressed and expired states.
+        """
+        return {
+            "enabled": self.enabled,
+            "states": len(self._states),
+            "received": self.received,
+            "forwarded": self.forwarded,
+            "suppressed_ratio": 1 - self.forwarded / self.received if self.received else None,
+            "expired": self.expired,
+        }
+
+
+typing_indicators = TypingIndicators.from_settings()
+""" @brief The process-wide typing indicator throttle used by the socket handlers. """
+
+metrics.register("typing_indicators", typing_indicators.stats)
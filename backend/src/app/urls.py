@@ -7,6 +7,7 @@
 
 from django.urls import path
 from . import views
+from .metrics import MetricsView
 
 # --------------------------------------------------------------
 # @var urlpatterns
@@ -23,6 +24,10 @@ urlpatterns = [
     # @details Maps the 'request' URL to the IntrestRequestView, which handles the 
     #          creation and status updatation of interest requests.
     path('request', views.IntrestRequestView.as_view(), name="request"),
+
+    # @brief Route for sending and answering many interest requests at once.
+    # @details Maps the 'request/bulk' URL to the IntrestRequestBulkView view.
+    path('request/bulk', views.IntrestRequestBulkView.as_view(), name="request_bulk"),
     
     # @brief Route for listing users.
     # @details Maps the 'list_users' URL to the ListUsers view, which returns a list of users.
@@ -42,4 +47,24 @@ urlpatterns = [
     # @details Maps the 'messages' URL to the MessageView view, which handles the
     #           createtion and listing messages.
     path('messages', views.MessageView.as_view(), name="messages"),
+
+    # @brief Route for searching messages.
+    # @details Maps the 'messages/search' URL to the MessageSearchView view, which
+    #           searches the messages of the requesting user's chats.
+    path('messages/search', views.MessageSearchView.as_view(), name="message_search"),
+
+    # @brief Route for looking up presence.
+    # @details Maps the 'presence' URL to the PresenceView view, which tells which of
+    #           the given users are online.
+    path('presence', views.PresenceView.as_view(), name="presence"),
+
+    # @brief Route for reading unread counts.
+    # @details Maps the 'unread' URL to the UnreadCountsView view, which returns the
+    #           unread count of every chat of the user.
+    path('unread', views.UnreadCountsView.as_view(), name="unread"),
+
+    # @brief Route for reading runtime counters.
+    # @details Maps the 'metrics' URL to the MetricsView view, which returns the
+    #           cache and queue counters of this process to staff users.
+    path('metrics', MetricsView.as_view(), name="metrics"),
 ]
\ No newline at end of file
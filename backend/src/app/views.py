@@ -11,11 +11,24 @@ from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from .serializers import IntrestRequestSerializer, ChatSerializer, MessageSerializer
+from .serializers import IntrestRequestSerializer, ChatSerializer, InboxSerializer, MessageSearchSerializer
 from django.contrib.auth import get_user_model
 from .models import IntrestRequest, Chat, ChatMessage
-from authentication.serializers import userSerializer
-from django.db.models import Q
+from django.db.models import Exists, OuterRef, Q
+from .pagination import KeysetPaginator
+from .chatcache import chat_cache
+from .recentmessages import recent_messages
+from .profilecache import profile_cache
+from .inbox import inboxQueryset, unreadCounts
+from .querybudget import query_budget
+from .search import searchTerms
+from .fastserializers import (
+    CHAT_VALUES, INTREST_REQUEST_VALUES, MESSAGE_VALUES,
+    chatFromValues, intrestRequestFromValues, messageFromValues, serializeValues,
+)
+from .messagesearch import searchMessages
+from .presence import presence
+from .intrestrequests import STATUSES, answerRequests, sendRequests
 
 User = get_user_model()
 
@@ -44,16 +57,18 @@ class IntrestRequestView(APIView):
     """
     permission_classes = [IsAuthenticated]
 
+    @query_budget(1)
     def get(self, request):
         """
         @brief Handles GET requests to retrieve pending IntrestRequest instances.
         @param request The HTTP request object.
         @return Response A Response object containing the serialized data of pending requests.
         """
-        intrest_requests = IntrestRequest.objects.filter(request_to=request.user, status="pending")
-        serializer = IntrestRequestSerializer(intrest_requests, many=True)
+        intrest_requests = IntrestRequest.objects.filter(
+            request_to=request.user, status="pending"
+        ).values(*INTREST_REQUEST_VALUES)
         return Response({
-            "payload": serializer.data
+            "payload": serializeValues(intrest_requests, intrestRequestFromValues)
         }, status=status.HTTP_200_OK)
 
     def post(self, request):
@@ -95,42 +110,131 @@ class IntrestRequestView(APIView):
         }, status=status.HTTP_200_OK)
 
 
+class IntrestRequestBulkView(APIView):
+    """
+    @brief View for sending and answering many IntrestRequest instances at once.
+    @details This view handles POST requests sending requests to a list of usernames and
+             PATCH requests accepting or rejecting a list of the user's pending requests.
+             Each call runs a fixed number of queries however many items it carries, and
+             returns one result per item. Only authenticated users are allowed to access
+             this view.
+    """
+    permission_classes = [IsAuthenticated]
+
+    max_items = 500
+    """ @brief The largest number of items in one call. """
+
+    def invalid(self, error):
+        """
+        @brief Builds the response to a malformed bulk call.
+        @param error The error details.
+        @return Response A 400 Response.
+        """
+        return Response({
+            'status': 400,
+            'error': error,
+            'message': "something went wrong"
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    # Budgets are for `max_items` items on SQLite, which splits large writes into batches.
+    @query_budget(7)
+    def post(self, request):
+        """
+        @brief Handles POST requests to send requests to many users.
+        @param request The HTTP request object containing the `request_to` list of usernames.
+        @return Response A Response object with one `{"username", "result", "request_id"}`
+                         item per distinct username.
+        """
+        usernames = request.data.get("request_to")
+        if not isinstance(usernames, list) or not all(isinstance(name, str) for name in usernames):
+            return self.invalid({'request_to': ['a list of usernames is required']})
+        if not 0 < len(usernames) <= self.max_items:
+            return self.invalid({'request_to': [f'between 1 and {self.max_items} usernames can be sent at once']})
+
+        return Response({
+            'payload': sendRequests(request.user, usernames),
+            'message': 'requests processed'
+        }, status=status.HTTP_200_OK)
+
+    @query_budget(12)
+    def patch(self, request):
+        """
+        @brief Handles PATCH requests to accept or reject many requests in one transaction.
+        @param request The HTTP request object containing the `requests` list of
+                       `{"request_id", "status"}` items.
+        @return Response A Response object with one `{"request_id", "result"}` item per
+                         distinct request id.
+        """
+        items = request.data.get("requests")
+        if not isinstance(items, list) or not 0 < len(items) <= self.max_items:
+            return self.invalid({'requests': [f'between 1 and {self.max_items} requests can be answered at once']})
+        answers = []
+        for item in items:
+            if not isinstance(item, dict) or item.get("status") not in STATUSES:
+                return self.invalid({'requests': [f'every item needs a request_id and a status in {sorted(STATUSES)}']})
+            try:
+                answers.append((int(item.get("request_id")), item["status"]))
+            except (TypeError, ValueError):
+                return self.invalid({'requests': ['request_id must be an integer']})
+
+        return Response({
+            'payload': answerRequests(request.user, answers),
+            'message': 'requests processed'
+        }, status=status.HTTP_200_OK)
+
+
 class ListUsers(APIView):
     """
     @brief View for listing users excluding those with existing interest requests.
     @details This view handles GET requests to retrieve a list of users that the 
-             current user has not sent an interest request to.
+             current user has not sent an interest request to and is not friends with.
+             Users are listed by username, or by search rank when searching, and paged
+             with a keyset cursor.
     """
     permission_classes = [IsAuthenticated]
 
+    paginator = KeysetPaginator(("username",), default_limit=50, max_limit=100)
+    """
+    @brief Paginator for the user directory.
+    @details Pages run in username order; pass `after` for the next page.
+    """
+
+    search_paginator = KeysetPaginator(("kind", "term", "user_id"), default_limit=20, max_limit=100)
+    """
+    @brief Paginator for search results over UserSearchTerm rows.
+    @details Pages run from the best ranked match; pass `after` for the next page.
+    """
+
+    @query_budget(1)
     def get(self, request):
         """
         @brief Handles GET requests to list users.
-        @param request The HTTP request object.
-        @return Response A Response object containing a list of serialized user data.
+        @param request The HTTP request object, optionally with a search string `s`,
+                       `after`/`before` cursors and `limit`.
+        @return Response A Response object containing a page of serialized user data.
         """
         query = request.query_params.get('s')
-        intrest_requests = IntrestRequest.objects.filter(request_from=request.user)
-        
-        exclude_users = [intrest_request.request_to.username for intrest_request in intrest_requests]
-        
-        if query is None:
-            users = User.objects.all().exclude(
-                Q(username = request.user.username) | 
-                Q(username__in = exclude_users) | 
-                Q(friends = request.user)
-            )
-        else:
-            users = User.objects.filter(username__icontains=query).exclude(
-                Q(username = request.user.username) | 
-                Q(username__in = exclude_users) | 
-                Q(friends = request.user)
-            )
-        
-        serializer = userSerializer(users, many=True)
-        return Response({
-            "payload": serializer.data
-        })
+
+        # Excluded users are expressed as id subqueries, so the database does the
+        # anti-join however many requests the user has sent.
+        requested = IntrestRequest.objects.filter(request_from=request.user).values("request_to_id")
+        friends = User.friends.through.objects.filter(
+            from_customuser=request.user
+        ).values("to_customuser_id")
+
+        terms = None if query is None else searchTerms(
+            query, excluded=[requested, friends, [request.user.pk]]
+        )
+        if terms is not None:
+            # Search results are read off the search term index, one row per user.
+            page = self.search_paginator.paginate(terms, request)
+            return Response(page.as_dict([profile_cache.get(term.user) for term in page.rows]))
+
+        users = User.objects.exclude(pk=request.user.pk).exclude(
+            pk__in=requested
+        ).exclude(pk__in=friends)
+        page = self.paginator.paginate(users, request)
+        return Response(page.as_dict([profile_cache.get(user) for user in page.rows]))
 
 
 class IntrestRequestExists(APIView):
@@ -158,20 +262,35 @@ class ChatsView(APIView):
     """
     @brief View for handling chat operations.
     @details This view handles GET and POST requests for retrieving and creating chats.
+             With `?inbox=1` it lists the chats as an inbox: most recently active first,
+             with the last message and unread count, paged with a keyset cursor.
              Only authenticated users are allowed to access this view.
     """
     permission_classes = [IsAuthenticated]
+
+    inbox_paginator = KeysetPaginator(("last_activity_at", "id"), default_limit=30, max_limit=100, descending=True)
+    """
+    @brief Paginator for the inbox.
+    @details Pages run from the most recently active chat; pass `after` for the next page.
+    """
     
+    @query_budget(1)
     def get(self, request):
         """
         @brief Handles GET requests to retrieve the list of chats.
-        @param request The HTTP request object.
+        @param request The HTTP request object, optionally with `inbox`, `after`, `before` and `limit`.
         @return Response A Response object containing the list of chats.
         """
-        chats = Chat.objects.filter(Q(initiator=request.user) | Q(acceptor=request.user))
-        serializer = ChatSerializer(chats, many=True)
+        if request.query_params.get("inbox"):
+            page = self.inbox_paginator.paginate(inboxQueryset(request.user), request)
+            serializer = InboxSerializer(page.rows, many=True)
+            return Response(page.as_dict(serializer.data), status=status.HTTP_200_OK)
+
+        chats = Chat.objects.filter(
+            Q(initiator=request.user) | Q(acceptor=request.user)
+        ).values(*CHAT_VALUES)
         return Response({
-            "payload": serializer.data
+            "payload": serializeValues(chats, chatFromValues)
         }, status=status.HTTP_200_OK)
         
     def post(self, request):
@@ -202,15 +321,26 @@ class MessageView(APIView):
     """
     @brief View for handling chat messages.
     @details This view handles GET requests to retrieve chat messages for a specific chat.
+             Messages are paged with a keyset cursor over (created_at, id), newest page first.
+             The newest page is served from the recent messages cache when it can be.
              Only authenticated users are allowed to access this view.
     """
     permission_classes = [IsAuthenticated]
 
+    paginator = KeysetPaginator(("created_at", "id"), default_limit=50, max_limit=200, from_end=True)
+    """
+    @brief Paginator for the chat history.
+    @details Pages are returned oldest to newest; pass `before` to load older messages
+             and `after` to load newer ones.
+    """
+
+    @query_budget(2)
     def get(self, request):
         """
         @brief Handles GET requests to retrieve chat messages.
-        @param request The HTTP request object containing the chat ID.
-        @return Response A Response object containing the list of chat messages.
+        @param request The HTTP request object containing the chat ID and optional
+                       `before`/`after` cursors and `limit`.
+        @return Response A Response object containing a page of chat messages and its cursors.
         """
         chat_id = request.query_params.get("chat_id")
 
@@ -219,8 +349,114 @@ class MessageView(APIView):
                 "payload": []
             })
         
-        messages = ChatMessage.objects.filter(chat__short_id=chat_id)
-        serializer = MessageSerializer(messages, many=True)
+        chat = chat_cache.get(chat_id)
+        if chat is None:
+            messages = ChatMessage.objects.none()
+        else:
+            messages = ChatMessage.objects.filter(chat_id=chat.pk)
+            # The newest page of an active chat is usually cached.
+            page = recent_messages.page(chat.pk, messages, self.paginator, request)
+            if page is not None:
+                return Response(page.as_dict(page.rows))
+        page = self.paginator.paginate(messages.values(*MESSAGE_VALUES), request)
+        return Response(page.as_dict(serializeValues(page.rows, messageFromValues)))
+
+
+class MessageSearchView(APIView):
+    """
+    @brief View for searching the messages of the requesting user's chats.
+    @details This view handles GET requests with a `q` search string. Every word must
+             match and the last word matches as a prefix. Only chats where the user is the
+             initiator or the acceptor are searched. Only authenticated users are allowed
+             to access this view.
+    """
+    permission_classes = [IsAuthenticated]
+
+    paginator = KeysetPaginator(("match_id",), default_limit=20, max_limit=100, descending=True)
+    """
+    @brief Paginator for the search results.
+    @details Results are returned newest first; pass `after` to load older matches.
+    """
+
+    @query_budget(1)
+    def get(self, request):
+        """
+        @brief Handles GET requests to search messages.
+        @param request The HTTP request object containing the search string `q` and
+                       optional `before`/`after` cursors and `limit`.
+        @return Response A Response object containing a page of matching messages with
+                         snippets and its cursors.
+        """
+        messages = searchMessages(request.user, request.query_params.get("q", ""))
+
+        if messages is None:
+            return Response({
+                "payload": []
+            })
+
+        page = self.paginator.paginate(messages, request)
+        serializer = MessageSearchSerializer(page.rows, many=True)
+        return Response(page.as_dict(serializer.data))
+
+
+class PresenceView(APIView):
+    """
+    @brief View for looking up whether users are online.
+    @details This view handles GET requests with a comma separated `users` list of
+             usernames, the chat partners of the chat list, and answers from the presence
+             service without writing to the database. Only users who share a chat with
+             the requesting user are looked up; everyone else reads as offline. Only
+             authenticated users are allowed to access this view.
+    """
+    permission_classes = [IsAuthenticated]
+
+    max_users = 200
+    """ @brief The largest number of usernames looked up at once. """
+
+    @query_budget(1)
+    def get(self, request):
+        """
+        @brief Handles GET requests to look up presence.
+        @param request The HTTP request object containing the `users` list.
+        @return Response A Response object mapping every requested username to whether
+                         the user is online; unknown usernames and users without a chat
+                         with the requesting user are offline.
+        """
+        usernames = [name for name in request.query_params.get("users", "").split(",") if name]
+        if len(usernames) > self.max_users:
+            return Response({
+                'status': 400,
+                'error': {'users': [f'at most {self.max_users} users can be looked up at once']},
+                'message': "something went wrong"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        partners = User.objects.filter(username__in=usernames).filter(Exists(Chat.objects.filter(
+            Q(initiator=request.user, acceptor=OuterRef("pk")) | Q(acceptor=request.user, initiator=OuterRef("pk"))
+        )))
+        ids = dict(partners.values_list("pk", "username")) if usernames else {}
+        online = presence.lookupSync(ids)
         return Response({
-            "payload": serializer.data
-        })
+            "payload": {name: False for name in usernames} | {ids[user_id]: True for user_id in online}
+        }, status=status.HTTP_200_OK)
+
+
+class UnreadCountsView(APIView):
+    """
+    @brief View for reading the unread counts of all of the user's chats.
+    @details This view handles GET requests and returns the unread count of every chat of
+             the requesting user in one query, read from the counts kept by the message
+             write paths. Reads reported over the socket show up after the next write of
+             the read positions. Only authenticated users are allowed to access this view.
+    """
+    permission_classes = [IsAuthenticated]
+
+    @query_budget(1)
+    def get(self, request):
+        """
+        @brief Handles GET requests to read the unread counts.
+        @param request The HTTP request object.
+        @return Response A Response object mapping every chat's short_id to its unread count.
+        """
+        return Response({
+            "payload": unreadCounts(request.user)
+        }, status=status.HTTP_200_OK)
@@ -0,0 +1,402 @@
+"""
+@file writebehind.py
+@brief Write-behind persistence of chat messages for the Socket.IO layer.
+@details This file contains the MessageIdAllocator, which hands out message ids before
+         a row reaches the database, and the MessageWriteBehind queue, which collects
+         ChatMessage rows from the `message:send` handler and inserts them in batches
+         from a background task. Rows that cannot be written before shutdown are spilled
+         to a journal file and inserted again on the next startup.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DataError, IntegrityError, transaction
+from django.utils.dateparse import parse_datetime
+from .models import ChatMessage
+from .inbox import arecordLastMessages, arecordUnread
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def journalRow(message):
+    """
+    @brief Encodes a queued message as one line of a journal file.
+    @param message The unsaved ChatMessage.
+    @return dict The message's columns, ready for `json.dumps`.
+    """
+    return {
+        "id": message.id,
+        "chat_id": message.chat_id,
+        "sender_id": message.sender_id,
+        "text": message.text,
+        "created_at": message.created_at.isoformat(),
+    }
+
+
+class MessageIdAllocator:
+    """
+    @brief Generates time-ordered 53-bit message ids without a database round trip.
+    @details Each id packs the milliseconds since 2024-01-01 (40 bits), a worker id
+             (7 bits) and a per-millisecond sequence (6 bits). Ids stay below 2**53 so
+             they survive being parsed as a JavaScript number, and ids from one worker
+             are strictly increasing. Every process writing messages must use a
+             distinct worker id.
+    """
+
+    EPOCH_MS = 1704067200000
+    """ @brief 2024-01-01T00:00:00Z in milliseconds. """
+
+    WORKER_BITS = 7
+    """ @brief Number of bits reserved for the worker id. """
+
+    SEQUENCE_BITS = 6
+    """ @brief Number of bits reserved for the per-millisecond sequence. """
+
+    def __init__(self, worker_id=0):
+        """
+        @brief Initializes the allocator.
+        @param worker_id The worker id, distinct for every process writing messages.
+        @throws ValueError if the worker id does not fit in WORKER_BITS.
+        """
+        if not 0 <= worker_id < (1 << self.WORKER_BITS):
+            raise ValueError(f"worker_id must be between 0 and {(1 << self.WORKER_BITS) - 1}")
+        self.worker_id = worker_id
+        self._last_ms = -1
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def next_id(self):
+        """
+        @brief Returns the next message id.
+        @details Waits for the next millisecond when the sequence of the current one is exhausted.
+        @return int A new, unique message id.
+        """
+        with self._lock:
+            now = int(time.time() * 1000) - self.EPOCH_MS
+            if now < self._last_ms:
+                # The clock went backwards, keep issuing ids from the last timestamp.
+                now = self._last_ms
+            if now == self._last_ms:
+                self._sequence = (self._sequence + 1) & ((1 << self.SEQUENCE_BITS) - 1)
+                if self._sequence == 0:
+                    while now <= self._last_ms:
+                        now = int(time.time() * 1000) - self.EPOCH_MS
+            else:
+                self._sequence = 0
+            self._last_ms = now
+            return (
+                (now << (self.WORKER_BITS + self.SEQUENCE_BITS))
+                | (self.worker_id << self.SEQUENCE_BITS)
+                | self._sequence
+            )
+
+
+class MessageWriteBehind:
+    """
+    @brief Batches ChatMessage inserts behind the socket handlers.
+    @details Messages are put on an in-memory queue with their id already assigned, so the
+             handler can emit them straight away. A background task inserts the queue with
+             `bulk_create` whenever it holds `batch_size` rows or `flush_interval` seconds have
+             passed. When the queue reaches `max_queue` rows, `put` waits for a flush instead
+             of growing without bound. A batch the database refuses is retried one row at a
+             time; rows refused on their own, e.g. of a chat deleted while they were queued,
+             go to the dead-letter journal so they do not hold back the rows behind them.
+    """
+
+    def __init__(self, enabled=False, batch_size=200, flush_interval=0.05, max_queue=10000,
+                 spill_path=None, dead_letter_path=None, worker_id=0):
+        """
+        @brief Initializes the write-behind queue.
+        @param enabled Whether the socket layer should use write-behind persistence.
+        @param batch_size The largest number of rows inserted by one `bulk_create`.
+        @param flush_interval The longest time in seconds a row waits in the queue.
+        @param max_queue The number of queued rows at which producers are made to wait.
+        @param spill_path Journal file for rows left over at shutdown, or None to disable it.
+        @param dead_letter_path Journal file for rows the database refuses, or None to only log them.
+        @param worker_id The worker id handed to the MessageIdAllocator.
+        """
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.spill_path = spill_path
+        self.dead_letter_path = dead_letter_path
+        self.ids = MessageIdAllocator(worker_id)
+        self.flushed = 0
+        self.failed_flushes = 0
+        self.dead_letters = 0
+        self._queue = deque()
+        self._wakeup = None
+        self._flush_lock = None
+        self._task = None
+        self._stopping = False
+
+    @classmethod
+    def from_settings(cls):
+        """
+        @brief Builds the queue from the CHAT_WRITE_BEHIND setting.
+        @details Processes sharing a worker id hand out the same ids, which the database
+                 then refuses after the messages were emitted, so an enabled queue needs an
+                 explicit WORKER_ID.
+        @return MessageWriteBehind The configured queue.
+        @throws ImproperlyConfigured if the queue is enabled without a valid WORKER_ID.
+        """
+        options = getattr(settings, "CHAT_WRITE_BEHIND", {})
+        worker_id = options.get("WORKER_ID")
+        if worker_id is None:
+            if options.get("ENABLED", False):
+                raise ImproperlyConfigured("CHAT_WRITE_BEHIND['WORKER_ID'] is required when write-behind is enabled")
+            worker_id = 0
+        try:
+            worker_id = int(worker_id)
+            MessageIdAllocator(worker_id)
+        except ValueError as error:
+            raise ImproperlyConfigured(f"CHAT_WRITE_BEHIND['WORKER_ID']: {error}") from error
+        return cls(
+            enabled=options.get("ENABLED", False),
+            batch_size=options.get("BATCH_SIZE", 200),
+            flush_interval=options.get("FLUSH_INTERVAL", 0.05),
+            max_queue=options.get("MAX_QUEUE", 10000),
+            spill_path=options.get("SPILL_PATH"),
+            dead_letter_path=options.get("DEAD_LETTER_PATH"),
+            worker_id=worker_id,
+        )
+
+    def __len__(self):
+        """
+        @brief Returns the number of rows waiting to be written.
+        """
+        return len(self._queue)
+
+    def stats(self):
+        """
+        @brief Returns the queue's counters.
+        @return dict The queue length, the number of rows written, failed flushes and
+                     rows moved to the dead-letter journal.
+        """
+        return {
+            "enabled": self.enabled,
+            "queued": len(self._queue),
+            "flushed": self.flushed,
+            "failed_flushes": self.failed_flushes,
+            "dead_letters": self.dead_letters,
+        }
+
+    def _ensure_started(self):
+        """
+        @brief Starts the background flusher on the running event loop, once.
+        """
+        if self._task is not None and not self._task.done():
+            return
+        self._wakeup = asyncio.Event()
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        self._stopping = False
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def put(self, message):
+        """
+        @brief Queues an unsaved ChatMessage for insertion.
+        @param message The ChatMessage, with its id and created_at already set.
+        """
+        self._ensure_started()
+        while len(self._queue) >= self.max_queue:
+            await self.flush()
+        self._queue.append(message)
+        if len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+
+    async def _run(self):
+        """
+        @brief Background loop that flushes the queue on size or time.
+        """
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                while self._queue:
+                    await self.flush()
+                    if len(self._queue) < self.batch_size:
+                        break
+            except Exception:
+                # Rows were put back by flush(); wait for the next tick before retrying.
+                logger.exception("write-behind flush failed, %d rows queued", len(self._queue))
+
+    async def flush(self):
+        """
+        @brief Inserts up to `batch_size` queued rows in one `bulk_create`.
+        @details When the insert fails, the rows are inserted one at a time. Rows refused
+                 with an integrity or data error are dead-lettered; on any other error the
+                 rows not written yet are put back at the head of the queue, in order, and
+                 the exception is re-raised.
+        @return int The number of rows written.
+        """
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            batch = []
+            while self._queue and len(batch) < self.batch_size:
+                batch.append(self._queue.popleft())
+            if not batch:
+                return 0
+            written, error = await sync_to_async(self._insert)(batch)
+            self.flushed += len(written)
+            if written:
+                try:
+                    await arecordLastMessages(written)
+                except Exception:
+                    logger.exception("write-behind could not update the chats' last messages")
+                try:
+                    await arecordUnread(written)
+                except Exception:
+                    logger.exception("write-behind could not update the unread counts")
+            if error is not None:
+                raise error
+            return len(written)
+
+    def _insert(self, batch):
+        """
+        @brief Inserts a batch in one `bulk_create`, or one row at a time if that fails.
+        @details Every insert runs in its own transaction. In the row by row pass, rows
+                 refused with an integrity or data error are dead-lettered; any other error
+                 stops the pass and the remaining rows are put back at the head of the queue.
+        @param batch The rows to insert, in order.
+        @return tuple `(written, error)`: the rows inserted, and the error that stopped the
+                      pass or None.
+        """
+        try:
+            with transaction.atomic():
+                ChatMessage.objects.bulk_create(batch)
+            return batch, None
+        except Exception:
+            self.failed_flushes += 1
+        written = []
+        for index, message in enumerate(batch):
+            try:
+                with transaction.atomic():
+                    ChatMessage.objects.bulk_create([message])
+            except (IntegrityError, DataError) as error:
+                self.deadLetter(message, error)
+            except Exception as error:
+                self._queue.extendleft(reversed(batch[index:]))
+                return written, error
+            else:
+                written.append(message)
+        return written, None
+
+    def deadLetter(self, message, error):
+        """
+        @brief Records a row the database refuses, so it is not retried.
+        @details The row is appended to the dead-letter journal with the error, or only
+                 logged if no journal is configured or it cannot be written.
+        @param message The refused ChatMessage.
+        @param error The database error.
+        """
+        self.dead_letters += 1
+        row = dict(journalRow(message), error=str(error))
+        if self.dead_letter_path:
+            try:
+                with open(self.dead_letter_path, "a", encoding="utf-8") as journal:
+                    journal.write(json.dumps(row) + "\n")
+                logger.error("write-behind dead-lettered message %s: %s", message.id, error)
+                return
+            except OSError:
+                logger.exception("write-behind could not write the dead-letter journal")
+        logger.error("write-behind dropped message %s: %s", json.dumps(row), error)
+
+    async def drain(self, timeout=10.0):
+        """
+        @brief Stops the flusher and writes every queued row.
+        @details Called on application shutdown. Rows that still cannot be written
+                 within `timeout` seconds are spilled to the journal file.
+        @param timeout The time in seconds allowed for the final flushes.
+        @return int The number of rows left unwritten.
+        """
+        self._stopping = True
+        if self._task is not None:
+            self._wakeup.set()
+            try:
+                await asyncio.wait_for(self._task, timeout)
+            except Exception:
+                logger.exception("write-behind flusher did not stop cleanly")
+            self._task = None
+
+        deadline = time.monotonic() + timeout
+        while self._queue and time.monotonic() < deadline:
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("write-behind drain failed, %d rows queued", len(self._queue))
+                await asyncio.sleep(min(self.flush_interval, 0.5))
+
+        if self._queue:
+            self.spill()
+        return len(self._queue)
+
+    def spill(self):
+        """
+        @brief Appends the queued rows to the journal file and empties the queue.
+        @details Rows are kept in memory if no journal file is configured or it cannot be written.
+        """
+        if not self.spill_path:
+            logger.error("write-behind dropping %d rows, no SPILL_PATH configured", len(self._queue))
+            return
+        try:
+            with open(self.spill_path, "a", encoding="utf-8") as journal:
+                for message in self._queue:
+                    journal.write(json.dumps(journalRow(message)) + "\n")
+                journal.flush()
+                os.fsync(journal.fileno())
+        except OSError:
+            logger.exception("write-behind could not spill %d rows", len(self._queue))
+            return
+        logger.warning("write-behind spilled %d rows to %s", len(self._queue), self.spill_path)
+        self._queue.clear()
+
+    async def recover(self):
+        """
+        @brief Inserts the rows spilled by a previous process and removes the journal.
+        @details Rows that were already written are skipped, and only the rows inserted
+                 now are counted as unread, so recovering twice is harmless.
+        @return int The number of journal rows read.
+        """
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return 0
+        rows = []
+        with open(self.spill_path, encoding="utf-8") as journal:
+            for line in journal:
+                if not line.strip():
+                    continue
+                row = json.loads(line)
+                row["created_at"] = parse_datetime(row["created_at"])
+                rows.append(ChatMessage(**row))
+        stored = set()
+        for start in range(0, len(rows), self.batch_size):
+            ids = [row.id for row in rows[start:start + self.batch_size]]
+            stored.update([pk async for pk in ChatMessage.objects.filter(pk__in=ids).values_list("pk", flat=True)])
+        missing = [row for row in rows if row.id not in stored]
+        await ChatMessage.objects.abulk_create(missing, batch_size=self.batch_size, ignore_conflicts=True)
+        await arecordLastMessages(missing)
+        await arecordUnread(missing)
+        os.remove(self.spill_path)
+        logger.info("write-behind recovered %d rows from %s", len(rows), self.spill_path)
+        return len(rows)
+
+
+"""
+@brief The process-wide write-behind queue used by the socket handlers.
+"""
+write_behind = MessageWriteBehind.from_settings()
+metrics.register("write_behind", write_behind.stats)
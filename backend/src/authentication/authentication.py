@@ -0,0 +1,72 @@
+"""
+@file authentication.py
+@brief Stateless JWT authentication for the REST API.
+@details This file contains the authentication class that trusts the signed claims of a
+         token instead of loading the user on every request. The request's user is a
+         CustomUser built from the claims, with every other field deferred: views that only
+         need `request.user.pk`, or use the user in queries, never touch the users table,
+         and the first access to another field loads them all in one query.
+"""
+
+from django.contrib.auth import get_user_model
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from .tokens import TOKEN_VERSION_CLAIM, tokenVersion
+
+User = get_user_model()
+
+
+def claimsUser(user_id, claims):
+    """
+    @brief Builds a lazily loaded user from token claims.
+    @param user_id The user's primary key.
+    @param claims A mapping from field name to value for the fields known from the token.
+    @return User The user, with every field missing from the claims deferred.
+    """
+    values = dict(claims, id=user_id)
+    fields = [field.attname for field in User._meta.concrete_fields if field.attname in values]
+    return User.from_db(router.db_for_read(User), fields, [values[field] for field in fields])
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    @brief JWT authentication that builds the user from the token's claims.
+    @details Tokens carrying a token version are checked against the user's current
+             version through a short-lived cache, so revoked tokens stop working without a
+             user query per request. Tokens issued without a version fall back to loading
+             the user, as JWTAuthentication does.
+    """
+
+    def get_user(self, validated_token):
+        """
+        @brief Returns the user a validated token was issued to.
+        @param validated_token The decoded, signature-checked token.
+        @return User The user, lazily loaded when the token carries a version.
+        @throws InvalidToken if the token has no user id.
+        @throws AuthenticationFailed if the user is inactive, deleted or the token is revoked.
+        """
+        if TOKEN_VERSION_CLAIM not in validated_token:
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        if not validated_token.get("is_active", False):
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        version = tokenVersion(user_id)
+        if version is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if version != validated_token[TOKEN_VERSION_CLAIM]:
+            raise AuthenticationFailed(_("Token has been revoked"), code="token_revoked")
+
+        return claimsUser(user_id, {
+            "username": validated_token.get("username"),
+            "is_active": True,
+            "token_version": version,
+        })
@@ -0,0 +1,51 @@
+"""
+@file backends.py
+@brief Authentication backend verifying passwords on the password hashing pool.
+@details This file contains the backend that LoginUser reaches through Django's
+         `authenticate()`. It behaves like ModelBackend, so AUTHENTICATION_BACKENDS and the
+         `user_login_failed` signal keep working, but hashes and verifies passwords on the
+         hashing pool instead of the request thread.
+"""
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from .hashing import hashing_pool, mustUpdate
+
+User = get_user_model()
+
+
+class PooledModelBackend(ModelBackend):
+    """
+    @brief ModelBackend that runs the password check on the hashing pool.
+    @details HashingOverloaded raised by the pool propagates out of `authenticate()`, so
+             the caller can answer with 503 instead of refusing the credentials.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        """
+        @brief Checks a username and password.
+        @details Unknown usernames are hashed anyway, so they take as long as wrong
+                 passwords. Hashes with outdated hasher settings are upgraded after a
+                 successful check.
+        @param request The HTTP request object, or None.
+        @param username The username.
+        @param password The raw password.
+        @param kwargs Other credentials; the username may be passed under USERNAME_FIELD.
+        @return User The authenticated user, or None if the credentials are refused.
+        @throws HashingOverloaded if the hashing pool refuses the check.
+        """
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = User._default_manager.get_by_natural_key(username)
+        except User.DoesNotExist:
+            hashing_pool.makePassword(password)
+            return None
+        if not hashing_pool.checkPassword(password, user.password) or not self.user_can_authenticate(user):
+            return None
+        if mustUpdate(user.password):
+            user.password = hashing_pool.makePassword(password)
+            user.save(update_fields=["password"])
+        return user
@@ -0,0 +1,165 @@
+"""
+@file hashing.py
+@brief Bounded worker pool for password hashing and verification.
+@details This file contains the pool that login and signup hash and verify passwords in.
+         PBKDF2 takes tens of milliseconds of CPU per call; running it on at most
+         WORKERS threads (hashlib releases the GIL while hashing) keeps a burst of logins
+         from taking every core away from the chat APIs. At most MAX_QUEUE further calls
+         may wait for a worker; beyond that the pool refuses work with HashingOverloaded,
+         which the views answer with 503. Its counters are reported by the metrics endpoint.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, identify_hasher, make_password
+from app import metrics
+
+
+class HashingOverloaded(Exception):
+    """
+    @brief Raised when the hashing pool's queue is full.
+    """
+
+
+class PasswordHashingPool:
+    """
+    @brief Thread pool with admission control for password hashing.
+    """
+
+    def __init__(self, workers=2, max_queue=32, timeout=10.0):
+        """
+        @brief Initializes the pool.
+        @param workers The number of hashing threads.
+        @param max_queue The largest number of calls waiting for a worker.
+        @param timeout The longest time in seconds a caller waits for its result.
+        """
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.in_flight = 0
+        self.started = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.max_depth = 0
+        self.total_wait = 0.0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hashing")
+
+    @classmethod
+    def from_settings(cls):
+        """
+        @brief Builds the pool from the PASSWORD_HASHING_POOL setting.
+        @return PasswordHashingPool The configured pool.
+        """
+        options = getattr(settings, "PASSWORD_HASHING_POOL", {})
+        return cls(
+            workers=options.get("WORKERS", 2),
+            max_queue=options.get("MAX_QUEUE", 32),
+            timeout=options.get("TIMEOUT", 10.0),
+        )
+
+    def run(self, function, *args):
+        """
+        @brief Runs a function on the pool and waits for its result.
+        @param function The function to run.
+        @param args Its arguments.
+        @return The function's result.
+        @throws HashingOverloaded if the queue is full or the result takes longer than the timeout.
+                A job that timed out keeps its slot until it has run or been cancelled.
+        """
+        with self._lock:
+            if self.in_flight >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise HashingOverloaded("password hashing queue is full")
+            self.in_flight += 1
+            self.max_depth = max(self.max_depth, self.in_flight - self.workers)
+        submitted = time.perf_counter()
+
+        def job():
+            with self._lock:
+                self.started += 1
+                self.total_wait += time.perf_counter() - submitted
+            return function(*args)
+
+        try:
+            future = self._executor.submit(job)
+        except BaseException:
+            self._release(None)
+            raise
+        # The slot is held until the job is done or cancelled, not until the caller gives up.
+        future.add_done_callback(self._release)
+        try:
+            result = future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            with self._lock:
+                self.timed_out += 1
+            raise HashingOverloaded("password hashing timed out")
+        with self._lock:
+            self.completed += 1
+        return result
+
+    def _release(self, future):
+        """
+        @brief Frees the admission slot of a finished or cancelled job.
+        @param future The job's future.
+        """
+        with self._lock:
+            self.in_flight -= 1
+
+    def makePassword(self, password):
+        """
+        @brief Hashes a password on the pool.
+        @param password The raw password.
+        @return str The encoded password hash.
+        """
+        return self.run(make_password, password)
+
+    def checkPassword(self, password, encoded):
+        """
+        @brief Verifies a password against a hash on the pool.
+        @param password The raw password.
+        @param encoded The stored password hash.
+        @return bool Whether the password matches.
+        """
+        return self.run(check_password, password, encoded)
+
+    def stats(self):
+        """
+        @brief Returns the pool counters.
+        @return dict Workers, queue depth and limit, in-flight, completed, rejected and
+                     timed out calls, and the mean wait for a worker in milliseconds.
+        """
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "in_flight": self.in_flight,
+                "queue_depth": max(0, self.in_flight - self.workers),
+                "max_queue_depth": self.max_depth,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "mean_wait_ms": round(self.total_wait / self.started * 1000, 3) if self.started else None,
+            }
+
+
+def mustUpdate(encoded):
+    """
+    @brief Tells whether a stored hash uses outdated hasher settings.
+    @param encoded The stored password hash.
+    @return bool Whether the password should be rehashed after a successful login.
+    """
+    try:
+        return identify_hasher(encoded).must_update(encoded)
+    except ValueError:
+        return False
+
+
+hashing_pool = PasswordHashingPool.from_settings()
+""" @brief The process-wide password hashing pool. """
+
+metrics.register("password_hashing", hashing_pool.stats)
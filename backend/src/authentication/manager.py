@@ -18,12 +18,13 @@ class UserManager(BaseUserManager):
     for required fields and setting default values for superuser attributes.
     """
 
-    def create_user(self, username, password=None, **extra_fields):
+    def create_user(self, username, password=None, password_hash=None, **extra_fields):
         """
         @brief Creates and returns a regular user with an encrypted password.
 
         @param username The username for the new user.
         @param password The password for the new user (optional).
+        @param password_hash The already hashed password, used instead of hashing `password` (optional).
         @param extra_fields Additional fields to set for the user.
 
         @return User A User object with the provided username and other fields.
@@ -36,7 +37,10 @@ class UserManager(BaseUserManager):
         # Uncomment if email normalization is required
         # extra_fields['email'] = self.normalize_email(extra_fields['email'])
         user = self.model(username=username, **extra_fields)
-        user.set_password(password)
+        if password_hash is not None:
+            user.password = password_hash
+        else:
+            user.set_password(password)
         user.save(using=self.db)
 
         return user
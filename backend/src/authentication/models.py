@@ -4,7 +4,8 @@
 @details This file contains the CustomUser model, which extends Django's AbstractUser model to include additional fields like friends.
 """
 
-from django.db import models
+from django.db import models, router, transaction
+from django.db.models import Case, F, When
 from django.contrib.auth.models import AbstractUser
 from .manager import UserManager
 
@@ -23,6 +24,21 @@ class CustomUser(AbstractUser):
     friends = models.ManyToManyField('self', symmetrical=True, null=True, blank=True)
     # dob = models.DateField(null=True, blank=True)  # Uncomment to add date of birth field to the model
 
+    """
+    @brief The version of the user's public profile.
+    @details Incremented whenever a profile field changes, so cached copies of the
+             serialized profile are keyed by (id, profile_version) and never go stale.
+    """
+    profile_version = models.PositiveIntegerField(default=1, editable=False)
+
+    """
+    @brief The version of the user's access tokens.
+    @details Carried as a claim by the tokens issued to the user. Incrementing it, as
+             changing the password, deactivating the user or calling revokeTokens() does,
+             revokes every token issued before.
+    """
+    token_version = models.PositiveIntegerField(default=1, editable=False)
+
     """
     @brief A list of fields required during user creation.
     @details This list is empty, indicating that no additional fields are required beyond those in the AbstractUser model.
@@ -33,4 +49,77 @@ class CustomUser(AbstractUser):
     @brief The custom manager for the CustomUser model.
     @details This manager overrides the default manager to provide additional functionality for managing users.
     """
-    objects = UserManager()
\ No newline at end of file
+    objects = UserManager()
+
+    """
+    @brief The fields making up the user's public profile.
+    @details Saving any of them bumps `profile_version`.
+    """
+    PROFILE_FIELDS = frozenset(["username", "email", "first_name", "last_name"])
+
+    def set_password(self, raw_password):
+        """
+        @brief Sets the user's password, revoking the tokens of an existing user.
+        @param raw_password The new password.
+        """
+        super().set_password(raw_password)
+        if not self._state.adding:
+            self.token_version += 1
+
+    def revokeTokens(self):
+        """
+        @brief Revokes every token issued to the user so far, e.g. after a suspected leak.
+        """
+        self.token_version += 1
+        self.save(update_fields=["token_version"])
+
+    def refresh_from_db(self, *args, fields=None, **kwargs):
+        """
+        @brief Reloads fields from the database.
+        @details Loading one deferred field of a partially loaded user, such as the user
+                 built from token claims, loads all of its deferred fields in one query.
+        @param args Positional arguments passed to Model.refresh_from_db().
+        @param fields The fields to reload, or None for all of them.
+        @param kwargs Keyword arguments passed to Model.refresh_from_db().
+        """
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred and set(fields) <= deferred:
+            fields = deferred
+        super().refresh_from_db(*args, fields=fields, **kwargs)
+
+    def save(self, *args, **kwargs):
+        """
+        @brief Saves the user, bumping `profile_version` when the profile may have changed
+               and `token_version` when the user is deactivated.
+        @details New users keep the initial versions. Saves limited by `update_fields` to
+                 non-profile fields, such as `last_login`, keep the profile version too.
+                 Versions are incremented in the database, in the same transaction as the
+                 save, so concurrent saves of stale instances never share a version.
+        @param args Positional arguments passed to Model.save().
+        @param kwargs Keyword arguments passed to Model.save().
+        """
+        update_fields = kwargs.get("update_fields")
+        saved = None if update_fields is None else set(update_fields)
+        bumps = {}
+        if not self._state.adding:
+            if saved is None or self.PROFILE_FIELDS & saved:
+                bumps["profile_version"] = F("profile_version") + 1
+            if not self.is_active and (saved is None or "is_active" in saved):
+                # Compares with the stored flag, so only deactivating revokes the tokens.
+                bumps["token_version"] = Case(
+                    When(is_active=True, then=F("token_version") + 1), default=F("token_version"),
+                    output_field=models.PositiveIntegerField(),
+                )
+        if not bumps:
+            super().save(*args, **kwargs)
+            return
+
+        if saved is not None:
+            kwargs["update_fields"] = saved | set(bumps)
+        using = kwargs.get("using") or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            stored = type(self)._base_manager.using(using).filter(pk=self.pk)
+            stored.update(**bumps)
+            for field, value in (stored.values(*bumps).first() or {}).items():
+                setattr(self, field, value)
+            super().save(*args, **kwargs)
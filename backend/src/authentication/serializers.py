@@ -80,14 +80,16 @@ class userSerializer(ModelSerializer):
 
     # --------------------------------------------------------------
     # @brief Creates a new CustomUser instance.
-    # @details Handles the creation of a new user using the validated data.
+    # @details Handles the creation of a new user using the validated data. A `password_hash`
+    #          passed to save() is stored instead of hashing the password again.
     # @param validated_data The validated data for creating the user.
     # @return The newly created CustomUser instance.
     # --------------------------------------------------------------
     def create(self, validated_data):
         """
         @brief Creates a new CustomUser instance.
-        @details Handles the creation of a new user using the validated data.
+        @details Handles the creation of a new user using the validated data. A `password_hash`
+                 passed to save() is stored instead of hashing the password again.
         @param validated_data The validated data for creating the user.
         @return The newly created CustomUser instance.
         """
@@ -97,5 +99,6 @@ class userSerializer(ModelSerializer):
             first_name=validated_data["first_name"],
             last_name=validated_data["last_name"],
             password=validated_data["password"],
+            password_hash=validated_data.get("password_hash"),
         )
         return user
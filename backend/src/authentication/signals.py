@@ -0,0 +1,75 @@
+"""
+@file signals.py
+@brief Signal handlers for the CustomUser model.
+@details This file contains the signal handlers keeping the cached token versions and
+         the username index in sync with the users table.
+"""
+
+from functools import partial
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.contrib.auth import get_user_model
+from .tokens import forgetTokenVersion
+from .usernameindex import username_index
+
+User = get_user_model()
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forgetCachedTokenVersion(sender, instance, **kwargs):
+    """
+    @brief Drops the cached token version of a saved or deleted user.
+    @details Makes a revocation take effect at once in this process; other processes
+             notice it when their cached version expires.
+
+    @param sender The model class that sent the signal (User).
+    @param instance The User instance being saved or deleted.
+    @param kwargs Additional keyword arguments passed to the signal.
+    """
+    forgetTokenVersion(instance.pk)
+
+@receiver(pre_save, sender=User)
+def rememberUsername(sender, instance, update_fields=None, **kwargs):
+    """
+    @brief Remembers the stored username of a user about to be saved.
+    @details Lets updateUsernameIndex() free the old name of a renamed user. Costs one
+             query per save of an existing user that may change the username.
+
+    @param sender The model class that sent the signal (User).
+    @param instance The User instance being saved.
+    @param update_fields The fields being saved, or None for all of them.
+    @param kwargs Additional keyword arguments passed to the signal.
+    """
+    instance._stored_username = None
+    if instance._state.adding or (update_fields is not None and "username" not in update_fields):
+        return
+    instance._stored_username = (
+        User.objects.filter(pk=instance.pk).values_list("username", flat=True).first()
+    )
+
+@receiver(post_save, sender=User)
+def updateUsernameIndex(sender, instance, **kwargs):
+    """
+    @brief Marks a saved user's username as taken, and frees their previous one, once the
+           save commits.
+
+    @param sender The model class that sent the signal (User).
+    @param instance The User instance being saved.
+    @param kwargs Additional keyword arguments passed to the signal.
+    """
+    stored = getattr(instance, "_stored_username", None)
+    if stored is not None and stored != instance.username:
+        transaction.on_commit(partial(username_index.discard, stored))
+    transaction.on_commit(partial(username_index.add, instance.username))
+
+@receiver(post_delete, sender=User)
+def freeUsername(sender, instance, **kwargs):
+    """
+    @brief Marks a deleted user's username as available, once the delete commits.
+
+    @param sender The model class that sent the signal (User).
+    @param instance The User instance being deleted.
+    @param kwargs Additional keyword arguments passed to the signal.
+    """
+    transaction.on_commit(partial(username_index.discard, instance.username))
@@ -1,3 +1,341 @@
+"""
+@file tests.py
+@brief Unit tests for the authentication app.
+@details This file contains test cases for the stateless JWT authentication: claims-based
+         users, lazy loading of the remaining fields and token revocation.
+"""
+
 from django.test import TestCase
+from django.db import transaction
+from django.core.cache import caches
+from django.contrib.auth import get_user_model
+from django.contrib.auth.signals import user_login_failed
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+from asgiref.sync import async_to_sync
+from .tokens import VersionedRefreshToken
+from .hashing import HashingOverloaded, PasswordHashingPool, hashing_pool
+from .usernameindex import UsernameIndex, username_index
+from unittest.mock import patch
+import threading
+import fakeredis
+from app.sockets import authenticateToken
+
+User = get_user_model()
+
+class StatelessJWTAuthenticationTest(APITestCase):
+    """
+    @brief Test case for StatelessJWTAuthentication.
+    @details Tests the per-request query count, lazy loading and revocation of tokens.
+    """
+
+    def setUp(self):
+        """
+        @brief Creates a user and logs them in.
+        @details The cached token versions are cleared, as user ids are reused between tests.
+        """
+        caches['default'].clear()
+        self.user = User.objects.create_user(
+            username='user1', email='user1@example.com', first_name='User', last_name='One',
+            password='password123'
+        )
+        response = self.client.post('/auth/login', {'username': 'user1', 'password': 'password123'})
+        self.access = response.data['access']
+
+    def get(self, path, token=None):
+        """
+        @brief Sends an authenticated GET request.
+        @param path The URL path.
+        @param token The access token, defaulting to the one issued at login.
+        @return Response The response.
+        """
+        return self.client.get(path, HTTP_AUTHORIZATION=f'Bearer {token or self.access}')
+
+    def test_no_user_query(self):
+        """
+        @brief Tests that authentication does not load the user.
+        @details Ensures only the first request looks the token version up, and that a view
+                 using only the user's id runs no user query.
+        """
+        self.get('/chats')
+        with self.assertNumQueries(1):
+            response = self.get('/chats')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_lazy_fields(self):
+        """
+        @brief Tests that the fields missing from the claims load on first use, in one query.
+        """
+        self.get('/chats')
+        with self.assertNumQueries(1):
+            response = self.get('/auth/get_user')
+        self.assertEqual(response.data['payload']['email'], 'user1@example.com')
+        self.assertEqual(response.data['payload']['last_name'], 'One')
+
+    def test_password_change_revokes_tokens(self):
+        """
+        @brief Tests that changing the password revokes the tokens issued before.
+        """
+        self.assertEqual(self.get('/chats').status_code, status.HTTP_200_OK)
+        self.user.set_password('new-password')
+        self.user.save()
+        self.assertEqual(self.get('/chats').status_code, status.HTTP_401_UNAUTHORIZED)
+
+        token = str(VersionedRefreshToken.for_user(self.user).access_token)
+        self.assertEqual(self.get('/chats', token).status_code, status.HTTP_200_OK)
+
+    def test_revoke_tokens(self):
+        """
+        @brief Tests revoking tokens, in the REST API and the Socket.IO handshake.
+        """
+        self.assertIsNotNone(async_to_sync(authenticateToken)(self.access))
+        self.user.revokeTokens()
+        self.assertEqual(self.get('/chats').status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertIsNone(async_to_sync(authenticateToken)(self.access))
+
+    def test_deactivation_revokes_tokens(self):
+        """
+        @brief Tests that deactivating a user revokes their tokens, and only deactivating does.
+        """
+        self.user.is_active = False
+        self.user.save(update_fields=["is_active"])
+        self.assertEqual(self.get('/chats').status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertIsNone(async_to_sync(authenticateToken)(self.access))
+
+        version = self.user.token_version
+        self.user.first_name = 'Inactive'
+        self.user.save()
+        self.assertEqual(self.user.token_version, version)
+
+    def test_concurrent_profile_saves(self):
+        """
+        @brief Tests that saving two stale copies of a user gives them distinct profile versions.
+        """
+        first, second = User.objects.get(pk=self.user.pk), User.objects.get(pk=self.user.pk)
+        first.first_name = 'First'
+        first.save()
+        second.last_name = 'Second'
+        second.save()
+        self.assertNotEqual(first.profile_version, second.profile_version)
+        self.assertEqual(User.objects.get(pk=self.user.pk).profile_version, second.profile_version)
+
+    def test_profile_save_keeps_tokens(self):
+        """
+        @brief Tests that saving the profile does not revoke tokens.
+        """
+        self.user.first_name = 'Renamed'
+        self.user.save()
+        self.assertEqual(self.get('/chats').status_code, status.HTTP_200_OK)
+
+    def test_unversioned_token(self):
+        """
+        @brief Tests that tokens issued without a version still authenticate.
+        """
+        token = str(RefreshToken.for_user(self.user).access_token)
+        self.assertEqual(self.get('/auth/get_user', token).data['payload']['username'], 'user1')
+
+
+class PasswordHashingTest(APITestCase):
+    """
+    @brief Test case for login and signup through the password hashing pool.
+    @details Tests credentials checks, the login query count and admission control.
+    """
+
+    def setUp(self):
+        """
+        @brief Creates a user.
+        """
+        self.user = User.objects.create_user(username='user1', password='password123')
+
+    def login(self, username, password):
+        """
+        @brief Sends a login request.
+        @param username The username.
+        @param password The password.
+        @return Response The response.
+        """
+        return self.client.post('/auth/login', {'username': username, 'password': password})
+
+    def test_login(self):
+        """
+        @brief Tests that valid credentials log in with a single user query.
+        """
+        with self.assertNumQueries(1):
+            response = self.login('user1', 'password123')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['user']['username'], 'user1')
+
+    def test_login_rejects_bad_credentials(self):
+        """
+        @brief Tests wrong passwords, unknown usernames and inactive users.
+        """
+        self.assertEqual(self.login('user1', 'wrong').status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.login('nobody', 'password123').status_code, status.HTTP_401_UNAUTHORIZED)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.login('user1', 'password123').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_signup(self):
+        """
+        @brief Tests that a signed up user can log in with their password.
+        """
+        response = self.client.post('/auth/signup', {
+            'username': 'user2', 'email': 'user2@example.com', 'password': 'secret-pass',
+            'first_name': 'User', 'last_name': 'Two',
+        })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(User.objects.get(username='user2').check_password('secret-pass'))
+        self.assertEqual(self.login('user2', 'secret-pass').status_code, status.HTTP_200_OK)
+
+    def test_admission_control(self):
+        """
+        @brief Tests that calls beyond the workers and the queue are refused.
+        """
+        pool = PasswordHashingPool(workers=1, max_queue=0, timeout=5)
+        started, release = threading.Event(), threading.Event()
+
+        def block():
+            started.set()
+            release.wait(5)
+
+        worker = threading.Thread(target=pool.run, args=(block,))
+        worker.start()
+        started.wait(5)
+        with self.assertRaises(HashingOverloaded):
+            pool.run(lambda: None)
+        self.assertEqual(pool.stats()['rejected'], 1)
+        release.set()
+        worker.join()
+        self.assertEqual(pool.stats()['in_flight'], 0)
+
+    def test_timeout_keeps_slot(self):
+        """
+        @brief Tests that a timed out call holds its slot until its job has run.
+        """
+        pool = PasswordHashingPool(workers=1, max_queue=0, timeout=0.05)
+        release = threading.Event()
+        with self.assertRaises(HashingOverloaded):
+            pool.run(release.wait, 5)
+        self.assertEqual(pool.stats()['in_flight'], 1)
+        with self.assertRaises(HashingOverloaded):
+            pool.run(lambda: None)
+        release.set()
+        pool._executor.submit(lambda: None).result(5)
+        stats = pool.stats()
+        self.assertEqual((stats['in_flight'], stats['completed'], stats['timed_out'], stats['rejected']), (0, 0, 1, 1))
+
+    def test_login_failed_signal(self):
+        """
+        @brief Tests that refused logins go through authenticate() and send user_login_failed.
+        """
+        failures = []
+        handler = lambda sender, credentials, **kwargs: failures.append(credentials['username'])
+        user_login_failed.connect(handler)
+        try:
+            self.login('user1', 'wrong')
+        finally:
+            user_login_failed.disconnect(handler)
+        self.assertEqual(failures, ['user1'])
+
+    def test_overloaded_login(self):
+        """
+        @brief Tests that a login refused by the pool is answered with 503.
+        """
+        with patch.object(hashing_pool, 'run', side_effect=HashingOverloaded):
+            response = self.login('user1', 'password123')
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], '1')
+
+
+class UsernameIndexTest(APITestCase):
+    """
+    @brief Test case for the username availability check.
+    @details Tests the queries of the index and that it follows signups, renames and deletes.
+    """
+
+    def setUp(self):
+        """
+        @brief Empties the username index and creates a user.
+        """
+        username_index.clear()
+        self.user = User.objects.create_user(username='user1', password='password123')
+        username_index.load()
+
+    def available(self, username):
+        """
+        @brief Sends an availability request.
+        @param username The username to check.
+        @return bool Whether the username is reported available.
+        """
+        response = self.client.post('/auth/username_availability', {'username': username})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['user_available']
+
+    def test_queries(self):
+        """
+        @brief Tests that only free usernames checked in process cost a query.
+        """
+        with self.assertNumQueries(0):
+            self.assertFalse(self.available('user1'))
+        with self.assertNumQueries(1):
+            self.assertTrue(self.available('user2'))
+
+    def test_shared_no_query(self):
+        """
+        @brief Tests that a shared index answers taken and free usernames without a query.
+        """
+        index = UsernameIndex()
+        index.redis = fakeredis.FakeRedis()
+        index.load()
+        with self.assertNumQueries(0):
+            self.assertTrue(index.isTaken('user1'))
+            self.assertFalse(index.isTaken('user2'))
+
+    def test_other_worker(self):
+        """
+        @brief Tests that a username taken without this worker's signals is reported taken.
+        """
+        User.objects.bulk_create([User(username='user2')])
+        self.assertFalse(self.available('user2'))
+        with self.assertNumQueries(0):
+            self.assertFalse(self.available('user2'))
+
+    def test_signup(self):
+        """
+        @brief Tests that a signed up username is taken.
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/auth/signup', {
+                'username': 'user2', 'email': 'user2@example.com', 'password': 'secret-pass',
+                'first_name': 'User', 'last_name': 'Two',
+            })
+        self.assertFalse(self.available('user2'))
+
+    def test_rename(self):
+        """
+        @brief Tests that renaming a user frees the old username.
+        """
+        self.user.username = 'renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertTrue(self.available('user1'))
+        self.assertFalse(self.available('renamed'))
+
+    def test_delete(self):
+        """
+        @brief Tests that deleting a user frees the username.
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        self.assertTrue(self.available('user1'))
 
-# Create your tests here.
+    def test_rollback(self):
+        """
+        @brief Tests that a signup rolled back leaves its username available.
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                User.objects.create_user(username='user2', password='password123')
+                raise RuntimeError
+        self.assertTrue(self.available('user2'))
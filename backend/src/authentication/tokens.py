@@ -0,0 +1,75 @@
+"""
+@file tokens.py
+@brief JWT tokens carrying the user's identity claims and token version.
+@details This file contains the refresh token class issued at signup and login and the
+         cached token-version lookup used to revoke tokens. Tokens carry the user's id,
+         username, active flag and token version, so authenticated requests can be served
+         without loading the user. The current token version of a user is cached for a
+         few seconds; bumping it revokes all older tokens once the cache entry expires, or
+         straight away in the process that made the change.
+"""
+
+from django.conf import settings
+from django.core.cache import caches
+from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.tokens import RefreshToken
+
+User = get_user_model()
+
+TOKEN_VERSION_CLAIM = "ver"
+""" @brief The claim holding the token version. """
+
+
+class VersionedRefreshToken(RefreshToken):
+    """
+    @brief Refresh token with the user's identity claims and token version.
+    @details Access tokens derived from it copy the claims.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        """
+        @brief Issues a refresh token for a user.
+        @param user The user the token is issued to.
+        @return VersionedRefreshToken The token.
+        """
+        token = super().for_user(user)
+        token["username"] = user.username
+        token["is_active"] = user.is_active
+        token[TOKEN_VERSION_CLAIM] = user.token_version
+        return token
+
+
+def tokenVersionSettings():
+    """
+    @brief Reads the TOKEN_VERSION_CACHE setting.
+    @return tuple The cache alias and the lifetime in seconds of cached versions.
+    """
+    options = getattr(settings, "TOKEN_VERSION_CACHE", {})
+    return options.get("CACHE", "default"), options.get("TTL", 30)
+
+
+def tokenVersion(user_id):
+    """
+    @brief Returns the current token version of a user.
+    @details Read from the cache; on a miss one query loads it and caches it for TTL seconds.
+    @param user_id The user's primary key.
+    @return int The token version, or None if the user does not exist.
+    """
+    alias, ttl = tokenVersionSettings()
+    key = f"token_version:{user_id}"
+    version = caches[alias].get(key)
+    if version is None:
+        version = User.objects.filter(pk=user_id).values_list("token_version", flat=True).first()
+        if version is not None:
+            caches[alias].set(key, version, ttl)
+    return version
+
+
+def forgetTokenVersion(user_id):
+    """
+    @brief Drops the cached token version of a user.
+    @param user_id The user's primary key.
+    """
+    alias, _ = tokenVersionSettings()
+    caches[alias].delete(f"token_version:{user_id}")
@@ -0,0 +1,170 @@
+"""
+@file usernameindex.py
+@brief In-memory index of taken usernames for the signup form's availability check.
+@details This file contains the UsernameIndex behind UserAvailability: the set of taken
+         usernames, so the answer is exact without a query. The index is loaded from the
+         users table once and kept in sync by the User save/delete signals once their
+         transaction commits. With REDIS_URL set, the set lives in Redis, so every worker
+         sees usernames taken through the others. Without it, a worker misses usernames
+         taken through the others, so a name it does not know is confirmed against the
+         users table before it is reported free.
+"""
+
+import threading
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from app import metrics
+
+User = get_user_model()
+
+
+class UsernameIndex:
+    """
+    @brief Exact set of the taken usernames.
+    """
+
+    def __init__(self, redis_url=None, prefix="usernames:"):
+        """
+        @brief Initializes an empty, unloaded index.
+        @param redis_url The URL of the shared Redis store, or None to keep the index in process.
+        @param prefix The prefix of the Redis keys.
+        """
+        self.prefix = prefix
+        self.redis = None
+        if redis_url:
+            import redis
+            self.redis = redis.Redis.from_url(redis_url)
+        self.loaded = False
+        self.checks = 0
+        self.taken = 0
+        self.confirmed = 0
+        self._names = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        """
+        @brief Builds the index from the USERNAME_INDEX setting.
+        @return UsernameIndex The configured index.
+        """
+        options = getattr(settings, "USERNAME_INDEX", {})
+        return cls(redis_url=options.get("REDIS_URL"))
+
+    def _add(self, usernames):
+        """
+        @brief Adds usernames to the set.
+        @param usernames The usernames to add.
+        """
+        usernames = list(usernames)
+        if self.redis is not None:
+            if usernames:
+                self.redis.sadd(self.prefix + "names", *usernames)
+            return
+        with self._lock:
+            self._names.update(usernames)
+
+    def load(self, force=False):
+        """
+        @brief Loads every username from the users table, once.
+        @details In Redis mode the shared index is only built if no worker has built it yet,
+                 unless `force` is set.
+        @param force Whether to rebuild an already loaded index.
+        """
+        with self._lock:
+            if self.loaded and not force:
+                return
+            if self.redis is None:
+                self._names = set()
+        if self.redis is not None and (force or not self.redis.exists(self.prefix + "names")):
+            self.redis.delete(self.prefix + "names")
+            self._loadRows()
+        elif self.redis is None:
+            self._loadRows()
+        with self._lock:
+            self.loaded = True
+
+    def _loadRows(self):
+        """
+        @brief Streams the usernames from the users table into the index.
+        """
+        batch = []
+        for username in User.objects.values_list("username", flat=True).iterator(chunk_size=10000):
+            batch.append(username)
+            if len(batch) >= 10000:
+                self._add(batch)
+                batch = []
+        self._add(batch)
+
+    def add(self, username):
+        """
+        @brief Marks a username as taken.
+        @param username The username.
+        """
+        self._add([username])
+
+    def discard(self, username):
+        """
+        @brief Marks a username as available again.
+        @param username The username.
+        """
+        if self.redis is not None:
+            self.redis.srem(self.prefix + "names", username)
+            return
+        with self._lock:
+            self._names.discard(username)
+
+    def isTaken(self, username):
+        """
+        @brief Tells whether a username is taken.
+        @details Taken names, and every name in Redis mode, are answered without a query;
+                 in process, a name missing from the index costs one query.
+        @param username The username to check.
+        @return bool True if a user has this username.
+        """
+        self.load()
+        if self.redis is not None:
+            taken = bool(self.redis.sismember(self.prefix + "names", username))
+        else:
+            with self._lock:
+                taken = username in self._names
+            if not taken:
+                taken = User.objects.filter(username=username).exists()
+                with self._lock:
+                    self.confirmed += 1
+                    if taken:
+                        self._names.add(username)
+
+        with self._lock:
+            self.checks += 1
+            self.taken += taken
+        return taken
+
+    def clear(self):
+        """
+        @brief Empties the local index and resets the counters; the next lookup reloads it.
+        """
+        with self._lock:
+            self.loaded = False
+            self._names = set()
+            self.checks = self.taken = self.confirmed = 0
+
+    def stats(self):
+        """
+        @brief Returns the index counters.
+        @return dict Indexed names, lookups, taken names and lookups confirmed by a query.
+        """
+        with self._lock:
+            return {
+                "loaded": self.loaded,
+                "shared": self.redis is not None,
+                "names": None if self.redis is not None else len(self._names),
+                "checks": self.checks,
+                "taken": self.taken,
+                "confirmed": self.confirmed,
+            }
+
+
+username_index = UsernameIndex.from_settings()
+""" @brief The process-wide username index. """
+
+metrics.register("username_index", username_index.stats)
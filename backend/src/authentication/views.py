@@ -13,24 +13,36 @@ from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from .serializers import userSerializer
-from rest_framework_simplejwt.tokens import RefreshToken
+from .tokens import VersionedRefreshToken
 from django.contrib.auth import get_user_model
 from django.contrib.auth import authenticate, logout
+from .hashing import HashingOverloaded, hashing_pool
+from .usernameindex import username_index
 from rest_framework.permissions import IsAuthenticated
 
 User = get_user_model()
 
+def overloaded():
+    """
+    @brief Builds the response for a request refused by the password hashing pool.
+
+    @return Response A 503 response asking the client to retry shortly.
+    """
+    return Response({
+        'detail': 'Too many sign-ins at the moment, please retry shortly'
+    }, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '1'})
+
 def getUserToken(user):
     """
     @brief Generates JWT tokens for the given user.
 
-    This function creates and returns refresh and access tokens using the `RefreshToken`
-    class from the `rest_framework_simplejwt` package.
+    This function creates and returns refresh and access tokens using the `VersionedRefreshToken`
+    class, which carries the user's identity claims and token version.
 
     @param user The user object for whom tokens are generated.
     @return A dictionary containing 'refresh' and 'access' tokens as strings.
     """
-    refresh = RefreshToken.for_user(user)
+    refresh = VersionedRefreshToken.for_user(user)
 
     return {
         'refresh': str(refresh),
@@ -62,7 +74,8 @@ class UserAvailability(APIView):
     """
     @brief API view to check the availability of a username.
 
-    This view handles POST requests to determine if a given username is available in the database.
+    This view handles POST requests to determine if a given username is available. The answer comes
+    from the username index; only a free name checked without a shared index costs a query.
     """
 
     def post(self, request):
@@ -73,10 +86,9 @@ class UserAvailability(APIView):
         @return Response A Response object indicating whether the username is available.
         """
         data = request.data
-        user = User.objects.filter(username=data['username']).first()
         
         return Response({
-            'user_available': user is None
+            'user_available': not username_index.isTaken(data['username'])
         }, status=status.HTTP_200_OK)
 
 class SignUpUser(APIView):
@@ -84,7 +96,8 @@ class SignUpUser(APIView):
     @brief API view to handle user registration.
 
     This view handles POST requests for creating a new user. It validates the input data using
-    a serializer, creates a user, and generates JWT tokens.
+    a serializer, creates a user, and generates JWT tokens. The password is hashed on the
+    password hashing pool; when its queue is full the request is refused with 503.
     """
 
     def post(self, request):
@@ -103,9 +116,13 @@ class SignUpUser(APIView):
                 'message': "Something went wrong"
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        user = serializer.save()
+        try:
+            password_hash = hashing_pool.makePassword(serializer.validated_data['password'])
+        except HashingOverloaded:
+            return overloaded()
+        user = serializer.save(password_hash=password_hash)
 
-        refresh = RefreshToken.for_user(user)
+        refresh = VersionedRefreshToken.for_user(user)
         return Response({
             'payload': serializer.data,
             'refresh': str(refresh),
@@ -118,7 +135,9 @@ class LoginUser(APIView):
     @brief API view to handle user login.
 
     This view processes POST requests for user authentication. It validates the credentials, generates
-    JWT tokens upon successful login, and returns them in the response.
+    JWT tokens upon successful login, and returns them in the response. Credentials go through
+    `authenticate()`, whose PooledModelBackend verifies the password on the password hashing pool;
+    when its queue is full the request is refused with 503.
     """
 
     def post(self, request):
@@ -131,7 +150,10 @@ class LoginUser(APIView):
         data = request.data
         username = data.get('username', None)
         password = data.get('password', None)
-        user = authenticate(username=username, password=password)
+        try:
+            user = authenticate(request, username=username, password=password)
+        except HashingOverloaded:
+            return overloaded()
         if user is None:
             return Response({"detail": "No active account found with the given credentials"},
                             status=status.HTTP_401_UNAUTHORIZED)
@@ -148,7 +170,7 @@ class LoginUser(APIView):
         #     samesite=settings.SIMPLE_JWT["AUTH_COOKIE_SAMESITE"]
         # )
         # csrf.get_token(request)
-        serializer = userSerializer(User.objects.get(username=user))
+        serializer = userSerializer(user)
         response.data = {
             'message': 'Login successful',
             'refresh': tokens["refresh"],
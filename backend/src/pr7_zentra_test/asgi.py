@@ -18,6 +18,8 @@ django_asgi_app = get_asgi_application()
 
 
 import socketio
-from app.sockets import sio
+from app.sockets import sio, startup, shutdown
 
-application = socketio.ASGIApp(sio, django_asgi_app)
+application = socketio.ASGIApp(
+    sio, django_asgi_app, on_startup=startup, on_shutdown=shutdown
+)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from datetime import timedelta
 from pathlib import Path
 
@@ -111,9 +112,20 @@ AUTH_PASSWORD_VALIDATORS = [
 CORS_ORIGIN_ALLOW_ALL = True
 
 REST_FRAMEWORK = {
+    # Trusts the signed token claims instead of loading the user on every request.
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
-    )
+        'authentication.authentication.StatelessJWTAuthentication',
+    ),
+    # JSON is encoded and decoded with orjson when installed (see app/jsoncodec.py).
+    'DEFAULT_RENDERER_CLASSES': (
+        'app.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'app.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 }
 
 SIMPLE_JWT = {
@@ -165,6 +177,137 @@ SIMPLE_JWT = {
 }
 
 
+# Write-behind persistence of chat messages sent over Socket.IO.
+# When enabled, `message:send` emits immediately with a pre-assigned id and the
+# rows are inserted in batches. Every server process needs its own WORKER_ID (0-127),
+# read from the CHAT_WORKER_ID environment variable; enabling it without one fails at startup.
+CHAT_WRITE_BEHIND = {
+    'ENABLED': False,
+    'BATCH_SIZE': 200,              # Max rows per bulk_create.
+    'FLUSH_INTERVAL': 0.05,         # Max seconds a message waits before being written.
+    'MAX_QUEUE': 10000,             # Queue length at which senders wait for a flush.
+    'SPILL_PATH': BASE_DIR / 'chat_write_behind.jsonl',  # Journal for rows unwritten at shutdown.
+    'DEAD_LETTER_PATH': BASE_DIR / 'chat_dead_letters.jsonl',  # Rows the database refused.
+    'WORKER_ID': os.getenv('CHAT_WORKER_ID'),  # This process's message id prefix, 0-127.
+}
+
+
+# In-process LRU cache of chat metadata (pk and participant ids) keyed by short_id.
+# Set REDIS_URL to share entries between server processes.
+CHAT_META_CACHE = {
+    'MAX_SIZE': 10000,              # Max chats kept in each process.
+    'TTL': 300,                     # Seconds an entry is trusted before it is reloaded.
+    'REDIS_URL': None,
+}
+
+
+# Bounded per-chat log of the messages sent over Socket.IO. connect:chat with a last_id
+# replays the missed messages from it. It is shared through the same REDIS_URL as the
+# Socket.IO manager; without one, every replay reads the database.
+MESSAGE_STREAM = {
+    'ENABLED': True,
+    'MAX_LEN': 200,                 # Messages retained per chat.
+    'MAX_CHATS': 10000,             # Max chats kept in each process without Redis.
+    'REPLAY_LIMIT': 200,            # Max messages sent by one replay.
+    'TTL': 86400,                   # Seconds a chat's Redis stream outlives its last message.
+    'REDIS_URL': os.getenv('REDIS_URL'),
+}
+
+
+# Newest messages of recently active chats, serving the first page of the messages
+# endpoint without SQL. A process only sees the messages sent through it and there is no
+# shared invalidation, so only enable it when a single process serves the sockets.
+RECENT_MESSAGES = {
+    'ENABLED': False,
+    'SIZE': 50,                     # Newest messages kept per chat; larger first pages skip the cache.
+    'MAX_BYTES': 64 * 1024 * 1024,  # Max encoded size of the cached messages in each process.
+    'IDLE': 600,                    # Seconds without reads or new messages before a chat is dropped.
+    'TTL': 300,                     # Seconds a chat's messages are trusted after they were read.
+}
+
+
+# Read positions reported with message:read, written in batches.
+READ_POSITIONS = {
+    'ENABLED': True,
+    'INTERVAL': 1.0,                # Seconds between writes of the reported positions.
+}
+
+
+# Online presence of Socket.IO users. Each process renews its connections every TTL / 3
+# seconds; connections of a crashed process expire. It is shared through the same
+# REDIS_URL as the Socket.IO manager; without one, each process only knows the users
+# connected to it, so only run a single process then.
+PRESENCE = {
+    'ENABLED': True,
+    'TTL': 60,                      # Seconds a connection stays online without a renewal.
+    'TICK': 1.0,                    # Seconds between batches of heartbeats and presence updates.
+    'REDIS_URL': os.getenv('REDIS_URL'),
+}
+
+
+# Typing indicators. Each connection's typing:start/typing:stop events reach the chat
+# room as at most one typing:update per INTERVAL seconds.
+TYPING_INDICATORS = {
+    'ENABLED': True,
+    'INTERVAL': 1.0,                # Min seconds between forwarded changes per connection and chat.
+    'EXPIRY': 5.0,                  # Seconds after the last typing:start at which typing stops.
+}
+
+
+# Caches. Uncomment "shared" and set PROFILE_CACHE['SHARED'] to 'shared' to share
+# serialized user profiles between server processes.
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # 'shared': {
+    #     'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+    #     'LOCATION': 'redis://127.0.0.1:6379/1',
+    #     'TIMEOUT': 3600,
+    # },
+}
+
+
+# Cache of serialized user profiles, keyed by user id and profile_version.
+# SHARED names an entry of CACHES used as a second tier behind the in-process LRU.
+PROFILE_CACHE = {
+    'ENABLED': True,
+    'MAX_SIZE': 50000,              # Max profiles kept in each process.
+    'SHARED': None,
+}
+
+
+# Cache of each user's current token version, checked by StatelessJWTAuthentication.
+# Revoked tokens keep working for at most TTL seconds in other server processes.
+TOKEN_VERSION_CACHE = {
+    'CACHE': 'default',
+    'TTL': 30,
+}
+
+
+# Worker pool that login and signup hash and verify passwords on. Requests beyond
+# WORKERS running plus MAX_QUEUE waiting are refused with 503.
+PASSWORD_HASHING_POOL = {
+    'WORKERS': 2,
+    'MAX_QUEUE': 32,
+    'TIMEOUT': 10,                  # Seconds a request waits for its hash.
+}
+
+
+# In-memory index of taken usernames behind the signup form's availability check.
+# It is shared between workers through REDIS_URL; without one, each worker confirms the
+# usernames it reports free with a query.
+USERNAME_INDEX = {
+    'REDIS_URL': os.getenv('REDIS_URL'),
+}
+
+
+# Views decorated with app.querybudget.query_budget log a warning when they run more
+# queries than their budget. Set to True to raise QueryBudgetExceeded instead.
+QUERY_BUDGET_RAISE = False
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
 
@@ -196,4 +339,8 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 APPEND_SLASH = False
 
-AUTH_USER_MODEL = 'authentication.CustomUser'
\ No newline at end of file
+AUTH_USER_MODEL = 'authentication.CustomUser'
+
+AUTHENTICATION_BACKENDS = [
+    'authentication.backends.PooledModelBackend',   # ModelBackend hashing on PASSWORD_HASHING_POOL.
+]
@@ -19,10 +19,16 @@ import { io, Socket } from "socket.io-client";
  * @type {Socket}
  * @default
  * @description The main socket instance used for communication with the server.
- *              This socket is configured to connect to the server.
+ *              This socket is configured to connect to the server and authenticates
+ *              with the access token stored at login, read again on every (re)connect.
+ *              It connects on demand, once a user is logged in.
  */
 const mainSocket: Socket = io(
     import.meta.env.VITE_BACKEND_URL ?? "http://127.0.0.1:8000",
+    {
+        autoConnect: false,
+        auth: (cb) => cb({ token: sessionStorage.getItem("access_token") }),
+    },
 );
 
 export default mainSocket;